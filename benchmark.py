@@ -0,0 +1,310 @@
+# benchmark.py – нагрузочный прогон диспетчера бота без сети
+#
+# Синтетические апдейты подаются прямо в dp.feed_update через фейковую
+# сессию Bot; база – временный файл SQLite. Результат – JSON с пропускной
+# способностью и перцентилями задержки по хендлерам, чтобы сравнивать коммиты:
+#
+#   python benchmark.py --users 2000 --flow both --output bench.json
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.methods import EditMessageText, SendMessage
+from aiogram.types import CallbackQuery, Chat, InlineKeyboardMarkup, Message, Update, User
+
+from metrics import Metrics
+
+# Шаги ручного режима: префикс callback_data кнопки -> хендлер
+MANUAL_STEPS = (
+    ("cpu_", "manual_choose_cpu"),
+    ("mobo_", "manual_choose_mobo"),
+    ("ram_", "manual_choose_ram"),
+    ("gpu_", "manual_choose_gpu"),
+    ("sto_", "manual_choose_storage"),
+    ("case_", "manual_choose_case"),
+    ("psu_", "manual_choose_psu"),
+    ("col_", "manual_choose_cooler"),
+)
+USAGES = ("Игры", "Работа", "Рендеринг", "Другое")
+BOT_USER = User(id=1, is_bot=True, first_name="bench_bot")
+
+
+class FakeSession(BaseSession):
+    """Сессия Bot без сети: отвечает на методы API заглушками.
+
+    Запоминает последнюю inline-клавиатуру в каждом чате, чтобы
+    симулируемый пользователь мог «нажать» реально показанную кнопку.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.keyboards = {}
+        self.requests = 0
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests += 1
+        chat_id = getattr(method, "chat_id", None)
+        markup = getattr(method, "reply_markup", None)
+        if chat_id is not None and isinstance(markup, InlineKeyboardMarkup):
+            self.keyboards[chat_id] = markup
+        if isinstance(method, (SendMessage, EditMessageText)):
+            return bot_message(chat_id, method.text, next(self._message_ids)).as_(bot)
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+    def buttons(self, chat_id, prefix: str) -> list:
+        markup = self.keyboards.get(chat_id)
+        if not markup:
+            return []
+        return [b.callback_data for row in markup.inline_keyboard for b in row
+                if b.callback_data and b.callback_data.startswith(prefix)]
+
+
+def bot_message(chat_id: int, text: str, message_id: int = 0) -> Message:
+    return Message(message_id=message_id, date=datetime.now(), chat=Chat(id=chat_id, type="private"),
+                   from_user=BOT_USER, text=text)
+
+
+class Runner:
+    """Прогон пользователей по сценариям с замером задержки каждого апдейта."""
+
+    def __init__(self, dp, bot, session: FakeSession, seed: int = 1):
+        self.dp = dp
+        self.bot = bot
+        self.session = session
+        self.random = random.Random(seed)
+        self.update_ids = itertools.count(1)
+        self.latencies = {}   # хендлер -> список задержек, с
+        self.errors = {}      # хендлер -> число исключений
+        self.unhandled = {}   # хендлер -> апдейт не дошёл ни до одного хендлера
+        self.aborted = 0      # сценарии, прерванные из-за отсутствия кнопки
+
+    async def feed(self, handler: str, update: Update):
+        start = time.perf_counter()
+        try:
+            result = await self.dp.feed_update(self.bot, update)
+        except Exception:
+            self.errors[handler] = self.errors.get(handler, 0) + 1
+            return
+        finally:
+            self.latencies.setdefault(handler, []).append(time.perf_counter() - start)
+        if result is UNHANDLED:
+            self.unhandled[handler] = self.unhandled.get(handler, 0) + 1
+
+    async def send_text(self, handler: str, user: User, text: str):
+        message = Message(message_id=next(self.update_ids), date=datetime.now(),
+                          chat=Chat(id=user.id, type="private"), from_user=user, text=text)
+        await self.feed(handler, Update(update_id=next(self.update_ids), message=message))
+
+    async def click(self, handler: str, user: User, data: str):
+        query = CallbackQuery(id=str(next(self.update_ids)), from_user=user, chat_instance="bench",
+                              message=bot_message(user.id, "menu"), data=data)
+        await self.feed(handler, Update(update_id=next(self.update_ids), callback_query=query))
+
+    async def auto_flow(self, user: User, budget_range: tuple):
+        await self.click("on_menu_click", user, "auto")
+        await self.click("on_choose_usage", user, f"usage_{self.random.choice(USAGES)}")
+        await self.send_text("on_enter_budget", user, str(self.random.randint(*budget_range)))
+        options = self.session.buttons(user.id, "alt_")
+        if len(options) > 1:
+            # Переключиться на один из альтернативных вариантов перед сохранением
+            await self.click("on_switch_alternative", user, self.random.choice(options[1:]))
+        await self.click("on_save_build", user, "save_build")
+
+    async def manual_flow(self, user: User):
+        await self.click("on_menu_click", user, "manual")
+        for prefix, handler in MANUAL_STEPS:
+            choices = self.session.buttons(user.id, prefix)
+            if not choices:
+                if prefix != "col_":
+                    self.aborted += 1
+                    return
+                choices = ["col_none"]  # кулеров под сокет нет – собираем без него
+            await self.click(handler, user, self.random.choice(choices))
+        await self.click("manual_save_build", user, "manual_save")
+
+    async def user_session(self, n: int, flow: str, budget_range: tuple):
+        user = User(id=10_000_000 + n, is_bot=False, first_name=f"user{n}", username=f"user{n}")
+        await self.send_text("on_start", user, "/start")
+        if flow == "auto" or (flow == "both" and n % 2 == 0):
+            await self.auto_flow(user, budget_range)
+        else:
+            await self.manual_flow(user)
+
+
+def percentiles(samples: list) -> dict:
+    ms = sorted(s * 1000 for s in samples)
+    if len(ms) > 1:
+        q = statistics.quantiles(ms, n=100, method="inclusive")
+        p50, p95, p99 = q[49], q[94], q[98]
+    else:
+        p50 = p95 = p99 = ms[0]
+    return {"count": len(ms), "mean_ms": round(statistics.fmean(ms), 3), "p50_ms": round(p50, 3),
+            "p95_ms": round(p95, 3), "p99_ms": round(p99, 3), "max_ms": round(ms[-1], 3)}
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def seed_synthetic_catalog(db, size: int, seed: int):
+    """Заменить демо-каталог случайным каталогом по size строк в категории."""
+    rnd = random.Random(seed)
+    sockets = {'AM4': 'DDR4', 'AM5': 'DDR5', 'LGA1200': 'DDR4', 'LGA1700': 'DDR5'}
+    form_factors = ('Mini-ITX', 'mATX', 'ATX')
+    rows = {
+        'cpus': [(f"CPU {i}", s, rnd.choice((4, 6, 8, 12, 16)), rnd.choice((35, 65, 95, 125, 170)),
+                  rnd.randint(4000, 80000)) for i, s in enumerate(rnd.choices(list(sockets), k=size))],
+        'motherboards': [(f"Board {i}", s, rnd.choice(form_factors), sockets[s], 128, rnd.randint(4000, 40000))
+                         for i, s in enumerate(rnd.choices(list(sockets), k=size))],
+        'rams': [(f"RAM {i}", rnd.choice(('DDR4', 'DDR5')), rnd.choice((8, 16, 32)), 3200, rnd.randint(1500, 30000))
+                 for i in range(size)],
+        'gpus': [(f"GPU {i}", "bench", rnd.choice((4, 8, 12, 16)), rnd.randint(150, 340), rnd.randint(50, 450),
+                  rnd.randint(6000, 200000)) for i in range(size)],
+        'storages': [(f"SSD {i}", "SSD", rnd.choice((256, 512, 1000, 2000)), rnd.randint(2000, 30000))
+                     for i in range(size)],
+        'psus': [(f"PSU {i}", rnd.randrange(300, 1300, 50), False, rnd.randint(2000, 25000)) for i in range(size)],
+        'cases': [(f"Case {i}", rnd.choice(form_factors), rnd.randint(200, 400), "ATX", rnd.randint(1500, 20000))
+                  for i in range(size)],
+        'coolers': [(f"Cooler {i}", rnd.choice(list(sockets)), rnd.choice((95, 130, 180, 250)),
+                     rnd.randint(800, 15000)) for i in range(size)],
+    }
+    columns = {
+        'cpus': "name, socket, cores, tdp, price",
+        'motherboards': "name, socket, form_factor, ram_type, max_ram, price",
+        'rams': "name, type, size, speed, price",
+        'gpus': "name, chipset, vram, length, tdp, price",
+        'storages': "name, type, capacity, price",
+        'psus': "name, power, modular, price",
+        'cases': "name, form_factor, gpu_max_length, psu_form_factor, price",
+        'coolers': "name, socket, tdp_capacity, price",
+    }
+    for table, values in rows.items():
+        await db.conn.execute(f"DELETE FROM {table}")
+        marks = ", ".join("?" * len(values[0]))
+        await db.conn.executemany(f"INSERT INTO {table} ({columns[table]}) VALUES ({marks})", values)
+    await db.conn.execute("UPDATE catalog_meta SET value = value + 1 WHERE key = 'version'")
+    await db.conn.commit()
+    await db.catalog.load(db)
+
+
+async def run(args) -> dict:
+    # config читает окружение при импорте: подставляем временную БД заранее
+    workdir = Path(tempfile.mkdtemp(prefix="pcbot-bench-"))
+    os.environ["DATABASE_URL"] = (workdir / "bench.db").as_posix()
+    os.environ["BUILD_SOURCE"] = args.build_source
+    os.environ["SEARCH_WORKERS"] = str(args.search_workers)
+    os.environ["CATALOG_SNAPSHOT_PATH"] = (workdir / "catalog.snapshot").as_posix()
+    import bot as app
+
+    session = FakeSession()
+    app.bot = Bot(token="123456:bench", session=session)
+    if args.metrics:
+        app.metrics = Metrics()
+        app.metrics.install(app.dp, app.bot, app.db)
+        app.throttling.metrics = app.metrics
+    await app.db.connect(seed_demo=True)
+    if args.catalog_size:
+        await seed_synthetic_catalog(app.db, args.catalog_size, args.seed)
+    if not args.direct_log:
+        app.db.start_log_sink(batch_size=app.LOG_BATCH_SIZE, flush_interval_ms=app.LOG_FLUSH_MS,
+                              max_queue=app.LOG_QUEUE_SIZE, overflow=app.LOG_OVERFLOW)
+    if args.build_source == "table":
+        await app.breakpoint_index.rebuild(app.db)
+    if app.search_pool:
+        await app.search_pool.update(app.db.catalog.snapshot)
+
+    runner = Runner(app.dp, app.bot, session, args.seed)
+    limit = asyncio.Semaphore(args.concurrency or args.users)
+
+    async def one(n):
+        async with limit:
+            await runner.user_session(n, args.flow, (args.budget_min, args.budget_max))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(args.users)))
+    elapsed = time.perf_counter() - start
+    log_stats = app.db.log_sink.stats() if app.db.log_sink else None
+    full_scans = await app.db.check_query_plans()
+    if app.search_pool:
+        app.search_pool.close()
+    await app.db.close()
+    if args.metrics:
+        app.metrics.dump(args.metrics)
+
+    updates = sum(len(v) for v in runner.latencies.values())
+    return {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "params": vars(args),
+        "catalog_version": app.db.catalog.snapshot.version,
+        "catalog_file": app.db.catalog.snapshot.path is not None,
+        "users": args.users,
+        "updates": updates,
+        "api_requests": session.requests,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_ups": round(updates / elapsed, 1) if elapsed else None,
+        "aborted_flows": runner.aborted,
+        "errors": runner.errors,
+        "unhandled": runner.unhandled,
+        "user_cache": app.db.user_cache.stats(),
+        "known_builds": app.db.known_builds.stats(),
+        "full_scans": full_scans,
+        "log_sink": log_stats,
+        "throttling": app.throttling.stats(),
+        "search_pool": app.search_pool.stats() if app.search_pool else None,
+        "handlers": {name: percentiles(samples) for name, samples in sorted(runner.latencies.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark for the bot dispatcher (no network).")
+    parser.add_argument("--users", type=int, default=1000, help="simulated users")
+    parser.add_argument("--concurrency", type=int, default=0, help="max users in flight (0 = all)")
+    parser.add_argument("--flow", choices=("auto", "manual", "both"), default="both")
+    parser.add_argument("--budget-min", type=int, default=40000)
+    parser.add_argument("--budget-max", type=int, default=250000)
+    parser.add_argument("--catalog-size", type=int, default=0, help="synthetic rows per category (0 = demo catalog)")
+    parser.add_argument("--build-source", choices=("live", "table"), default="live")
+    parser.add_argument("--search-workers", type=int, default=0, help="optimizer processes (0 = in the bot process)")
+    parser.add_argument("--direct-log", action="store_true", help="write log_action directly, without the sink")
+    parser.add_argument("--metrics", help="also collect bot metrics and dump them to this file")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+        print(f"{results['updates']} updates in {results['elapsed_s']}s "
+              f"({results['throughput_ups']}/s), results written to {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,78 @@
 # bot.py – основной модуль бота
 import asyncio
 from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.filters.state import StateFilter
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 
 # Импортируем наши модули
-from config import API_TOKEN, DB_DSN
-from db import Database
+from config import (API_TOKEN, DB_DSN, CATALOG_REFRESH_SECONDS, BUILD_SOURCE,
+                    LOG_BATCH_SIZE, LOG_FLUSH_MS, LOG_QUEUE_SIZE, LOG_OVERFLOW,
+                    SQLITE_READERS, SQLITE_CACHE_KB, SQLITE_MMAP_MB, PG_POOL_MIN, PG_POOL_MAX,
+                    USER_CACHE_SIZE, USER_CACHE_TTL, BUILDS_PAGE_SIZE,
+                    METRICS_HOST, METRICS_PORT, METRICS_DUMP_PATH, METRICS_DUMP_SECONDS,
+                    FSM_TTL_SECONDS, FSM_CACHE_SIZE, KEYBOARD_CACHE_SIZE, BUILD_ALTERNATIVES,
+                    BUILD_CACHE_SIZE, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET,
+                    WEBHOOK_CONCURRENCY, WEBHOOK_MAX_PENDING, THROTTLE_RATE, THROTTLE_BURST,
+                    THROTTLE_EXPENSIVE_COST, HEAVY_CONCURRENCY, HEAVY_WAIT_SECONDS,
+                    SEARCH_WORKERS, SEARCH_TIMEOUT_MS, SEARCH_FALLBACK_MS, BUILD_SUMMARY_CACHE_SIZE,
+                    LOG_ROLLUP_SECONDS, LOG_RETENTION_DAYS, CATALOG_SNAPSHOT_PATH, SEED_DEMO_CATALOG)
+from db import open_database
+from lru import LRUCache
+from fsm_storage import DatabaseStorage
 from states import BuildAutoState, BuildManualState
-from builder import build_pc
+from builder import COMPONENT_KINDS, required_power, search_index
+from build_cache import BuildCache
+from compat import compatibility
+from keyboards import (MAIN_MENU, USAGE_MENU, AUTO_BUILD_ACTIONS, MANUAL_CONFIRM, BACK_TO_MENU,
+                       KeyboardFactory, alternatives_menu)
+from breakpoints import BreakpointIndex
+from search_pool import SearchPool
+from metrics import Metrics, timer
+from rollups import roll_up_periodically
+from throttling import ThrottlingMiddleware
+from webhook import run_webhook
 
 # Инициализация бота и диспетчера
 bot = Bot(token=API_TOKEN)
-dp = Dispatcher()  # Aiogram v3: можно явно не передавать loop, он берется из asyncio
 
 # Инициализация БД (globally, then connect in startup)
-db = Database(DB_DSN)
+# Бэкенд выбирается по схеме DB_DSN: PostgreSQL или файл SQLite
+db = open_database(DB_DSN, readers=SQLITE_READERS, cache_size_kb=SQLITE_CACHE_KB, mmap_size_mb=SQLITE_MMAP_MB,
+                   pg_min_size=PG_POOL_MIN, pg_max_size=PG_POOL_MAX,
+                   user_cache_size=USER_CACHE_SIZE, user_cache_ttl=USER_CACHE_TTL, catalog_path=CATALOG_SNAPSHOT_PATH)
+# Состояния FSM хранятся в той же БД: переживают перезапуск, простаивающие удаляются
+fsm_storage = DatabaseStorage(db, ttl=FSM_TTL_SECONDS, cache_size=FSM_CACHE_SIZE)
+dp = Dispatcher(storage=fsm_storage)  # Aiogram v3: можно явно не передавать loop, он берется из asyncio
+# Клавиатуры выбора компонентов, общие для всех пользователей
+keyboards = KeyboardFactory(db.catalog, cache_size=KEYBOARD_CACHE_SIZE)
+# Предрасчитанные сборки по бюджету (используются при BUILD_SOURCE = "table")
+breakpoint_index = BreakpointIndex()
+# Готовые автосборки по (цель, бюджет); при смене цен пересчитываются только задетые
+build_cache = BuildCache(BUILD_CACHE_SIZE)
+# Описания сохранённых сборок по (хэш сборки, версия каталога): одинаковые у разных пользователей
+build_summaries = LRUCache(BUILD_SUMMARY_CACHE_SIZE)
+# Промахи кэша считаются в пуле процессов, чтобы поиск не останавливал цикл событий
+search_pool = SearchPool(SEARCH_WORKERS, SEARCH_TIMEOUT_MS / 1000, SEARCH_FALLBACK_MS / 1000) if SEARCH_WORKERS else None
+# Метрики включаются только если есть куда их отдавать
+metrics = Metrics() if METRICS_PORT or METRICS_DUMP_PATH else None
+# Лимит частоты на пользователя и общий лимит тяжёлых хендлеров (подбор сборки, ручная сборка)
+throttling = ThrottlingMiddleware(THROTTLE_RATE, THROTTLE_BURST, THROTTLE_EXPENSIVE_COST,
+                                  HEAVY_CONCURRENCY, HEAVY_WAIT_SECONDS, metrics=metrics)
+dp.message.middleware(throttling)
+dp.callback_query.middleware(throttling)
 
 # Хендлер на команду /start
 @dp.message(Command("start"))
 async def on_start(message: Message):
-    # Сохранить пользователя в БД (асинхронно)
+    # Сохранить пользователя в БД; его id сразу попадает в кэш
     await db.add_user(message.from_user.id, message.from_user.username or message.from_user.full_name)
     # Приветственное сообщение
     welcome_text = (f"Привет, {message.from_user.first_name}! 👋\n"
                     "Я бот, который поможет подобрать оптимальную сборку ПК по твоим требованиям.\n"
                     "Выбери, что ты хочешь сделать:")
-    # Кнопки главного меню
-    menu_kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔍 Подобрать сборку", callback_data="auto")],
-        [InlineKeyboardButton(text="🛠 Ручной режим сборки", callback_data="manual")],
-        [InlineKeyboardButton(text="💾 Мои сохранённые сборки", callback_data="view_builds")],
-        [InlineKeyboardButton(text="ℹ️ Помощь", callback_data="help")],
-    ])
-    await message.answer(welcome_text, reply_markup=menu_kb)
+    await message.answer(welcome_text, reply_markup=MAIN_MENU)
 
 # Хендлер на нажатие кнопок главного меню (CallbackQuery)
 @dp.callback_query(lambda c: c.data in ["auto", "manual", "view_builds", "help"])
@@ -45,41 +82,23 @@ async def on_menu_click(callback: CallbackQuery, state: FSMContext):
     if action == "auto":
         # Начать диалог автоматического подбора
         await callback.message.answer("🚀 Автоматический подбор сборки запущен.\nВыберите цель использования ПК:", 
-                                      reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                                          [InlineKeyboardButton(text="🎮 Игры", callback_data="usage_Игры")],
-                                          [InlineKeyboardButton(text="💼 Работа/Офис", callback_data="usage_Работа")],
-                                          [InlineKeyboardButton(text="🖥️ Рендеринг/3D", callback_data="usage_Рендеринг")],
-                                          [InlineKeyboardButton(text="Другое", callback_data="usage_Другое")]
-                                      ]))
+                                      reply_markup=USAGE_MENU)
         await state.set_state(BuildAutoState.usage)
         await db.log_action(user_id, "start_auto_build")
     elif action == "manual":
         # Начать диалог ручной сборки
         await callback.message.answer("🔧 Ручной режим: давайте соберём ПК по компонентам.\nСначала выберите процессор:")
-        # Сформировать кнопки CPU (например, несколько топовых CPU из базы)
-        cpu_list = await db.select_cpus(usage=None, max_price=None)
-        # Ограничимся 5 вариантами для примера
-        cpu_buttons = []
-        for cpu in cpu_list[:5]:
-            cpu_buttons.append([InlineKeyboardButton(text=f"{cpu['name']} ({cpu['price']} ₽)", callback_data=f"cpu_{cpu['id']}")])
-        if not cpu_buttons:
-            cpu_buttons.append([InlineKeyboardButton(text="Нет данных по CPU", callback_data="ignore")])
-        cpu_kb = InlineKeyboardMarkup(inline_keyboard=cpu_buttons)
-        await callback.message.answer("Процессоры:", reply_markup=cpu_kb)
+        # Кнопки CPU (страницами по 5, из кэша клавиатур)
+        await callback.message.answer("Процессоры:", reply_markup=await manual_keyboard('cpu', {}))
+        # Кнопка «Собрать заново» ведёт сюда же: прежний выбор сбрасывается
+        await state.set_data({})
         await state.set_state(BuildManualState.choosing_cpu)
         await db.log_action(user_id, "start_manual_build")
+        await callback.answer()
     elif action == "view_builds":
-        # Отобразить сохранённые сборки пользователя
-        builds = await db.get_builds(user_id)
-        if not builds:
-            await callback.message.answer("У вас нет сохранённых сборок.")
-        else:
-            text = "💾 *Ваши сохранённые сборки:*\n"
-            for rec in builds:
-                price = rec.get('total_price') or 0
-                text += f"- Сборка #{rec['id']} от {rec['created_at']}, сумма {price} ₽\n"
-            text += "\nЧтобы подробнее посмотреть сборку, введите команду `/build <ID>`."
-            await callback.message.answer(text, parse_mode="Markdown")
+        # Отобразить сохранённые сборки пользователя (первая страница)
+        text, kb = await render_builds_page(user_id)
+        await callback.message.answer(text, parse_mode="Markdown", reply_markup=kb)
         await callback.answer()  # просто уберём часики на кнопке
     elif action == "help":
         help_text = ("*Помощь по боту*\n"
@@ -92,6 +111,80 @@ async def on_menu_click(callback: CallbackQuery, state: FSMContext):
         await callback.message.answer(help_text, parse_mode="Markdown")
         await callback.answer()
 
+def build_ids(build):
+    """Компактное представление сборки для FSM: id компонентов и сумма."""
+    if not build:
+        return {}
+    ids = {f"{kind}_id": item['id'] for kind, item in build.items() if isinstance(item, dict)}
+    ids['total_price'] = build.get('total_price')
+    return ids
+
+# Подписи категорий в описании сборки
+COMPONENT_LABELS = {
+    'cpu': "CPU", 'motherboard': "Мат. плата", 'ram': "ОЗУ", 'gpu': "Видеокарта",
+    'storage': "Накопитель", 'psu': "Блок питания", 'case': "Корпус", 'cooler': "Кулер",
+}
+
+async def render_builds_page(user_id, direction="first", cursor=None):
+    """Текст и кнопки листания для страницы сохранённых сборок."""
+    page = await db.get_builds_page(user_id, direction, cursor, limit=BUILDS_PAGE_SIZE)
+    builds = page['builds']
+    if not builds:
+        return "У вас нет сохранённых сборок.", None
+    text = "💾 *Ваши сохранённые сборки:*\n"
+    for rec in builds:
+        price = rec.get('total_price') or 0
+        cpu = rec['components']['cpu']
+        gpu = rec['components']['gpu']
+        parts = ", ".join(c['name'] for c in (cpu, gpu) if c)
+        text += f"- Сборка #{rec['id']} от {rec['created_at']}, сумма {price} ₽" + (f" ({parts})" if parts else "") + "\n"
+    text += "\nЧтобы подробнее посмотреть сборку, введите команду `/build <ID>`."
+    nav = []
+    if page['has_newer']:
+        nav.append(InlineKeyboardButton(text="⬅️ Новее", callback_data=f"builds_newer_{builds[0]['id']}"))
+    if page['has_older']:
+        nav.append(InlineKeyboardButton(text="Старее ➡️", callback_data=f"builds_older_{builds[-1]['id']}"))
+    return text, InlineKeyboardMarkup(inline_keyboard=[nav]) if nav else None
+
+# Листание сохранённых сборок (кнопки под списком)
+@dp.callback_query(lambda c: c.data and c.data.startswith(("builds_older_", "builds_newer_")))
+async def on_builds_page(callback: CallbackQuery):
+    _, direction, cursor = callback.data.split("_")
+    user_id = await db.get_user_id(callback.from_user.id)
+    text, kb = await render_builds_page(user_id, direction, int(cursor))
+    await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=kb)
+    await callback.answer()
+
+def build_summary(rec):
+    """Состав и сумма сохранённой сборки (из кэша по хэшу сборки)."""
+    key = (rec['hash'], db.catalog.snapshot.version)
+    text = build_summaries.get(key)
+    if text is None:
+        text = ""
+        for kind, label in COMPONENT_LABELS.items():
+            comp = rec['components'][kind]
+            text += f"- {label}: {comp['name']} ({comp['price']} ₽)\n" if comp else f"- {label}: (нет)\n"
+        text += f"*Итого:* {rec.get('total_price') or 0} ₽\n"
+        build_summaries.put(key, text)
+    return text
+
+# Подробности сохранённой сборки: /build <ID>
+@dp.message(Command("build"))
+async def on_build_details(message: Message, command: CommandObject):
+    if not command.args or not command.args.strip().isdigit():
+        await message.answer("Укажите номер сборки: `/build <ID>`", parse_mode="Markdown")
+        return
+    user_id = await db.get_user_id(message.from_user.id)
+    rec = await db.get_build(user_id, int(command.args.strip()))
+    if not rec:
+        await message.answer("Сборка не найдена.")
+        return
+    text = f"🔧 *Сборка #{rec['id']}* от {rec['created_at']}:\n" + build_summary(rec)
+    savers = await db.count_build_savers(rec['hash'])
+    if savers > 1:
+        text += f"👥 Такую же сборку сохранили пользователей: {savers}\n"
+    await message.answer(text, parse_mode="Markdown")
+
 # Хендлер выбора цели использования (шаг 1 автоподбора, ловим callback от кнопок "usage_...")
 @dp.callback_query(lambda c: c.data and c.data.startswith("usage_"), StateFilter(BuildAutoState.usage))
 async def on_choose_usage(callback: CallbackQuery, state):
@@ -118,62 +211,110 @@ async def on_enter_budget(message: Message, state):
     usage = data.get("chosen_usage", "не указана")
     # Генерируем сборку
     await message.answer("⌛ Пожалуйста, подождите, идёт подбор оптимальной конфигурации...")
-    build = await build_pc(db, usage, budget)
-    # Сохраняем текущую сборку во временном состоянии
-    await state.update_data(last_build=build)
+    build = None
+    if BUILD_SOURCE == "table":
+        with timer(metrics, "breakpoint_lookup"):
+            build = breakpoint_index.lookup(db.catalog.snapshot, usage, budget)
+    if build is not None:
+        builds = [build] if build.get('cpu') else []
+    else:
+        # Таблица выключена или ещё строится – считаем напрямую (сразу все варианты)
+        with timer(metrics, "build_pc"):
+            # Без пула процессов поиск идёт в потоке: цикл событий обслуживает других
+            builds = await build_cache.fetch(db.catalog.snapshot, usage, budget, BUILD_ALTERNATIVES,
+                                             search_pool, SEARCH_TIMEOUT_MS / 1000)
+    # Сохраняем текущую сборку во временном состоянии (только id);
+    # варианты – списками id в порядке COMPONENT_KINDS, чтобы переключаться без пересчёта
+    await state.update_data(last_build=build_ids(builds[0] if builds else None),
+                            alternatives=[alternative_ids(b) for b in builds] if len(builds) > 1 else None)
     # Формируем текст ответа с итоговой сборкой
-    if not build or not build.get('cpu'):
+    if not builds:
         await message.answer("К сожалению, не удалось подобрать сборку по указанным параметрам. Попробуйте изменить критерии.")
     else:
-        total = build.get('total_price', 0)
-        result_text = f"✅ *Сборка \"{usage}\" за ~{total} ₽:*\n"
-        if build.get('cpu'):
-            result_text += f"- CPU: {build['cpu']['name']} ({build['cpu']['price']} ₽)\n"
-        if build.get('motherboard'):
-            result_text += f"- Мат. плата: {build['motherboard']['name']} ({build['motherboard']['price']} ₽)\n"
-        if build.get('ram'):
-            result_text += f"- ОЗУ: {build['ram']['name']} ({build['ram']['price']} ₽)\n"
-        if build.get('gpu'):
-            result_text += f"- Видеокарта: {build['gpu']['name']} ({build['gpu']['price']} ₽)\n"
-        else:
-            result_text += "- Видеокарта: (не требуется)\n"
-        if build.get('storage'):
-            result_text += f"- Накопитель: {build['storage']['name']} ({build['storage']['price']} ₽)\n"
-        if build.get('psu'):
-            result_text += f"- Блок питания: {build['psu']['name']} ({build['psu']['price']} ₽)\n"
-        if build.get('case'):
-            result_text += f"- Корпус: {build['case']['name']} ({build['case']['price']} ₽)\n"
-        if build.get('cooler'):
-            result_text += f"- Кулер: {build['cooler']['name']} ({build['cooler']['price']} ₽)\n"
-        result_text += f"*Итого:* {total} ₽\n"
-        await message.answer(result_text, parse_mode="Markdown", 
-                              reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                                  [InlineKeyboardButton(text="💾 Сохранить сборку", callback_data="save_build")],
-                                  [InlineKeyboardButton(text="🔄 В меню", callback_data="back_to_menu")]
-                              ]))
+        await message.answer(auto_build_text(usage, builds[0]), parse_mode="Markdown",
+                             reply_markup=auto_build_menu(builds, 0))
     # Логируем действие
     user_id = await db.get_user_id(message.from_user.id)
     await db.log_action(user_id, f"auto_build_done_{usage}")
 
 
+def alternative_ids(build):
+    return [(build.get(kind) or {}).get('id', 0) for kind in COMPONENT_KINDS]
+
+
+def alternative_label(i, build):
+    """Подпись кнопки варианта: номер, платформа и есть ли видеокарта."""
+    return f"{i + 1}. {build['cpu']['socket']}" + (" + GPU" if build.get('gpu') else "")
+
+
+def auto_build_menu(builds, current):
+    if len(builds) < 2:
+        return AUTO_BUILD_ACTIONS
+    return alternatives_menu([alternative_label(i, b) for i, b in enumerate(builds)], current)
+
+
+def auto_build_text(usage, build):
+    total = build.get('total_price', 0)
+    result_text = f"✅ *Сборка \"{usage}\" за ~{total} ₽:*\n"
+    if build.get('cpu'):
+        result_text += f"- CPU: {build['cpu']['name']} ({build['cpu']['price']} ₽)\n"
+    if build.get('motherboard'):
+        result_text += f"- Мат. плата: {build['motherboard']['name']} ({build['motherboard']['price']} ₽)\n"
+    if build.get('ram'):
+        result_text += f"- ОЗУ: {build['ram']['name']} ({build['ram']['price']} ₽)\n"
+    if build.get('gpu'):
+        result_text += f"- Видеокарта: {build['gpu']['name']} ({build['gpu']['price']} ₽)\n"
+    else:
+        result_text += "- Видеокарта: (не требуется)\n"
+    if build.get('storage'):
+        result_text += f"- Накопитель: {build['storage']['name']} ({build['storage']['price']} ₽)\n"
+    if build.get('psu'):
+        result_text += f"- Блок питания: {build['psu']['name']} ({build['psu']['price']} ₽)\n"
+    if build.get('case'):
+        result_text += f"- Корпус: {build['case']['name']} ({build['case']['price']} ₽)\n"
+    if build.get('cooler'):
+        result_text += f"- Кулер: {build['cooler']['name']} ({build['cooler']['price']} ₽)\n"
+    result_text += f"*Итого:* {total} ₽\n"
+    return result_text
+
+
+# Переключение между вариантами автосборки: то же сообщение, другой вариант
+@dp.callback_query(lambda c: c.data and c.data.startswith("alt_"))
+async def on_switch_alternative(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    alternatives = data.get("alternatives") or []
+    current = int(callback.data[len("alt_"):])
+    if current >= len(alternatives):
+        # Варианты устарели (сессия сброшена или сборка уже сохранена)
+        await callback.answer("Варианты больше недоступны, подберите сборку заново.")
+        return
+    builds = []
+    for ids in alternatives:
+        build = await db.get_build_components(dict(zip(COMPONENT_KINDS, ids)))
+        if not build.get('cpu'):
+            # Компонент пропал из каталога после подбора
+            await callback.answer("Каталог обновился, подберите сборку заново.")
+            return
+        build['total_price'] = sum(item['price'] for item in build.values() if item)
+        builds.append(build)
+    await state.update_data(last_build=build_ids(builds[current]))
+    await callback.message.edit_text(auto_build_text(data.get("chosen_usage", "не указана"), builds[current]),
+                                     parse_mode="Markdown", reply_markup=auto_build_menu(builds, current))
+    await callback.answer()
+
+
 # Хендлер на сохранение сборки после авто-подбора
 @dp.callback_query(lambda c: c.data == "save_build")
 async def on_save_build(callback: CallbackQuery, state: FSMContext):
     user_id = await db.get_user_id(callback.from_user.id)
     data = await state.get_data()
     build = data.get("last_build", {})
-    # Подготовить словарь для сохранения
-    build_data = {
-        'cpu_id': None,
-        'motherboard_id': None,
-        'ram_id': None,
-        'gpu_id': None,
-        'storage_id': None,
-        'case_id': None,
-        'psu_id': None,
-        'cooler_id': None,
-        'total_price': build.get('total_price')
-    }
+    if not build:
+        await callback.answer("Нет сборки для сохранения.")
+        return
+    # В FSM уже лежат id компонентов (см. build_ids)
+    build_data = {f"{kind}_id": build.get(f"{kind}_id") for kind in COMPONENT_LABELS}
+    build_data['total_price'] = build.get('total_price')
     await db.save_build(user_id, build_data)
     await callback.message.answer("💾 Сборка сохранена! Вы можете просмотреть её в разделе 'Мои сохранённые сборки'.")
     await db.log_action(user_id, "build_saved")
@@ -181,49 +322,70 @@ async def on_save_build(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
+# Кнопки-заглушки ("нет подходящих компонентов") ничего не делают, но нажатие нужно подтвердить
+@dp.callback_query(lambda c: c.data == "ignore")
+async def on_ignore(callback: CallbackQuery):
+    await callback.answer()
+
+
 # Хендлер для возврата в главное меню по кнопке "back_to_menu"
 @dp.callback_query(lambda c: c.data == "back_to_menu")
 async def on_back_to_menu(callback: CallbackQuery):
     # Показываем главное меню заново
-    menu_kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔍 Подобрать сборку", callback_data="auto")],
-        [InlineKeyboardButton(text="🛠 Ручной режим сборки", callback_data="manual")],
-        [InlineKeyboardButton(text="💾 Мои сохранённые сборки", callback_data="view_builds")],
-        [InlineKeyboardButton(text="ℹ️ Помощь", callback_data="help")],
-    ])
-    await callback.message.answer("Главное меню:", reply_markup=menu_kb)
+    await callback.message.answer("Главное меню:", reply_markup=MAIN_MENU)
+    await callback.answer()
+
+async def manual_keyboard(kind, data, page=0):
+    """Клавиатура шага ручного режима; data – уже выбранные компоненты."""
+    cpu, mobo, gpu = data.get('cpu'), data.get('motherboard'), data.get('gpu')
+    if kind == 'cpu':
+        key, fetch = None, lambda: db.select_cpus(usage=None, max_price=None)
+    elif kind == 'gpu':
+        # Только видеокарты, к которым найдутся БП (по TDP процессора) и корпус (по форм-фактору платы)
+        key = (cpu.get('tdp'), mobo.get('form_factor'))
+        fetch = lambda: feasible_gpus(cpu, mobo)
+    elif kind == 'storage':
+        key, fetch = None, lambda: db.select_storages(min_capacity=256)
+    elif kind == 'psu':
+        # Мощность БП по CPU+GPU
+        key = required_power(cpu, gpu)
+        fetch = lambda: db.select_psus(key)
+    else:
+        # Плата, ОЗУ, корпус (с учётом длины GPU) и кулер – по матрице совместимости
+        # с уже выбранными деталями; клавиатура общая для всех с теми же ключами
+        key = compatibility(db.catalog.snapshot).filter_key(kind, data)
+        where = (lambda r: (r['size'] or 0) >= 8) if kind == 'ram' else None
+        fetch = lambda: db.select_compatible(kind, data, where)
+    return await keyboards.components(kind, key, page, fetch)
+
+async def feasible_gpus(cpu, mobo):
+    power = search_index(db.catalog.snapshot).power
+    ok = power.feasible_gpus(cpu, mobo)
+    columns = power.gpu_col
+    return [g for g in await db.select_gpus() if g['id'] in columns and ok[columns[g['id']]]]
+
+# Листание списка компонентов в ручном режиме (кнопки ⬅️ / Ещё ➡️)
+@dp.callback_query(lambda c: c.data and c.data.startswith("page_"), StateFilter(BuildManualState))
+async def manual_page(callback: CallbackQuery, state):
+    _, kind, page = callback.data.split("_")
+    data = await db.get_build_components(await state.get_data())
+    await callback.message.edit_reply_markup(reply_markup=await manual_keyboard(kind, data, int(page)))
     await callback.answer()
 
 # Хендлеры для ручного режима (выбор компонентов последовательно)
 @dp.callback_query(lambda c: c.data and c.data.startswith("cpu_"), StateFilter(BuildManualState.choosing_cpu))
 async def manual_choose_cpu(callback: CallbackQuery, state):
     cpu_id = int(callback.data.split("cpu_")[1])
-    # Получаем выбранный CPU из базы
-    cpu = None
-    cpu_list = await db.select_cpus(None)
-    for c in cpu_list:
-        if c['id'] == cpu_id:
-            cpu = c
-            break
+    # Получаем выбранный CPU по id
+    cpu = await db.get_component('cpu', cpu_id)
     if not cpu:
         await callback.answer("Ошибка: выбранный CPU не найден.")
         return
     # Сохраняем выбор CPU
-    await state.update_data(cpu=cpu)
+    await state.update_data(cpu_id=cpu['id'])
     # Предлагаем выбрать материнскую плату под этот CPU
-    mobos = await db.select_motherboards(cpu['socket'])
-    if not mobos:
-        await callback.message.answer("❌ Не найдены материнские платы для сокета " + cpu['socket'])
-        await state.clear()
-        return
-    # Формируем список кнопок для плат (первые 5)
-    mobo_buttons = []
-    for mobo in mobos[:5]:
-        mobo_buttons.append([InlineKeyboardButton(
-            text=f"{mobo['name']} ({mobo['price']} ₽)", 
-            callback_data=f"mobo_{mobo['id']}"
-        )])
-    mobo_kb = InlineKeyboardMarkup(inline_keyboard=mobo_buttons)
+    # Без подходящих плат keyboards.components отдаёт тупиковую клавиатуру (EMPTY_BUTTONS, DEAD_END)
+    mobo_kb = await manual_keyboard('motherboard', {'cpu': cpu})
     await callback.message.answer("Материнские платы, совместимые с выбранным CPU:", reply_markup=mobo_kb)
     await state.set_state(BuildManualState.choosing_motherboard)
     await callback.answer()
@@ -232,26 +394,15 @@ async def manual_choose_cpu(callback: CallbackQuery, state):
 async def manual_choose_mobo(callback: CallbackQuery, state):
     mobo_id = int(callback.data.split("mobo_")[1])
     # Получаем материнскую плату
-    mobos = await db.select_motherboards(socket=None)  # получим все, затем выберем нужную
-    mobo = None
-    for m in mobos:
-        if m['id'] == mobo_id:
-            mobo = m
-            break
+    mobo = await db.get_component('motherboard', mobo_id)
     if not mobo:
         await callback.answer("Ошибка: мат. плата не найдена.")
         return
     # Сохраняем выбор
-    await state.update_data(motherboard=mobo)
+    await state.update_data(motherboard_id=mobo['id'])
     # Предлагаем выбрать ОЗУ (тип зависит от платы)
     ram_type = mobo['ram_type']
-    rams = await db.select_rams(ram_type, needed_size=8)
-    ram_buttons = []
-    for ram in rams[:5]:
-        ram_buttons.append([InlineKeyboardButton(text=f"{ram['name']} ({ram['price']} ₽)", callback_data=f"ram_{ram['id']}")])
-    if not ram_buttons:
-        ram_buttons.append([InlineKeyboardButton(text="Нет модулей ОЗУ совместимого типа", callback_data="ignore")])
-    ram_kb = InlineKeyboardMarkup(inline_keyboard=ram_buttons)
+    ram_kb = await manual_keyboard('ram', {'motherboard': mobo})
     await callback.message.answer(f"ОЗУ (тип {ram_type}):", reply_markup=ram_kb)
     await state.set_state(BuildManualState.choosing_ram)
     await callback.answer()
@@ -260,23 +411,14 @@ async def manual_choose_mobo(callback: CallbackQuery, state):
 async def manual_choose_ram(callback: CallbackQuery, state):
     ram_id = int(callback.data.split("ram_")[1])
     # Получаем RAM
-    data = await state.get_data()
-    ram_list = await db.select_rams(data.get('motherboard')['ram_type'], needed_size=0)
-    ram = next((r for r in ram_list if r['id'] == ram_id), None)
+    ram = await db.get_component('ram', ram_id)
     if not ram:
         await callback.answer("Ошибка: ОЗУ не найдено.")
         return
-    await state.update_data(ram=ram)
+    await state.update_data(ram_id=ram['id'])
     # Предлагаем выбрать видеокарту
-    gpus = await db.select_gpus()
-    gpu_buttons = []
-    if gpus:
-        for gpu in gpus[:5]:
-            gpu_buttons.append([InlineKeyboardButton(text=f"{gpu['name']} ({gpu['price']} ₽)", callback_data=f"gpu_{gpu['id']}")])
-    else:
-        gpu_buttons.append([InlineKeyboardButton(text="Нет данных по GPU", callback_data="ignore")])
-    gpu_kb = InlineKeyboardMarkup(inline_keyboard=gpu_buttons)
-    await callback.message.answer("Видеокарты:", reply_markup=gpu_kb)
+    data = await db.get_build_components(await state.get_data())
+    await callback.message.answer("Видеокарты:", reply_markup=await manual_keyboard('gpu', data))
     await state.set_state(BuildManualState.choosing_gpu)
     await callback.answer()
 
@@ -284,90 +426,59 @@ async def manual_choose_ram(callback: CallbackQuery, state):
 async def manual_choose_gpu(callback: CallbackQuery, state):
     gpu_id = int(callback.data.split("gpu_")[1])
     # Получаем GPU
-    gpu_list = await db.select_gpus()
-    gpu = next((g for g in gpu_list if g['id'] == gpu_id), None)
+    gpu = await db.get_component('gpu', gpu_id)
     if not gpu:
         await callback.answer("Ошибка: GPU не найден.")
         return
-    await state.update_data(gpu=gpu)
+    await state.update_data(gpu_id=gpu['id'])
     # Предлагаем накопитель
-    storages = await db.select_storages(min_capacity=256)
-    storage_buttons = []
-    for st in storages[:5]:
-        storage_buttons.append([InlineKeyboardButton(text=f"{st['name']} ({st['price']} ₽)", callback_data=f"sto_{st['id']}")])
-    storage_kb = InlineKeyboardMarkup(inline_keyboard=storage_buttons)
-    await callback.message.answer("Накопители:", reply_markup=storage_kb)
+    await callback.message.answer("Накопители:", reply_markup=await manual_keyboard('storage', {}))
     await state.set_state(BuildManualState.choosing_storage)
     await callback.answer()
 
 @dp.callback_query(lambda c: c.data and c.data.startswith("sto_"), StateFilter(BuildManualState.choosing_storage))
 async def manual_choose_storage(callback: CallbackQuery, state):
     sto_id = int(callback.data.split("sto_")[1])
-    storage_list = await db.select_storages(min_capacity=0)
-    storage = next((s for s in storage_list if s['id'] == sto_id), None)
+    storage = await db.get_component('storage', sto_id)
     if not storage:
         await callback.answer("Ошибка: накопитель не найден.")
         return
-    await state.update_data(storage=storage)
+    await state.update_data(storage_id=storage['id'])
     # Предлагаем корпус (с учетом форм-фактора и длины видео)
-    data = await state.get_data()
-    mobo = data.get('motherboard')
-    gpu = data.get('gpu')
-    # Формируем корпус без учёта длины GPU (адаптировано под тестовые данные)
-    cases = await db.select_cases(mobo['form_factor'], gpu_length=None)
-    case_buttons = []
-    for case in cases[:5]:
-        case_buttons.append([InlineKeyboardButton(text=f"{case['name']} ({case['price']} ₽)", callback_data=f"case_{case['id']}")])
-    case_kb = InlineKeyboardMarkup(inline_keyboard=case_buttons)
-    await callback.message.answer("Корпуса:", reply_markup=case_kb)
+    # В FSM лежат только id – компоненты берём из каталога
+    data = await db.get_build_components(await state.get_data())
+    await callback.message.answer("Корпуса:", reply_markup=await manual_keyboard('case', data))
     await state.set_state(BuildManualState.choosing_case)
     await callback.answer()
 
 @dp.callback_query(lambda c: c.data and c.data.startswith("case_"), StateFilter(BuildManualState.choosing_case))
 async def manual_choose_case(callback: CallbackQuery, state):
     case_id = int(callback.data.split("case_")[1])
-    case_list = await db.select_cases(form_factor="", gpu_length=None)
-    case = next((c for c in case_list if c['id'] == case_id), None)
+    case = await db.get_component('case', case_id)
     if not case:
         await callback.answer("Ошибка: корпус не найден.")
         return
-    await state.update_data(case=case)
+    await state.update_data(case_id=case['id'])
     # Предлагаем блок питания (мощность расчитываем по CPU+GPU)
-    data = await state.get_data()
-    cpu = data.get('cpu')
-    gpu = data.get('gpu')
-    total_tdp = 0
-    if cpu: total_tdp += cpu.get('tdp') or 0
-    if gpu: total_tdp += gpu.get('tdp') or 0
-    required_power = int(total_tdp * 1.2) + 50
-    psus = await db.select_psus(required_power)
-    psu_buttons = []
-    for psu in psus[:5]:
-        psu_buttons.append([InlineKeyboardButton(text=f"{psu['name']} ({psu['power']}W, {psu['price']} ₽)", callback_data=f"psu_{psu['id']}")])
-    psu_kb = InlineKeyboardMarkup(inline_keyboard=psu_buttons)
-    await callback.message.answer("Блоки питания:", reply_markup=psu_kb)
+    # В FSM лежат только id – компоненты берём из каталога
+    data = await db.get_build_components(await state.get_data())
+    await callback.message.answer("Блоки питания:", reply_markup=await manual_keyboard('psu', data))
     await state.set_state(BuildManualState.choosing_psu)
     await callback.answer()
 
 @dp.callback_query(lambda c: c.data and c.data.startswith("psu_"), StateFilter(BuildManualState.choosing_psu))
 async def manual_choose_psu(callback: CallbackQuery, state):
     psu_id = int(callback.data.split("psu_")[1])
-    psu_list = await db.select_psus(0)
-    psu = next((p for p in psu_list if p['id'] == psu_id), None)
+    psu = await db.get_component('psu', psu_id)
     if not psu:
         await callback.answer("Ошибка: БП не найден.")
         return
-    await state.update_data(psu=psu)
+    await state.update_data(psu_id=psu['id'])
     # Предлагаем кулер (опционально, можно добавить условие)
-    data = await state.get_data()
-    cpu = data.get('cpu')
-    cooler_buttons = []
-    if cpu:
-        coolers = await db.select_coolers(cpu['socket'], cpu.get('tdp') or 65)
-        for col in coolers[:5]:
-            cooler_buttons.append([InlineKeyboardButton(text=f"{col['name']} ({col['price']} ₽)", callback_data=f"col_{col['id']}")])
-    if cooler_buttons:
-        cooler_kb = InlineKeyboardMarkup(inline_keyboard=cooler_buttons + [[InlineKeyboardButton(text="Без отдельного кулера", callback_data="col_none")]])
+    # В FSM лежат только id – компоненты берём из каталога
+    data = await db.get_build_components(await state.get_data())
+    cooler_kb = await manual_keyboard('cooler', data) if data.get('cpu') else None
+    if cooler_kb and cooler_kb.inline_keyboard:
         await callback.message.answer("Кулеры (введите пропустить, если не нужен):", reply_markup=cooler_kb)
     else:
         await callback.message.answer("Отдельный кулер не требуется или нет вариантов.")
@@ -380,14 +491,14 @@ async def manual_choose_cooler(callback: CallbackQuery, state):
         cooler = None
     else:
         col_id = int(callback.data.split("col_")[1])
-        cooler_list = await db.select_coolers(socket="", required_tdp=0)
-        cooler = next((col for col in cooler_list if col['id'] == col_id), None)
+        cooler = await db.get_component('cooler', col_id)
         if not cooler:
             await callback.answer("Ошибка: кулер не найден.")
             return
-    await state.update_data(cooler=cooler)
+    await state.update_data(cooler_id=cooler['id'] if cooler else None)
     # Переходим к подтверждению
-    data = await state.get_data()
+    # В FSM лежат только id – компоненты берём из каталога
+    data = await db.get_build_components(await state.get_data())
     # Формируем текст сборки
     total_price = 0
     summary = "🔧 *Собранная конфигурация:*\n"
@@ -411,18 +522,15 @@ async def manual_choose_cooler(callback: CallbackQuery, state):
         col = data['cooler']; total_price += col['price']; summary += f"- Кулер: {col['name']} ({col['price']} ₽)\n"
     summary += f"*Итого:* {total_price} ₽\n"
     summary += "Сохранить эту сборку?"
-    confirm_kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="💾 Сохранить", callback_data="manual_save")],
-        [InlineKeyboardButton(text="❌ Отмена", callback_data="manual_cancel")]
-    ])
-    await callback.message.answer(summary, parse_mode="Markdown", reply_markup=confirm_kb)
+    await callback.message.answer(summary, parse_mode="Markdown", reply_markup=MANUAL_CONFIRM)
     await state.set_state(BuildManualState.confirm)
     await callback.answer()
 
 @dp.callback_query(lambda c: c.data == "manual_save", StateFilter(BuildManualState.confirm))
 async def manual_save_build(callback: CallbackQuery, state):
     user_id = await db.get_user_id(callback.from_user.id)
-    data = await state.get_data()
+    # В FSM лежат только id – компоненты берём из каталога
+    data = await db.get_build_components(await state.get_data())
     # Подготовить словарь build для сохранения
     build_data = {
         'cpu_id': data['cpu']['id'] if data.get('cpu') else None,
@@ -443,9 +551,7 @@ async def manual_save_build(callback: CallbackQuery, state):
     await db.save_build(user_id, build_data)
     await callback.message.answer(
         "✅ Сборка сохранена в вашем списке!",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🔄 В главное меню", callback_data="back_to_menu")]
-        ])
+        reply_markup=BACK_TO_MENU
     )
     await db.log_action(user_id, "manual_build_saved")
     await state.clear()
@@ -464,20 +570,71 @@ async def cancel_handler(message: Message, state):
     await message.answer("Действие отменено. Возвращаюсь в главное меню.")
     await state.clear()
     # Можно заново вызвать меню /start или вывести inline-кнопки меню
-    menu_kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔍 Подобрать сборку", callback_data="auto")],
-        [InlineKeyboardButton(text="🛠 Ручной режим сборки", callback_data="manual")],
-        [InlineKeyboardButton(text="💾 Мои сохранённые сборки", callback_data="view_builds")],
-        [InlineKeyboardButton(text="ℹ️ Помощь", callback_data="help")],
-    ])
-    await message.answer("Главное меню:", reply_markup=menu_kb)
+    await message.answer("Главное меню:", reply_markup=MAIN_MENU)
+
+def watch_scheduler(scheduler):
+    if metrics:
+        metrics.gauge("bot_webhook_pending", "Webhook updates accepted and not yet processed",
+                      lambda: len(scheduler.tasks))
+        metrics.gauge("bot_webhook_running", "Webhook updates being processed", lambda: scheduler.running)
+        metrics.gauge("bot_webhook_rejected_total", "Webhook updates refused because of the pending limit",
+                      lambda: scheduler.rejected, "counter")
 
 # Функция запуска бота
 async def main():
+    # Замеры хендлеров, запросов к БД и к Bot API
+    if metrics:
+        metrics.install(dp, bot, db)
+        metrics.gauge("bot_build_cache_hits_total", "Auto build cache hits", lambda: build_cache.hits, "counter")
+        metrics.gauge("bot_build_cache_recomputed_total", "Auto builds recomputed after price changes",
+                      lambda: build_cache.recomputed, "counter")
+        if search_pool:
+            metrics.gauge("bot_search_partial_total", "Auto builds cut short by the search timeout",
+                          lambda: search_pool.partial, "counter")
+            metrics.gauge("bot_search_fallbacks_total", "Auto builds searched in the bot process instead of the pool",
+                          lambda: search_pool.fallbacks, "counter")
+        metrics.gauge("bot_throttle_buckets", "Users with a partly spent rate limit", lambda: len(throttling.buckets))
     # Устанавливаем соединение с базой
-    await db.connect()
-    # Запускаем бот
-    await dp.start_polling(bot)
+    await db.connect(seed_demo=SEED_DEMO_CATALOG)
+    if METRICS_PORT:
+        metrics_runner = await metrics.serve(METRICS_HOST, METRICS_PORT)
+    # Фоновые задачи останавливаются до закрытия БД, иначе они обращаются к закрытой базе
+    background = []
+    if METRICS_DUMP_PATH:
+        background.append(asyncio.create_task(metrics.dump_periodically(METRICS_DUMP_PATH, METRICS_DUMP_SECONDS)))
+    # Логи действий пишутся пачками в фоне, а не на каждый клик
+    db.start_log_sink(batch_size=LOG_BATCH_SIZE, flush_interval_ms=LOG_FLUSH_MS,
+                      max_queue=LOG_QUEUE_SIZE, overflow=LOG_OVERFLOW)
+    background.append(asyncio.create_task(fsm_storage.purge_expired(min(FSM_TTL_SECONDS, 3600))))
+    # Счётчики действий по часам и суткам; сырые логи старше срока удаляются
+    background.append(asyncio.create_task(roll_up_periodically(db, LOG_ROLLUP_SECONDS, LOG_RETENTION_DAYS)))
+    # Каталог загружен в память при connect; следим за сменой его версии
+    background.append(asyncio.create_task(db.catalog.watch(db, CATALOG_REFRESH_SECONDS)))
+    if search_pool:
+        background.append(asyncio.create_task(search_pool.watch(db.catalog, CATALOG_REFRESH_SECONDS)))
+    background.append(asyncio.create_task(build_cache.watch(db.catalog, CATALOG_REFRESH_SECONDS, search_pool)))
+    if BUILD_SOURCE == "table":
+        background.append(asyncio.create_task(breakpoint_index.watch(db, CATALOG_REFRESH_SECONDS)))
+    # Запускаем бот: webhook, если задан порт, иначе long polling
+    try:
+        if WEBHOOK_PORT:
+            await run_webhook(dp, bot, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET,
+                              concurrency=WEBHOOK_CONCURRENCY, max_pending=WEBHOOK_MAX_PENDING,
+                              on_scheduler=watch_scheduler, metrics=metrics)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        if search_pool:
+            search_pool.close()
+        # Дописываем накопленные логи перед выходом
+        await db.close()
+        if METRICS_DUMP_PATH:
+            metrics.dump(METRICS_DUMP_PATH)
+        if METRICS_PORT:
+            await metrics_runner.cleanup()
 
 if __name__ == "__main__":
     asyncio.run(main())
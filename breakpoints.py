@@ -0,0 +1,162 @@
+# breakpoints.py – таблица оптимальных сборок как кусочно-постоянной функции бюджета
+import asyncio
+from array import array
+from bisect import bisect_right
+
+from builder import (COMPONENT_KINDS, USAGE_WEIGHTS, SearchIndex, build_score, search, search_index, usage_key,
+                     usage_weights)
+
+# Разрешение по бюджету (₽): точки смены сборки ищутся с этой точностью
+BREAKPOINT_STEP = 100
+
+
+class BreakpointTable:
+    """Отсортированная таблица «бюджет от -> сборка» для одной цели.
+
+    starts[i] – минимальный бюджет (кратный шагу), с которого лучшей
+    становится i-я сборка; ids хранит по len(COMPONENT_KINDS) id на
+    сборку подряд (0 – компонента нет).
+    """
+
+    def __init__(self, usage: str, version: int):
+        self.usage = usage
+        self.version = version
+        self.starts = array('q')
+        self.ids = array('q')
+        self.totals = array('q')
+
+    def __len__(self):
+        return len(self.starts)
+
+    def append(self, start: int, build: dict):
+        self.starts.append(start)
+        self.ids.extend((build[k] or {}).get('id', 0) for k in COMPONENT_KINDS)
+        self.totals.append(build['total_price'])
+
+    def find(self, budget: int) -> int:
+        """Номер строки для бюджета (-1 – сборки в бюджет нет)."""
+        return bisect_right(self.starts, budget) - 1
+
+    def build_at(self, i: int, snapshot) -> dict:
+        """Собрать словарь сборки i-й строки из компонентов каталога."""
+        n = len(COMPONENT_KINDS)
+        build = snapshot.resolve(dict(zip(COMPONENT_KINDS, self.ids[i * n:(i + 1) * n])))
+        build['total_price'] = sum(item['price'] for item in build.values() if item)
+        return build
+
+    def rows(self):
+        """Строки для сохранения в БД: (budget_from, *ids, total_price)."""
+        n = len(COMPONENT_KINDS)
+        for i, start in enumerate(self.starts):
+            yield (start, *self.ids[i * n:(i + 1) * n], self.totals[i])
+
+    @classmethod
+    def from_rows(cls, usage: str, version: int, rows):
+        table = cls(usage, version)
+        n = len(COMPONENT_KINDS)
+        for row in rows:
+            table.starts.append(row[0])
+            table.ids.extend(row[1:1 + n])
+            table.totals.append(row[1 + n])
+        return table
+
+
+def compute_table(index: SearchIndex, usage: str, version: int, step: int = BREAKPOINT_STEP) -> BreakpointTable:
+    """Найти все точки смены лучшей сборки для цели usage.
+
+    Оценка лучшей сборки не убывает с бюджетом, поэтому следующая точка
+    смены ищется бинарным поиском по сетке бюджета с шагом step. Выше
+    суммы самых дорогих деталей всех категорий сборка уже не меняется.
+    """
+    weights = usage_weights(usage)
+    table = BreakpointTable(usage_key(usage), version)
+    top = sum(rows[-1]['price'] for rows in (
+        index.cpus[:1], index.gpus[-1:], index.storages[-1:], index.cases[-1:], index.coolers[-1:],
+        *[rs[-1:] for rs in index.rams_by_type.values()],
+        *[ms[-1:] for ms in index.mobos_by_socket.values()],
+    ) if rows)
+    top += max((p['price'] for p in index.psu_cheapest if p), default=0)
+    last = -(-top // step)
+    memo = {}
+
+    def best(i):
+        if i not in memo:
+            build = search(index, usage, i * step)
+            memo[i] = (build, build_score(build, weights) if build else -1.0)
+        return memo[i]
+
+    def first_above(lo: int, score: float) -> int:
+        """Наименьший узел сетки в [lo, last], где оценка выше score."""
+        hi = last
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if best(mid)[1] > score + 1e-9:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    top_score = best(last)[1]
+    if top_score < 0:
+        return table
+    i = first_above(1, -1.0)  # первая точка, где сборка вообще возможна
+    while True:
+        build, score = best(i)
+        table.append(i * step, build)
+        if top_score <= score + 1e-9:
+            break
+        i = first_above(i + 1, score)
+        memo = {k: v for k, v in memo.items() if k >= i or k == last}
+    return table
+
+
+class BreakpointIndex:
+    """Таблицы точек смены по всем целям для текущей версии каталога.
+
+    Строятся в фоне (в пуле потоков) и сохраняются в БД, чтобы после
+    перезапуска не пересчитывать их для той же версии каталога.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.tables = {}
+
+    def lookup(self, snapshot, usage: str, budget: int):
+        """Сборка из таблицы; None, если таблица не готова для этой версии."""
+        table = self.tables.get(usage_key(usage))
+        if table is None or table.version != snapshot.version:
+            return None
+        i = table.find(budget)
+        return table.build_at(i, snapshot) if i >= 0 else {}
+
+    async def rebuild(self, db):
+        """Загрузить таблицы текущей версии из БД или пересчитать их."""
+        snapshot = db.catalog.snapshot
+        tables = {}
+        for usage in USAGE_WEIGHTS:
+            rows = await db.load_breakpoints(usage, snapshot.version)
+            if rows:
+                tables[usage] = BreakpointTable.from_rows(usage, snapshot.version, rows)
+        missing = [u for u in USAGE_WEIGHTS if u not in tables]
+        if missing:
+            index = search_index(snapshot)
+            loop = asyncio.get_running_loop()
+            for usage in missing:
+                table = await loop.run_in_executor(None, compute_table, index, usage, snapshot.version)
+                await db.save_breakpoints(usage, snapshot.version, list(table.rows()))
+                tables[usage] = table
+        # Подменяем все таблицы разом, чтобы не смешивать версии
+        self.tables = tables
+        self.version = snapshot.version
+        print(f"Budget breakpoints ready for catalog version {snapshot.version}: "
+              + ", ".join(f"{u}={len(t)}" for u, t in tables.items()))
+
+    async def watch(self, db, interval: float):
+        """Фоновая задача: перестраивать таблицы при смене версии каталога."""
+        while True:
+            if db.catalog.snapshot.version != self.version:
+                try:
+                    await self.rebuild(db)
+                except Exception as e:
+                    print(f"Budget breakpoints rebuild failed: {e}")
+            await asyncio.sleep(interval)
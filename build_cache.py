@@ -0,0 +1,209 @@
+# build_cache.py – кэш автосборок с инкрементальным пересчётом при смене цен
+import asyncio
+import time
+from collections import OrderedDict
+
+from builder import COMPONENT_KINDS, search_index, search_partial, search_top, usage_key
+from catalog import snapshot_delta
+
+# Категории, без которых сборки не бывает: их минимальные цены сужают границу остальных
+REQUIRED_KINDS = ('cpu', 'motherboard', 'ram', 'storage', 'psu', 'case')
+
+
+def _caps(snapshot, budget: int) -> tuple:
+    """Для каждой категории COMPONENT_KINDS – максимальная цена, с которой деталь влезает в бюджет."""
+    cheapest = {kind: prices[0] if prices else 0 for kind, (_, prices) in snapshot.kinds.items()}
+    floor = sum(cheapest[kind] for kind in REQUIRED_KINDS)
+    return tuple(budget - floor + (cheapest[kind] if kind in REQUIRED_KINDS else 0) for kind in COMPONENT_KINDS)
+
+
+def _ids(builds: list) -> tuple:
+    return tuple(tuple((b[kind] or {}).get('id', 0) for kind in COMPONENT_KINDS) for b in builds)
+
+
+def _compute(snapshot, usage: str, budget: int, k: int) -> tuple:
+    """Сборки (кортежи id по COMPONENT_KINDS) и границы caps для одной записи."""
+    return _ids(search_top(search_index(snapshot), usage, budget, k)), _caps(snapshot, budget)
+
+
+def _search(snapshot, usage: str, budget: int, k: int, timeout: float) -> tuple:
+    """Поиск в потоке: (сборки id, прерван ли поиск) – как SearchPool.search."""
+    builds, partial = search_partial(search_index(snapshot), usage, budget, k, timeout=timeout)
+    return _ids(builds), partial
+
+
+class BuildCache:
+    """Результаты автоподбора по (цель, бюджет, число вариантов) с индексом зависимостей.
+
+    Запись зависит от деталей, вошедших в её сборки (индекс (категория, id)
+    -> ключи), и от любой детали, которая могла бы войти: цена не выше
+    caps – бюджета за вычетом самых дешёвых деталей остальных обязательных
+    категорий. При смене версии каталога refresh() пересчитывает только
+    задетые изменениями записи, остальные переходят в новую версию как есть.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # ключ -> (сборки id, caps); порядок – LRU
+        self.users = {}               # (категория, id) -> ключи записей с этой деталью
+        self.snapshot = None          # снимок, по которому посчитаны записи
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.recomputed = 0
+        self._lock = asyncio.Lock()
+
+    def get(self, snapshot, usage: str, budget: int, k: int = 1) -> list:
+        """Сборки (словари, как search_top) из кэша или посчитанные сейчас."""
+        key, entry = self._lookup(snapshot, usage, budget, k)
+        if entry is None:
+            entry = _compute(snapshot, key[0], budget, k)
+            self._remember(snapshot, key, entry)
+        return [self._resolve(snapshot, ids) for ids in entry[0]]
+
+    async def fetch(self, snapshot, usage: str, budget: int, k: int, pool=None, timeout: float = None) -> list:
+        """То же, что get, но промах считается вне цикла событий: в пуле
+        процессов pool (SearchPool), а без пула – в потоке, не дольше timeout секунд.
+
+        Частичный результат (поиск прерван по таймауту) отдаётся, но не кэшируется.
+        """
+        key, entry = self._lookup(snapshot, usage, budget, k)
+        if entry is None:
+            if pool is not None:
+                ids, partial = await pool.search(snapshot, key[0], budget, k)
+            else:
+                ids, partial = await asyncio.get_running_loop().run_in_executor(
+                    None, _search, snapshot, key[0], budget, k, timeout)
+            entry = (tuple(ids), _caps(snapshot, budget))
+            if not partial:
+                self._remember(snapshot, key, entry)
+        return [self._resolve(snapshot, ids) for ids in entry[0]]
+
+    def _lookup(self, snapshot, usage: str, budget: int, k: int) -> tuple:
+        key = (usage_key(usage), budget, k)
+        if self.snapshot is None or (not self.entries and self.snapshot.version != snapshot.version):
+            self.snapshot = snapshot
+        entry = self.entries.get(key) if snapshot.version == self.snapshot.version else None
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        else:
+            self.misses += 1
+        return key, entry
+
+    def _remember(self, snapshot, key, entry):
+        # Пока refresh() переводит кэш на новую версию, результаты не запоминаются:
+        # запись старого снимка не попала в affected() и перешла бы в новую версию
+        if snapshot.version == self.snapshot.version and not self._lock.locked() and self.maxsize:
+            self._store(key, entry)
+
+    @staticmethod
+    def _resolve(snapshot, ids: tuple) -> dict:
+        build = snapshot.resolve(dict(zip(COMPONENT_KINDS, ids)))
+        build['total_price'] = sum(item['price'] for item in build.values() if item)
+        return build
+
+    def _store(self, key, entry):
+        self._unlink(key)
+        self.entries[key] = entry
+        for ids in entry[0]:
+            for kind, cid in zip(COMPONENT_KINDS, ids):
+                if cid:
+                    self.users.setdefault((kind, cid), set()).add(key)
+        while len(self.entries) > self.maxsize:
+            self._unlink(next(iter(self.entries)))
+
+    def _unlink(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for ids in entry[0]:
+            for kind, cid in zip(COMPONENT_KINDS, ids):
+                keys = self.users.get((kind, cid))
+                if keys:
+                    keys.discard(key)
+                    if not keys:
+                        del self.users[(kind, cid)]
+
+    def affected(self, delta: dict) -> set:
+        """Ключи записей, которые изменения delta (см. snapshot_delta) могут поменять."""
+        keys = set()
+        lows = []  # (позиция категории, минимальная новая цена)
+        for kind, changed in delta.items():
+            for cid in changed:
+                keys.update(self.users.get((kind, cid), ()))
+            prices = [p for p in changed.values() if p is not None]
+            if prices:
+                lows.append((COMPONENT_KINDS.index(kind), min(prices)))
+        # Деталь, которой не было в сборке, важна, только если теперь влезает в бюджет
+        for key, (_, caps) in self.entries.items():
+            if key not in keys and any(caps[i] >= low for i, low in lows):
+                keys.add(key)
+        return keys
+
+    async def refresh(self, snapshot, pool=None) -> dict:
+        """Перевести кэш на снимок snapshot, пересчитав только задетые записи.
+
+        С пулом процессов pool, уже поднятым на этой версии, записи
+        пересчитываются в нём параллельно; прерванные по таймауту удаляются.
+        """
+        async with self._lock:
+            old = self.snapshot
+            if old is None or old.version == snapshot.version:
+                self.snapshot = snapshot
+                return {}
+            start = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            delta = await loop.run_in_executor(None, snapshot_delta, old, snapshot)
+            keys = self.affected(delta)
+
+            if pool is not None and pool.version == snapshot.version:
+                results = await self._recompute_in_pool(snapshot, keys, pool)
+            else:
+                def recompute():
+                    return {key: _compute(snapshot, *key) for key in keys}
+
+                # Поиск – чистые вычисления над снимками, его можно вынести из цикла событий
+                results = await loop.run_in_executor(None, recompute)
+            changed = sum(1 for key, entry in results.items()
+                          if key in self.entries and self.entries[key][0] != entry[0])
+            for key, entry in results.items():
+                if key in self.entries:
+                    self._store(key, entry)
+            self.snapshot = snapshot
+            self.invalidated += len(keys)
+            self.recomputed += len(results)
+            stats = {"from_version": old.version, "to_version": snapshot.version,
+                     "changed_items": sum(len(c) for c in delta.values()), "entries": len(self.entries),
+                     "invalidated": len(keys), "recomputed": len(results), "changed": changed,
+                     "elapsed_s": round(time.perf_counter() - start, 3)}
+            print(f"Build cache: catalog {old.version} -> {snapshot.version}, "
+                  f"{stats['changed_items']} items changed, {len(keys)}/{len(self.entries)} entries recomputed "
+                  f"({changed} changed) in {stats['elapsed_s']}s")
+            return stats
+
+    async def _recompute_in_pool(self, snapshot, keys: set, pool) -> dict:
+        keys = list(keys)
+        found = await asyncio.gather(*(pool.search(snapshot, *key) for key in keys))
+        results = {}
+        for key, (ids, partial) in zip(keys, found):
+            if partial:
+                self._unlink(key)  # посчитается заново при следующем запросе
+            else:
+                results[key] = (tuple(ids), _caps(snapshot, key[1]))
+        return results
+
+    async def watch(self, catalog, interval: float, pool=None):
+        """Фоновая задача: догонять версию каталога после его перезагрузки."""
+        while True:
+            await asyncio.sleep(interval)
+            if self.snapshot is not None and catalog.snapshot.version != self.snapshot.version:
+                try:
+                    await self.refresh(catalog.snapshot, pool)
+                except Exception as e:
+                    print(f"Build cache refresh failed: {e}")
+
+    def stats(self) -> dict:
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses,
+                "invalidated": self.invalidated, "recomputed": self.recomputed,
+                "version": self.snapshot.version if self.snapshot else None}
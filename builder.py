@@ -1,114 +1,510 @@
-from db import Database
 # builder.py – автоматический подбор конфигурации
-async def build_pc(db: Database, usage: str, budget: int) -> dict:
-    # === Tiered stub implementation with usage consideration ===
-    u = usage.lower()
-    # Office builds
-    if u in ["работа", "офис"]:
-        if budget < 20000:
-            build = {
-                'cpu': {'name': 'Intel Pentium Gold G6400', 'price': 6000},
-                'motherboard': {'name': 'ASUS PRIME H410M', 'price': 5000},
-                'ram': {'name': '8GB DDR4', 'price': 2000},
-                'gpu': None,
-                'storage': {'name': '256GB SSD', 'price': 3000},
-                'psu': {'name': '450W PSU', 'price': 2000},
-                'case': {'name': 'Budget Case', 'price': 1500},
-                'cooler': None,
-            }
-        elif budget < 50000:
-            build = {
-                'cpu': {'name': 'Intel Core i5-10400', 'price': 12000},
-                'motherboard': {'name': 'MSI B560M PRO', 'price': 8000},
-                'ram': {'name': '16GB DDR4', 'price': 4000},
-                'gpu': None,
-                'storage': {'name': '512GB SSD', 'price': 5000},
-                'psu': {'name': '550W Bronze PSU', 'price': 3500},
-                'case': {'name': 'Mid Tower Case', 'price': 2500},
-                'cooler': None,
-            }
-        else:
-            build = {
-                'cpu': {'name': 'Intel Core i7-11700', 'price': 20000},
-                'motherboard': {'name': 'ASUS TUF Z590-PLUS', 'price': 15000},
-                'ram': {'name': '32GB DDR4', 'price': 8000},
-                'gpu': None,
-                'storage': {'name': '1TB NVMe SSD', 'price': 10000},
-                'psu': {'name': '650W Gold PSU', 'price': 5000},
-                'case': {'name': 'Premium Case', 'price': 5000},
-                'cooler': None,
-            }
-    # Rendering/3D builds
-    elif u in ["рендеринг", "3d", "рендеринг/3d"]:
-        if budget < 30000:
-            build = {
-                'cpu': {'name': 'AMD Ryzen 5 3600', 'price': 12000},
-                'motherboard': {'name': 'Gigabyte B450M DS3H', 'price': 6000},
-                'ram': {'name': '16GB DDR4', 'price': 4000},
-                'gpu': {'name': 'NVIDIA GTX 1660 Super', 'price': 20000},
-                'storage': {'name': '512GB SSD', 'price': 5000},
-                'psu': {'name': '550W Bronze PSU', 'price': 3500},
-                'case': {'name': 'Mid Tower Case', 'price': 2500},
-                'cooler': {'name': 'Stock Cooler', 'price': 800},
-            }
-        elif budget < 70000:
-            build = {
-                'cpu': {'name': 'AMD Ryzen 7 5800X', 'price': 25000},
-                'motherboard': {'name': 'MSI B550-A PRO', 'price': 12000},
-                'ram': {'name': '32GB DDR4', 'price': 8000},
-                'gpu': {'name': 'NVIDIA RTX 3060 Ti', 'price': 30000},
-                'storage': {'name': '1TB NVMe SSD', 'price': 10000},
-                'psu': {'name': '650W Gold PSU', 'price': 5000},
-                'case': {'name': 'Mid Tower Case', 'price': 2500},
-                'cooler': {'name': 'Aftermarket Air Cooler', 'price': 3000},
-            }
-        else:
-            build = {
-                'cpu': {'name': 'AMD Ryzen 9 5900X', 'price': 35000},
-                'motherboard': {'name': 'ASUS TUF X570-PLUS', 'price': 20000},
-                'ram': {'name': '64GB DDR4', 'price': 16000},
-                'gpu': {'name': 'NVIDIA RTX 3080', 'price': 60000},
-                'storage': {'name': '2TB NVMe SSD', 'price': 20000},
-                'psu': {'name': '750W Gold PSU', 'price': 7000},
-                'case': {'name': 'Premium Case', 'price': 5000},
-                'cooler': {'name': 'High-End Air Cooler', 'price': 5000},
-            }
-    # Gaming/default builds
-    else:
-        if budget < 20000:
-            build = {
-                'cpu': {'name': 'Intel Core i3-10100', 'price': 8000},
-                'motherboard': {'name': 'ASUS PRIME H410M', 'price': 5000},
-                'ram': {'name': '8GB DDR4', 'price': 2000},
-                'gpu': {'name': 'NVIDIA GTX 1050 Ti', 'price': 9000},
-                'storage': {'name': '256GB SSD', 'price': 3000},
-                'psu': {'name': '450W PSU', 'price': 2000},
-                'case': {'name': 'Budget Case', 'price': 1500},
-                'cooler': {'name': 'Stock Cooler', 'price': 800},
-            }
-        elif budget < 50000:
-            build = {
-                'cpu': {'name': 'Intel Core i5-10400F', 'price': 12000},
-                'motherboard': {'name': 'MSI B460M PRO', 'price': 7000},
-                'ram': {'name': '16GB DDR4', 'price': 4000},
-                'gpu': {'name': 'NVIDIA GTX 1660 Super', 'price': 20000},
-                'storage': {'name': '500GB SSD', 'price': 5000},
-                'psu': {'name': '550W Bronze PSU', 'price': 3500},
-                'case': {'name': 'Mid Tower Case', 'price': 2500},
-                'cooler': {'name': 'Stock Cooler', 'price': 800},
-            }
-        else:
-            build = {
-                'cpu': {'name': 'Intel Core i7-11700K', 'price': 25000},
-                'motherboard': {'name': 'ASUS TUF Z590-PLUS', 'price': 15000},
-                'ram': {'name': '32GB DDR4', 'price': 8000},
-                'gpu': {'name': 'NVIDIA RTX 3070', 'price': 40000},
-                'storage': {'name': '1TB NVMe SSD', 'price': 10000},
-                'psu': {'name': '650W Gold PSU', 'price': 5000},
-                'case': {'name': 'Premium Case', 'price': 5000},
-                'cooler': {'name': 'Aftermarket Air Cooler', 'price': 3000},
-            }
-    # Рассчитываем итоговую цену
-    total = sum(item['price'] for item in build.values() if item)
-    build['total_price'] = total if total <= budget else budget
+import heapq
+import itertools
+import math
+import time
+from bisect import bisect_left, bisect_right
+
+from compat import CompatibilityMatrix, compatibility
+from db import Database
+from power import POWER_MARGIN, POWER_RESERVE, PowerTable
+
+COMPONENT_KINDS = ('cpu', 'motherboard', 'ram', 'gpu', 'storage', 'psu', 'case', 'cooler')
+
+# Вес компонента в оценке сборки для каждой цели использования.
+# В каталоге нет бенчмарков, поэтому «производительность» детали оценивается
+# её ценой, а sqrt даёт убывающую отдачу – бюджет распределяется между
+# деталями, а не уходит целиком в одну.
+USAGE_WEIGHTS = {
+    'игры':      {'cpu': 1.0, 'gpu': 2.0, 'ram': 0.6, 'storage': 0.4},
+    'работа':    {'cpu': 1.0, 'gpu': 0.0, 'ram': 0.8, 'storage': 0.6},
+    'рендеринг': {'cpu': 2.0, 'gpu': 1.2, 'ram': 1.0, 'storage': 0.4},
+    'другое':    {'cpu': 1.0, 'gpu': 1.0, 'ram': 0.6, 'storage': 0.4},
+}
+USAGE_ALIASES = {'офис': 'работа', '3d': 'рендеринг', 'рендеринг/3d': 'рендеринг'}
+
+# Шаг сетки (₽) таблицы верхних оценок для пары ОЗУ+накопитель
+MEMORY_GRID = 250
+# Шаг сетки (₽) таблицы верхних оценок для тройки GPU+ОЗУ+накопитель
+GPU_GRID = 1000
+# Допустимый относительный зазор до оптимума: ветви, чья верхняя граница
+# превосходит найденную сборку меньше чем на SEARCH_GAP, не раскрываются
+SEARCH_GAP = 0.003
+# Процессоры до этого TDP комплектуются боксовым кулером
+STOCK_COOLER_TDP = 65
+
+
+def usage_key(usage: str) -> str:
+    """Нормализованная цель использования (неизвестная цель – «другое»)."""
+    u = (usage or '').lower()
+    u = USAGE_ALIASES.get(u, u)
+    return u if u in USAGE_WEIGHTS else 'другое'
+
+
+def usage_weights(usage: str) -> dict:
+    """Веса компонентов для цели использования."""
+    return USAGE_WEIGHTS[usage_key(usage)]
+
+
+def required_power(cpu: dict | None, gpu: dict | None) -> int:
+    """Минимальная мощность БП для пары CPU+GPU (запас 20% + 50 Вт)."""
+    total_tdp = 0
+    if cpu: total_tdp += cpu.get('tdp') or 0
+    if gpu: total_tdp += gpu.get('tdp') or 0
+    return int(total_tdp * POWER_MARGIN) + POWER_RESERVE
+
+
+def build_score(build: dict, weights: dict) -> float:
+    """Оценка готовой сборки (та же функция, что максимизирует поиск)."""
+    return sum(w * math.sqrt(build[k]['price']) for k, w in weights.items() if build.get(k))
+
+
+class SearchIndex:
+    """Подготовленные к поиску списки кандидатов.
+
+    Не зависит от цели и бюджета, поэтому строится один раз на версию
+    каталога и переиспользуется всеми запросами.
+    """
+
+    def __init__(self, candidates: dict, compat: CompatibilityMatrix = None):
+        price = lambda c: c['price']
+        # Совместимость корпусов и кулеров – по маскам (см. compat.py)
+        self.compat = compat or CompatibilityMatrix(candidates)
+        self.cpus = sorted((c for c in candidates['cpu'] if c.get('price') is not None), key=price, reverse=True)
+        self.gpus = sorted((g for g in candidates['gpu'] if g.get('price') is not None), key=price)
+        self.gpu_prices = [g['price'] for g in self.gpus]
+
+        # Платы: для каждого сокета – самая дешёвая на пару (ram_type, form_factor)
+        mobos_by_socket = {}
+        for m in sorted(candidates['motherboard'], key=price):
+            variants = mobos_by_socket.setdefault(m['socket'], {})
+            variants.setdefault((m.get('ram_type'), m.get('form_factor')), m)
+        self.mobos_by_socket = {s: sorted(v.values(), key=price) for s, v in mobos_by_socket.items()}
+
+        # ОЗУ по типу памяти и накопители – по возрастанию цены для bisect
+        self.rams_by_type = {}
+        for r in sorted(candidates['ram'], key=price):
+            self.rams_by_type.setdefault(r.get('type'), []).append(r)
+        self.ram_prices = {t: [r['price'] for r in rs] for t, rs in self.rams_by_type.items()}
+        self.storages = sorted(candidates['storage'], key=price)
+        self.storage_prices = [s['price'] for s in self.storages]
+
+        # БП по возрастанию мощности + суффиксный минимум цены:
+        # самый дешёвый БП мощностью ≥ P находится одним bisect
+        psus = sorted(candidates['psu'], key=lambda p: p['power'])
+        self.psu_powers = [p['power'] for p in psus]
+        self.psu_cheapest = [None] * len(psus)
+        best = None
+        for i in range(len(psus) - 1, -1, -1):
+            if best is None or psus[i]['price'] < best['price']:
+                best = psus[i]
+            self.psu_cheapest[i] = best
+
+        self.cases = sorted(candidates['case'], key=price)
+        self.coolers = sorted(candidates['cooler'], key=price)
+
+        # Нижние оценки стоимости невзвешенных деталей
+        self.min_case = self.cases[0]['price'] if self.cases else None
+        self.min_psu = min((p['price'] for p in psus), default=None)
+        self.max_gpu = math.sqrt(self.gpu_prices[-1]) if self.gpus else 0.0
+        self.max_ram = {t: math.sqrt(p[-1]) for t, p in self.ram_prices.items()}
+        self.max_storage = math.sqrt(self.storage_prices[-1]) if self.storage_prices else 0.0
+
+        self._case_cache = {}
+        self._memory_tables = {}
+        self._gpu_tables = {}
+
+        # CPU вместе с обязательным кулером: (cpu, кулер или None, цена пары, строка в power)
+        self.cpu_options = []
+        costs = []
+        for ci, cpu in enumerate(self.cpus):
+            cooler, ok = self.cheapest_cooler(cpu)
+            costs.append(cpu['price'] + (cooler['price'] if cooler else 0) if ok else math.inf)
+            if ok:
+                self.cpu_options.append((cpu, cooler, costs[-1], ci))
+        # Минимальная цена полной сборки для каждой пары CPU×GPU (см. power.py)
+        self.power = PowerTable(self.cpus, costs, self.gpus, candidates)
+
+    def cheapest_psu(self, power: int):
+        i = bisect_left(self.psu_powers, power)
+        return self.psu_cheapest[i] if i < len(self.psu_cheapest) else None
+
+    def cheapest_cooler(self, cpu: dict):
+        """Самый дешёвый подходящий кулер; None – если хватает боксового."""
+        if (cpu.get('tdp') or 0) <= STOCK_COOLER_TDP:
+            return None, True
+        cooler = self.compat.cheapest('cooler', self.compat.mask('cpu', cpu, 'cooler'))
+        return cooler, cooler is not None
+
+    def cheapest_case(self, mobo: dict, gpu: dict | None):
+        key = (mobo.get('form_factor'), gpu.get('length') or 0 if gpu else 0)
+        if key not in self._case_cache:
+            self._case_cache[key] = self.compat.cheapest('case', self.compat.compatible(
+                'case', {'motherboard': mobo, 'gpu': gpu}))
+        return self._case_cache[key]
+
+    def best_memory(self, weights: dict, ram_type, remaining: int, need: float):
+        """Лучшая пара ОЗУ+накопитель на остаток бюджета с оценкой выше need.
+
+        Граница wr·sqrt(p) + ws·sqrt(min(остаток, max_storage)) вогнута по
+        цене ОЗУ, поэтому перебор идёт от её максимума в обе стороны и
+        обрывается, как только граница не превышает need.
+        """
+        w_ram, w_sto = weights['ram'], weights['storage']
+        rams = self.rams_by_type.get(ram_type)
+        if not rams or not self.storages:
+            return None
+        prices = self.ram_prices[ram_type]
+        max_sto = self.storage_prices[-1]
+        best = None
+
+        def visit(i):
+            nonlocal best, need
+            ram = rams[i]
+            left = remaining - ram['price']
+            ram_score = w_ram * math.sqrt(ram['price'])
+            if ram_score + w_sto * math.sqrt(min(left, max_sto)) <= need:
+                return False
+            j = bisect_right(self.storage_prices, left) - 1
+            if j >= 0:
+                score = ram_score + w_sto * math.sqrt(self.storages[j]['price'])
+                if score > need:
+                    best, need = (ram, self.storages[j], score), score
+            return True
+
+        hi = bisect_right(prices, remaining)
+        peak = max(remaining * w_ram ** 2 / (w_ram ** 2 + w_sto ** 2), remaining - max_sto)
+        mid = bisect_left(prices, peak, 0, hi)
+        for i in range(mid, hi):
+            if not visit(i):
+                break
+        for i in range(mid - 1, -1, -1):
+            if not visit(i):
+                break
+        return best
+
+    def memory_table(self, weights: dict, ram_type) -> list:
+        """Таблица оценок сверху для пары ОЗУ+накопитель (сетка MEMORY_GRID).
+
+        Лучшая пара на остаток r – неубывающая ступенчатая функция r; её
+        значение в ближайшем узле сетки сверху ограничивает оценку при любом r.
+        """
+        key = (weights['ram'], weights['storage'], ram_type)
+        table = self._memory_tables.get(key)
+        if table is None:
+            table = []
+            prices = self.ram_prices.get(ram_type)
+            if prices and self.storage_prices:
+                top = prices[-1] + self.storage_prices[-1]
+                for step in range(top // MEMORY_GRID + 2):
+                    best = self.best_memory(weights, ram_type, step * MEMORY_GRID, -1.0)
+                    table.append(best[2] if best else 0.0)
+            self._memory_tables[key] = table
+        return table
+
+    def gpu_table(self, weights: dict, ram_type) -> list:
+        """Таблица оценок сверху для тройки GPU+ОЗУ+накопитель (сетка GPU_GRID).
+
+        В узле сетки R берётся максимум w_gpu·sqrt(p) + memory_bound(R − p)
+        по GPU; перебор GPU обрывается по вогнутой границе
+        Коши–Буняковского, которая не меньше реально достижимой оценки.
+        """
+        key = (weights['gpu'], weights['ram'], weights['storage'], ram_type)
+        table = self._gpu_tables.get(key)
+        if table is None:
+            table = []
+            mem_table = self.memory_table(weights, ram_type)
+            if self.gpus and mem_table:
+                w_gpu = weights['gpu']
+                w2_mem = weights['ram'] ** 2 + weights['storage'] ** 2
+                mem_cap = mem_table[-1]
+                top = self.gpu_prices[-1] + self.ram_prices[ram_type][-1] + self.storage_prices[-1]
+                for step in range(top // GPU_GRID + 2):
+                    r = step * GPU_GRID
+                    hi = bisect_right(self.gpu_prices, r)
+                    peak = max(r * w_gpu ** 2 / (w_gpu ** 2 + w2_mem), r - mem_cap ** 2 / w2_mem)
+                    mid = bisect_left(self.gpu_prices, peak, 0, hi)
+                    best = 0.0
+                    for rng in (range(mid, hi), range(mid - 1, -1, -1)):
+                        for i in rng:
+                            p = self.gpu_prices[i]
+                            gpu_score = w_gpu * math.sqrt(p)
+                            if gpu_score + min(math.sqrt((r - p) * w2_mem), mem_cap) <= best:
+                                break
+                            best = max(best, gpu_score + _lookup(mem_table, MEMORY_GRID, r - p))
+                    table.append(best)
+            self._gpu_tables[key] = table
+        return table
+
+    def memory_bound(self, weights: dict, ram_type, remaining: int) -> float:
+        return _lookup(self.memory_table(weights, ram_type), MEMORY_GRID, remaining)
+
+
+def _lookup(table: list, grid: int, remaining: int) -> float:
+    """Значение неубывающей таблицы в ближайшем узле сетки не ниже remaining."""
+    if remaining < 0 or not table:
+        return 0.0
+    i = -(-remaining // grid)
+    return table[i] if i < len(table) else table[-1]
+
+
+class _Search:
+    """Branch-and-bound по дереву (CPU, плата) → GPU → корпус/БП → ОЗУ/накопитель.
+
+    Детали без веса (плата, БП, корпус, кулер) не влияют на оценку, поэтому
+    для них берётся самая дешёвая совместимая. Верхняя граница для
+    оставшихся взвешенных деталей при остатке бюджета r:
+    max Σ w_k·sqrt(x_k) при Σ x_k ≤ r равен sqrt(r·Σ w_k²) (Коши–Буняковский),
+    и дополнительно не больше Σ w_k·sqrt(max_price_k).
+
+    Лидер (ответ search) ищется с отсечением по своей оценке с допуском
+    SEARCH_GAP, варианты для k > 1 – в том же проходе по k-й лучшей оценке
+    среди ключей разнообразия. Флаг lead помечает ветви, которые раскрыл бы
+    и поиск одного лидера: только сборки из них могут сменить лидера, поэтому
+    он не зависит от k.
+    """
+
+    def __init__(self, index: SearchIndex, weights: dict, k: int = 1, diversity=None, deadline: float = None):
+        self.ix = index
+        self.w = weights
+        self.k = k
+        self.diversity = diversity
+        # Момент time.monotonic(), после которого поиск отдаёт лучшее найденное
+        self.deadline = deadline
+        self.partial = False
+        # Лидер (оценка, сборка) и порог отсечения для него
+        self.leader = None
+        self.lead_threshold = -1.0
+        # Лучшая сборка по каждому ключу разнообразия; members – k ключей с
+        # лучшими оценками, heap – их мин-куча (оценка, номер, ключ) с
+        # ленивым удалением устаревших записей. Порог вариантов – k-я оценка
+        # с учётом SEARCH_GAP; при k = 1 варианты не нужны.
+        self.best = {}
+        self.members = set()
+        self.heap = []
+        self._seq = itertools.count()
+        self.threshold = -1.0 if k > 1 else math.inf
+
+    def rest_bound(self, remaining: int, ram_type, with_gpu: bool) -> float:
+        """Верхняя граница оценки ОЗУ+накопителя (+GPU) при остатке бюджета."""
+        if remaining <= 0:
+            return 0.0
+        w, ix = self.w, self.ix
+        w2 = w['ram'] ** 2 + w['storage'] ** 2
+        cap = w['ram'] * ix.max_ram.get(ram_type, 0.0) + w['storage'] * ix.max_storage
+        if with_gpu:
+            w2 += w['gpu'] ** 2
+            cap += w['gpu'] * ix.max_gpu
+        return min(math.sqrt(remaining * w2), cap)
+
+    def run(self, budget: int):
+        ix, w = self.ix, self.w
+        if ix.min_case is None or ix.min_psu is None:
+            return None
+        with_gpu = w['gpu'] > 0
+        # Узлы (CPU, плата) раскрываются в порядке убывания верхней границы
+        # (best-first): хорошая сборка находится рано и отсекает остальное
+        w_cpu = w['cpu']
+        fixed = ix.min_case + ix.min_psu
+        # Сборки без видеокарты перебираются всегда: пространство поиска
+        # не зависит от k, и search_top(...)[0] совпадает с search
+        tables = [({t: ix.memory_table(w, t) for t in ix.rams_by_type}, MEMORY_GRID)]
+        if with_gpu:
+            tables.append(({t: ix.gpu_table(w, t) for t in ix.rams_by_type}, GPU_GRID))
+        nodes = []
+        self.budget = budget
+        # Процессоры, ни одна полная сборка с которыми не влезает в бюджет, отбрасываются разом
+        affordable = (ix.power.cpu_floor <= budget).tolist()
+        for cpu, cooler, cpu_cost, ci in ix.cpu_options:
+            if not affordable[ci]:
+                continue
+            cpu_score = w_cpu * math.sqrt(cpu['price'])
+            for mobo in ix.mobos_by_socket.get(cpu['socket'], ()):
+                remaining = budget - cpu_cost - mobo['price']
+                slack = remaining - fixed
+                if slack < 0:
+                    break  # платы отсортированы по цене
+                bound = -1.0
+                for by_type, grid in tables:
+                    table = by_type.get(mobo.get('ram_type'))
+                    if table:
+                        i = -(-slack // grid)
+                        bound = max(bound, cpu_score + (table[i] if i < len(table) else table[-1]))
+                if bound >= 0:
+                    nodes.append((bound, cpu_score, remaining, cpu, mobo, cooler, ci))
+        nodes.sort(key=lambda n: n[0], reverse=True)
+        lead = True
+        for bound, cpu_score, remaining, cpu, mobo, cooler, ci in nodes:
+            # Границы узлов убывают: поиск лидера здесь бы остановился
+            lead = lead and bound > self.lead_threshold
+            if not lead and bound <= self.threshold:
+                break
+            if self.deadline is not None and self.leader and time.monotonic() > self.deadline:
+                self.partial = True
+                break
+            base = {'cpu': cpu, 'motherboard': mobo, 'cooler': cooler}
+            floor = ix.power.floor[ci]
+            if with_gpu:
+                self._choose_gpu(base, remaining, cpu_score, floor, lead)
+            if floor[ix.power.no_gpu] <= budget:
+                self._finish(base, None, remaining, cpu_score, lead)
+        return self._result()
+
+    def _choose_gpu(self, base: dict, remaining: int, score: float, floor, lead: bool):
+        """Перебор GPU от максимума верхней границы в обе стороны по цене.
+
+        floor – строка PowerTable.floor для CPU: видеокарты, с которыми
+        никакая полная сборка не влезает в бюджет, пропускаются.
+        """
+        ix, w = self.ix, self.w
+        ram_type = base['motherboard'].get('ram_type')
+        affordable = remaining - ix.min_case - ix.min_psu
+        w2_mem = w['ram'] ** 2 + w['storage'] ** 2
+        mem_cap = self.rest_bound(math.inf, ram_type, False)
+        # Граница w_gpu·sqrt(p) + min(sqrt((A − p)·Σw²), cap) вогнута по p,
+        # максимум – в точке Коши–Буняковского либо там, где срабатывает cap.
+        # По ней обрывается перебор, а более точная табличная граница
+        # memory_bound только пропускает отдельные GPU.
+        peak = max(affordable * w['gpu'] ** 2 / (w['gpu'] ** 2 + w2_mem),
+                   affordable - mem_cap ** 2 / w2_mem)
+        hi = bisect_right(ix.gpu_prices, affordable)
+        mid = bisect_left(ix.gpu_prices, peak, 0, hi)
+        for order in (range(mid, hi), range(mid - 1, -1, -1)):
+            lead_here = lead
+            for i in order:
+                if floor[i] > self.budget:
+                    continue
+                gpu = ix.gpus[i]
+                gpu_score = score + w['gpu'] * math.sqrt(gpu['price'])
+                rest = affordable - gpu['price']
+                bound = gpu_score + self.rest_bound(rest, ram_type, False)
+                lead_here = lead_here and bound > self.lead_threshold
+                if not lead_here and bound <= self.threshold:
+                    break
+                bound = gpu_score + ix.memory_bound(w, ram_type, rest)
+                if (lead_here and bound > self.lead_threshold) or bound > self.threshold:
+                    self._finish(base, gpu, remaining, gpu_score, lead_here)
+
+    def _finish(self, base: dict, gpu: dict | None, remaining: int, score: float, lead: bool):
+        ix = self.ix
+        ram_type = base['motherboard'].get('ram_type')
+        case = ix.cheapest_case(base['motherboard'], gpu)
+        psu = ix.cheapest_psu(required_power(base['cpu'], gpu))
+        if case is None or psu is None:
+            return
+        remaining -= (gpu['price'] if gpu else 0) + case['price'] + psu['price']
+        if remaining < 0:
+            return
+        bound = score + ix.memory_bound(self.w, ram_type, remaining)
+        lead = lead and bound > self.lead_threshold
+        if not lead and bound <= self.threshold:
+            return
+        # Лучшая пара не зависит от порога, если превышает его: берётся меньший
+        need = min(self.lead_threshold, self.threshold) if lead else self.threshold
+        memory = ix.best_memory(self.w, ram_type, remaining, need - score)
+        if memory is None:
+            return
+        ram, storage, mem_score = memory
+        score += mem_score
+        self._offer(score, dict(base, gpu=gpu, case=case, psu=psu, ram=ram, storage=storage),
+                    lead and score > self.lead_threshold)
+
+    def _offer(self, score: float, build: dict, lead: bool):
+        """Учесть найденную сборку: лидер и лучшие по ключам разнообразия."""
+        if lead:
+            self.leader = (score, build)
+            self.lead_threshold = score * (1 + SEARCH_GAP)
+        if self.k == 1:
+            return
+        key = self.diversity(build) if self.diversity else None
+        current = self.best.get(key)
+        if current is not None and current[0] >= score:
+            return
+        self.best[key] = (score, build)
+        heap, members = self.heap, self.members
+        if key not in members:
+            if len(members) == self.k:
+                self._clean()
+                if score <= heap[0][0]:
+                    return
+                members.discard(heapq.heappop(heap)[2])
+            members.add(key)
+        heapq.heappush(heap, (score, next(self._seq), key))
+        if len(members) == self.k:
+            # Сборка хуже k-й не меняет ответ: либо не входит в k лучших,
+            # либо её ключ уже представлен сборкой лучше
+            self._clean()
+            self.threshold = heap[0][0] * (1 + SEARCH_GAP)
+
+    def _clean(self):
+        """Снять с вершины кучи записи вытесненных ключей и улучшенных оценок."""
+        heap, best, members = self.heap, self.best, self.members
+        while heap[0][2] not in members or best[heap[0][2]][0] != heap[0][0]:
+            heapq.heappop(heap)
+
+    def _result(self) -> list:
+        """Лидер, затем лучшие сборки других ключей по убыванию оценки."""
+        if self.leader is None:
+            return []
+        score, leader = self.leader
+        key = self.diversity(leader) if self.diversity else None
+        rest = sorted((self.best[k] for k in self.members if k != key), key=lambda t: t[0], reverse=True)
+        return [leader] + [build for _, build in rest[:self.k - 1]]
+
+
+def diversity_key(build: dict) -> tuple:
+    """Чем варианты сборки должны различаться: платформа и наличие видеокарты."""
+    return build['cpu']['socket'], build['gpu'] is not None
+
+
+def _result(found: dict) -> dict:
+    build = {kind: found.get(kind) for kind in COMPONENT_KINDS}
+    build['total_price'] = sum(item['price'] for item in build.values() if item)
     return build
+
+
+def search(candidates, usage: str, budget: int) -> dict:
+    """Найти лучшую совместимую сборку в пределах бюджета.
+
+    candidates – словарь списков по категориям или готовый SearchIndex.
+    Возвращает словарь компонентов (по ключам COMPONENT_KINDS) с
+    total_price – фактической суммой цен, или {} если сборка невозможна.
+    """
+    index = candidates if isinstance(candidates, SearchIndex) else SearchIndex(candidates)
+    found = _Search(index, usage_weights(usage)).run(budget)
+    return _result(found[0]) if found else {}
+
+
+def search_top(candidates, usage: str, budget: int, k: int, diversity=diversity_key, timeout: float = None) -> list:
+    """До k лучших сборок за один проход поиска, попарно различных по diversity.
+
+    Первая – ровно та, что вернёт search, остальные – лучшие сборки с
+    другими значениями ключа разнообразия по убыванию оценки.
+    """
+    return search_partial(candidates, usage, budget, k, diversity, timeout)[0]
+
+
+def search_partial(candidates, usage: str, budget: int, k: int, diversity=diversity_key,
+                   timeout: float = None) -> tuple:
+    """search_top с ограничением времени: (сборки, прерван ли поиск).
+
+    Через timeout секунд поиск останавливается, как только найдена хотя бы
+    одна сборка, и возвращает лучшие из просмотренных ветвей.
+    """
+    index = candidates if isinstance(candidates, SearchIndex) else SearchIndex(candidates)
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    run = _Search(index, usage_weights(usage), k, diversity, deadline)
+    return [_result(found) for found in run.run(budget) or ()], run.partial
+
+
+def search_index(snapshot) -> SearchIndex:
+    """Индекс поиска снимка каталога (строится один раз на версию)."""
+    return snapshot.memo('search_index', lambda: SearchIndex(snapshot.candidates(), compatibility(snapshot)))
+
+
+async def build_pc(db: Database, usage: str, budget: int, top_k: int = None):
+    """Лучшая сборка, а при заданном top_k – список из до top_k разных вариантов."""
+    index = search_index(db.catalog.snapshot)
+    if top_k:
+        return search_top(index, usage, budget, top_k)
+    return search(index, usage, budget)
@@ -0,0 +1,258 @@
+# catalog.py – каталог комплектующих в памяти с индексами
+import asyncio
+import threading
+from bisect import bisect_right
+from pathlib import Path
+
+# Категория -> таблица каталога (см. schema.sql)
+CATALOG_TABLES = {
+    'cpu': 'cpus',
+    'motherboard': 'motherboards',
+    'ram': 'rams',
+    'gpu': 'gpus',
+    'storage': 'storages',
+    'psu': 'psus',
+    'case': 'cases',
+    'cooler': 'coolers',
+}
+
+# Столбцы таблиц каталога (кроме id) как в schema.sql: (имя, тип, NOT NULL)
+CATALOG_COLUMNS = {
+    'cpus': (('name', str, True), ('socket', str, True), ('cores', int, False), ('tdp', int, False),
+             ('price', int, False)),
+    'motherboards': (('name', str, True), ('socket', str, True), ('form_factor', str, True),
+                     ('ram_type', str, True), ('max_ram', int, False), ('price', int, False)),
+    'gpus': (('name', str, True), ('chipset', str, False), ('vram', int, False), ('length', int, False),
+             ('tdp', int, False), ('price', int, False)),
+    'rams': (('name', str, True), ('type', str, True), ('size', int, False), ('speed', int, False),
+             ('price', int, False)),
+    'storages': (('name', str, True), ('type', str, True), ('capacity', int, False), ('price', int, False)),
+    'psus': (('name', str, True), ('power', int, True), ('modular', bool, False), ('price', int, False)),
+    'cases': (('name', str, True), ('form_factor', str, True), ('gpu_max_length', int, False),
+              ('psu_form_factor', str, False), ('price', int, False)),
+    'coolers': (('name', str, True), ('socket', str, True), ('tdp_capacity', int, False), ('price', int, False)),
+}
+# Естественный ключ позиции: по нему строки прайса сопоставляются с каталогом
+# (кулер с одним названием выпускается под разные сокеты)
+CATALOG_KEYS = {table: ('name',) for table in CATALOG_COLUMNS} | {'coolers': ('name', 'socket')}
+
+# Форм-факторы плат от меньшего к большему: корпус вмещает плату своего
+# форм-фактора и все меньшие.
+FORM_FACTOR_ORDER = {'Mini-ITX': 0, 'mATX': 1, 'ATX': 2, 'E-ATX': 3}
+
+# Вторичные индексы: категория -> {имя индекса: функция ключей строки}.
+# Функция возвращает все ключи, под которыми строка попадает в индекс.
+SECONDARY_INDEXES = {
+    'cpu': {'socket': lambda r: (r['socket'],)},
+    'motherboard': {
+        'socket': lambda r: (r['socket'],),
+        'ram_type': lambda r: (r['ram_type'],),
+        'form_factor': lambda r: (r['form_factor'],),
+    },
+    'ram': {'ram_type': lambda r: (r['type'],)},
+    # Корпус попадает под все форм-факторы плат, которые в него помещаются
+    'case': {'form_factor': lambda r: tuple(
+        ff for ff, size in FORM_FACTOR_ORDER.items()
+        if size <= FORM_FACTOR_ORDER.get(r['form_factor'], 0)
+    ) or (r['form_factor'],)},
+    'cooler': {'socket': lambda r: (r['socket'],)},
+}
+
+_EMPTY = ([], [])
+
+
+class CatalogSnapshot:
+    """Неизменяемый снимок каталога одной версии.
+
+    Для каждой категории строки лежат по возрастанию цены вместе с
+    параллельным списком цен, так что выборка «цена ≤ X» – один bisect.
+    Вторичные индексы хранят такие же пары списков для каждого значения
+    ключа. Строки общие для всех запросов и не должны изменяться.
+    """
+
+    def __init__(self, version: int, rows, previous: 'CatalogSnapshot' = None, path: str = None,
+                 database_id: int = None):
+        """rows – {категория: [строка]} или открытый CatalogFile (см. catalog_file.py):
+        тогда снимок держит отображение файла и собирает строки при обращении."""
+        self.version = version
+        # Файл каталога этой версии (см. catalog_file.py); None – снимок есть только в памяти
+        self.path = path
+        # Id базы, которой принадлежит файл (проверяется при открытии в процессах пула)
+        self.database_id = database_id
+        # Предыдущий снимок – для инкрементального построения производных
+        # структур; ссылка не дальше одного шага, чтобы не держать историю
+        self.previous = previous
+        if previous is not None:
+            previous.previous = None
+        self.kinds = {}
+        self.indexes = {}
+        self.by_id = {}
+        self._memo = {}
+        # Поиск идёт и в потоках: структура строится один раз, остальные ждут её
+        self._memo_lock = threading.RLock()
+        self.file = None if isinstance(rows, dict) else rows
+        for kind in CATALOG_TABLES:
+            if self.file is not None:
+                self._index_file(kind, self.file.table(kind))
+                continue
+            # Строки без цены купить нельзя: они доступны только по id
+            self.by_id[kind] = {r['id']: r for r in rows.get(kind, ())}
+            ordered = sorted((r for r in self.by_id[kind].values() if r['price'] is not None),
+                             key=lambda r: (r['price'], r['id']))
+            self.kinds[kind] = (ordered, [r['price'] for r in ordered])
+            groups = {}
+            for name, keys in SECONDARY_INDEXES.get(kind, {}).items():
+                buckets = groups.setdefault(name, {})
+                for r in ordered:
+                    for key in keys(r):
+                        buckets.setdefault(key, []).append(r)
+            self.indexes[kind] = {
+                name: {key: (rs, [r['price'] for r in rs]) for key, rs in buckets.items()}
+                for name, buckets in groups.items()
+            }
+
+    def _index_file(self, kind: str, table):
+        """Те же структуры поверх FileTable: в индексах – позиции строк файла."""
+        self.by_id[kind] = table.by_id
+        self.kinds[kind] = (table.priced, table.prices)
+        self.indexes[kind] = {name: table.group(keys) for name, keys in SECONDARY_INDEXES.get(kind, {}).items()}
+
+    def select(self, kind: str, index: str = None, key=None, max_price: int = None,
+               where=None, limit: int = None) -> list:
+        """Строки категории по возрастанию цены.
+
+        index/key – поиск во вторичном индексе (пустой key – без фильтра),
+        max_price – верхняя граница цены, where – дополнительный предикат,
+        limit – сколько строк вернуть.
+        """
+        if index and key:
+            rows, prices = self.indexes[kind][index].get(key, _EMPTY)
+        else:
+            rows, prices = self.kinds[kind]
+        hi = len(rows) if max_price is None else bisect_right(prices, max_price)
+        if where is None:
+            return rows[:hi if limit is None else min(hi, limit)]
+        result = []
+        for i in range(hi):
+            if where(rows[i]):
+                result.append(rows[i])
+                if limit is not None and len(result) >= limit:
+                    break
+        return result
+
+    def get(self, kind: str, component_id: int):
+        return self.by_id[kind].get(component_id)
+
+    def get_many(self, kind: str, ids) -> list:
+        """Строки по списку id в том же порядке (None – нет такого id)."""
+        rows = self.by_id[kind]
+        return [rows.get(i) for i in ids]
+
+    def resolve(self, ids: dict) -> dict:
+        """Компоненты сборки по id: {категория: id} -> {категория: строка или None}.
+
+        Ключи – категории или столбцы вида cpu_id (как в таблице builds).
+        """
+        build = {}
+        for kind in CATALOG_TABLES:
+            cid = ids.get(kind, ids.get(f"{kind}_id"))
+            build[kind] = self.by_id[kind].get(cid) if cid else None
+        return build
+
+    def candidates(self) -> dict:
+        """Все строки по категориям (для оптимизатора сборок)."""
+        return {kind: rows for kind, (rows, _) in self.kinds.items()}
+
+    def memo(self, key, factory):
+        """Производная структура, построенная один раз на версию каталога."""
+        if key not in self._memo:
+            with self._memo_lock:
+                if key not in self._memo:
+                    self._memo[key] = factory()
+        return self._memo[key]
+
+    def memoized(self, key):
+        """Уже построенная структура memo (None – ещё не строилась)."""
+        return self._memo.get(key)
+
+
+def snapshot_delta(old: CatalogSnapshot, new: CatalogSnapshot) -> dict:
+    """Изменившиеся позиции: категория -> {id: новая цена (None – удалена или без цены)}."""
+    delta = {}
+    for kind in CATALOG_TABLES:
+        before, after = old.by_id[kind], new.by_id[kind]
+        changed = {cid: row['price'] for cid, row in after.items() if before.get(cid) != row}
+        changed.update((cid, None) for cid in before.keys() - after.keys())
+        if changed:
+            delta[kind] = changed
+    return delta
+
+
+class Catalog:
+    """Текущий снимок каталога; перезагружается при смене версии.
+
+    path – файл снимка (см. catalog_file.py): если он хранит текущую версию,
+    каталог читается из него, а не из таблиц БД; иначе после чтения из БД
+    файл перезаписывается. Относительный путь – от каталога проекта.
+    """
+
+    def __init__(self, path: str = None):
+        self.snapshot = CatalogSnapshot(0, {})
+        self.path = Path(__file__).parent / path if path else None
+        self._lock = asyncio.Lock()
+
+    async def load(self, db):
+        """Прочитать каталог (из файла или таблиц БД) и атомарно подменить снимок."""
+        # catalog_file импортирует этот модуль
+        from catalog_file import open_catalog_file
+
+        async with self._lock:
+            version = await db.get_catalog_version()
+            database_id = await db.get_database_id()
+            loop = asyncio.get_running_loop()
+            rows = None
+            if self.path is not None:
+                rows = await loop.run_in_executor(None, open_catalog_file, self.path, version, database_id)
+            saved = rows is not None
+            if rows is None:
+                rows = await db.fetch_catalog_rows()
+                saved = await self._save(version, rows, database_id)
+            # Запросы, начавшиеся до подмены, дорабатывают со старым снимком
+            self.snapshot = CatalogSnapshot(version, rows, previous=self.snapshot,
+                                            path=self.path.as_posix() if saved else None, database_id=database_id)
+        return self.snapshot
+
+    async def export(self, db) -> bool:
+        """Записать файл снимка по текущим таблицам БД (для importer.py)."""
+        return await self._save(await db.get_catalog_version(), await db.fetch_catalog_rows(),
+                                await db.get_database_id())
+
+    async def _save(self, version: int, rows: dict, database_id: int) -> bool:
+        from catalog_file import write_catalog_file
+
+        if self.path is None:
+            return False
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, write_catalog_file, self.path, version, rows, database_id)
+        except OSError as e:
+            print(f"Catalog file {self.path} not written: {e}")
+            return False
+        return True
+
+    async def refresh(self, db) -> bool:
+        """Перезагрузить каталог, если версия в БД изменилась."""
+        if await db.get_catalog_version() == self.snapshot.version:
+            return False
+        await self.load(db)
+        return True
+
+    async def watch(self, db, interval: float):
+        """Фоновая задача: периодически проверять версию каталога."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await self.refresh(db):
+                    print(f"Catalog reloaded, version {self.snapshot.version}")
+            except Exception as e:
+                print(f"Catalog refresh failed: {e}")
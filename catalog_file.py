@@ -0,0 +1,312 @@
+# catalog_file.py – снимок каталога в бинарном файле для быстрого старта
+#
+# Файл пишет importer.py после импорта (и бот, если файла нет или он
+# устарел); при старте бот и процессы пула поиска открывают его через mmap
+# вместо чтения всех таблиц из БД, страницы файла общие для всех процессов.
+# Отображение остаётся открытым, пока жив снимок каталога: словарь строки
+# собирается из столбцов при первом обращении к ней (см. FileTable).
+# Формат – столбцы фиксированной ширины по категориям:
+#
+#   заголовок  MAGIC, версия каталога, id базы (catalog_meta.database_id),
+#              длина оглавления
+#   оглавление JSON: таблица строк и столбцы категорий (тип, смещение)
+#   данные     id и числа – int64, bool – int8, строки – uint32 номера в
+#              таблице строк (сокеты, форм-факторы и т. п. хранятся один раз)
+#
+# Строки категории лежат по возрастанию цены, позиции без цены – в конце.
+# Номер версии сам по себе не уникален (у демо-каталога и импортированного,
+# у SQLite и PostgreSQL может быть одна версия), поэтому файл принимается
+# только базой, id которой записан в заголовке.
+# Файл заменяется атомарно (os.replace): открытые отображения не меняются.
+import json
+import mmap
+import os
+import struct
+import tempfile
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+
+import numpy as np
+
+from catalog import CATALOG_COLUMNS, CATALOG_TABLES
+
+# Меняется вместе с форматом: файл старого формата просто перестраивается
+MAGIC = b"PCCAT\x00\x00\x02"
+HEADER = struct.Struct("<8sqqI")
+ALIGN = 8
+# Тип столбца -> (dtype, значение NULL)
+DTYPES = {
+    'int': ('<i8', np.iinfo(np.int64).min),
+    'bool': ('<i1', -1),
+    'str': ('<u4', np.iinfo(np.uint32).max),
+}
+TYPE_NAMES = {int: 'int', bool: 'bool', str: 'str'}
+# Права файла: mkstemp создаёт 0600, а читают файл и другие процессы
+FILE_MODE = 0o644
+
+
+def _align(n: int) -> int:
+    return -(-n // ALIGN) * ALIGN
+
+
+def _columns(kind: str) -> tuple:
+    """((столбец, тип), ...) строк категории в файле: id и столбцы CATALOG_COLUMNS."""
+    return (('id', 'int'),) + tuple((name, TYPE_NAMES[t]) for name, t, _ in CATALOG_COLUMNS[CATALOG_TABLES[kind]])
+
+
+def write_catalog_file(path, version: int, rows: dict, database_id: int) -> int:
+    """Записать строки каталога ({категория: [строка]}) версии version базы
+    database_id в path; вернуть размер файла."""
+    strings = {}
+    sections = []
+    tables = {}
+    offset = 0
+
+    def add(array: np.ndarray) -> int:
+        nonlocal offset
+        start = offset
+        sections.append((start, array.tobytes()))
+        offset = _align(start + array.nbytes)
+        return start
+
+    for kind in CATALOG_TABLES:
+        ordered = sorted(rows.get(kind, ()), key=lambda r: (r['price'] is None, r['price'] or 0, r['id']))
+        columns = []
+        for name, type_name in _columns(kind):
+            dtype, null = DTYPES[type_name]
+            values = [r.get(name) for r in ordered]
+            if type_name == 'str':
+                values = [null if v is None else strings.setdefault(v, len(strings)) for v in values]
+            else:
+                values = [null if v is None else int(v) for v in values]
+            columns.append((name, type_name, add(np.array(values, dtype=dtype))))
+        tables[kind] = {"rows": len(ordered), "columns": columns}
+
+    encoded = [s.encode("utf-8") for s in strings]
+    bounds = np.zeros(len(encoded) + 1, dtype='<u8')
+    bounds[1:] = np.cumsum([len(s) for s in encoded], dtype=np.int64)
+    directory = {"strings": [len(encoded), add(bounds), add(np.frombuffer(b"".join(encoded), dtype=np.uint8))],
+                 "tables": tables}
+    head = json.dumps(directory, separators=(",", ":")).encode("utf-8")
+    base = _align(HEADER.size + len(head))
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, version, database_id, len(head)) + head)
+            for start, data in sections:
+                f.seek(base + start)
+                f.write(data)
+            f.truncate(base + offset)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, FILE_MODE)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    return base + offset
+
+
+class CatalogFile:
+    """Файл каталога, отображённый в память только для чтения.
+
+    column() – столбец категории как массив numpy поверх страниц файла
+    (строковые столбцы – номера в strings), table() – строки категории
+    в виде FileTable. Отображение закрывается вместе с последней ссылкой
+    на файл, его таблицы и столбцы.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, self.version, self.database_id, size = HEADER.unpack_from(self._mmap)
+            if magic != MAGIC:
+                raise ValueError(f"{path}: not a catalog file of this format")
+            directory = json.loads(self._mmap[HEADER.size:HEADER.size + size])
+            self._base = _align(HEADER.size + size)
+            self.tables = directory["tables"]
+            for kind in CATALOG_TABLES:
+                if [tuple(c[:2]) for c in self.tables.get(kind, {}).get("columns", ())] != list(_columns(kind)):
+                    raise ValueError(f"{path}: columns of {kind} do not match the catalog schema")
+            count, bounds, blob = directory["strings"]
+            self._strings = (count, bounds, blob)
+            self._decoded = None
+            self._tables = {}
+        except BaseException:
+            self._mmap.close()
+            raise
+
+    def _array(self, dtype: str, count: int, start: int) -> np.ndarray:
+        return np.frombuffer(self._mmap, dtype=dtype, count=count, offset=self._base + start)
+
+    @property
+    def strings(self) -> list:
+        """Таблица строк (декодируется при первом обращении)."""
+        if self._decoded is None:
+            count, bounds, blob = self._strings
+            bounds = self._array('<u8', count + 1, bounds).tolist()
+            data = self._mmap[self._base + blob:self._base + blob + bounds[-1]]
+            self._decoded = [data[bounds[i]:bounds[i + 1]].decode("utf-8") for i in range(count)]
+        return self._decoded
+
+    def column(self, kind: str, name: str) -> np.ndarray:
+        """Столбец name категории kind без копирования (NULL – значение из DTYPES)."""
+        table = self.tables[kind]
+        for column, type_name, start in table["columns"]:
+            if column == name:
+                return self._array(DTYPES[type_name][0], table["rows"], start)
+        raise KeyError(f"{kind}.{name}")
+
+    def table(self, kind: str) -> 'FileTable':
+        if kind not in self._tables:
+            self._tables[kind] = FileTable(self, kind)
+        return self._tables[kind]
+
+    def close(self):
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # на столбцы ещё ссылаются: отображение закроется вместе с ними
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FileTable:
+    """Строки одной категории файла в том виде, в каком их возвращает
+    fetch_catalog_rows бэкенда БД, но без декодирования всей категории.
+
+    priced – строки с ценой по возрастанию цены (FileRows), prices – их
+    цены списком для bisect, by_id – все строки по id. Словарь строки
+    собирается при первом обращении и дальше отдаётся тот же.
+    """
+
+    def __init__(self, file: CatalogFile, kind: str):
+        self.file = file
+        self.columns = [(name, type_name, file.column(kind, name)) for name, type_name, _ in file.tables[kind]["columns"]]
+        count = file.tables[kind]["rows"]
+        price = file.column(kind, 'price')
+        # Строки без цены лежат в конце файла
+        self.prices = price[:int(np.count_nonzero(price != DTYPES['int'][1]))].tolist()
+        self.priced = FileRows(self, range(len(self.prices)))
+        self.positions = dict(zip(file.column(kind, 'id').tolist(), range(count)))
+        self.by_id = FileIds(self)
+        self._rows = [None] * count
+        self._values = {}  # столбец -> значения списком (для ключей индексов)
+
+    def _decode(self, type_name: str, value):
+        value = int(value)
+        if value == DTYPES[type_name][1]:
+            return None
+        if type_name == 'str':
+            return self.file.strings[value]
+        return bool(value) if type_name == 'bool' else value
+
+    def row(self, pos: int) -> dict:
+        row = self._rows[pos]
+        if row is None:
+            row = self._rows[pos] = {name: self._decode(type_name, column[pos])
+                                     for name, type_name, column in self.columns}
+        return row
+
+    def values(self, name: str) -> list:
+        """Все значения столбца name (None вместо NULL)."""
+        values = self._values.get(name)
+        if values is None:
+            for column, type_name, array in self.columns:
+                if column == name:
+                    values = self._values[name] = [self._decode(type_name, v) for v in array.tolist()]
+                    break
+            else:
+                raise KeyError(name)
+        return values
+
+    def group(self, keys) -> dict:
+        """Строки с ценой по ключам keys(строка) – как вторичные индексы catalog.py:
+        {ключ: (FileRows, цены)}. Функции ключей получают только нужные им столбцы."""
+        view = _RowView(self)
+        buckets = {}
+        for pos in range(len(self.prices)):
+            view.pos = pos
+            for key in keys(view):
+                buckets.setdefault(key, []).append(pos)
+        prices = self.prices
+        return {key: (FileRows(self, positions), [prices[p] for p in positions]) for key, positions in buckets.items()}
+
+
+class _RowView:
+    """Строка FileTable для функций ключей: значения столбцов без сборки словаря."""
+    __slots__ = ("table", "pos")
+
+    def __init__(self, table: FileTable):
+        self.table = table
+        self.pos = 0
+
+    def __getitem__(self, name: str):
+        return self.table.values(name)[self.pos]
+
+
+class FileRows(Sequence):
+    """Строки FileTable по списку позиций; срез – обычный список строк."""
+
+    def __init__(self, table: FileTable, positions):
+        self.table = table
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.table.row(pos) for pos in self.positions[i]]
+        return self.table.row(self.positions[i])
+
+    def __iter__(self):
+        row = self.table.row
+        return (row(pos) for pos in self.positions)
+
+
+class FileIds(Mapping):
+    """Все строки FileTable (и без цены) по id."""
+
+    def __init__(self, table: FileTable):
+        self.table = table
+
+    def __getitem__(self, cid):
+        return self.table.row(self.table.positions[cid])
+
+    def __contains__(self, cid):
+        return cid in self.table.positions
+
+    def __iter__(self):
+        return iter(self.table.positions)
+
+    def __len__(self):
+        return len(self.table.positions)
+
+
+def open_catalog_file(path, version: int = None, database_id: int = None):
+    """Открытый CatalogFile; None – файла нет, он повреждён или (если заданы
+    version и database_id) хранит другую версию каталога или каталог другой базы."""
+    try:
+        f = CatalogFile(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        print(f"Catalog file {path} ignored: {e}")
+        return None
+    if database_id is not None and f.database_id != database_id:
+        print(f"Catalog file {path} ignored: written for another database")
+        f.close()
+        return None
+    if version is not None and f.version != version:
+        f.close()
+        return None
+    return f
@@ -0,0 +1,173 @@
+# compat.py – матрица совместимости комплектующих на битовых масках
+from catalog import CATALOG_TABLES, FORM_FACTOR_ORDER, snapshot_delta
+
+
+def _form_factor(row: dict) -> int:
+    return FORM_FACTOR_ORDER.get(row.get('form_factor'), 0)
+
+
+# (выбранная категория, подбираемая категория) -> (ключ выбранной строки,
+# подходит ли строка подбираемой категории под этот ключ). Строки с
+# одинаковым ключом совместимы с одним и тем же набором, поэтому маски
+# хранятся по ключу, а не по строке.
+RELATIONS = {
+    ('cpu', 'motherboard'): (lambda cpu: cpu.get('socket'),
+                             lambda socket, mobo: mobo.get('socket') == socket),
+    ('motherboard', 'ram'): (lambda mobo: mobo.get('ram_type'),
+                             lambda ram_type, ram: ram.get('type') == ram_type),
+    ('motherboard', 'case'): (_form_factor,
+                              lambda size, case: _form_factor(case) >= size),
+    ('gpu', 'case'): (lambda gpu: gpu.get('length') or 0,
+                      lambda length, case: not case.get('gpu_max_length') or case['gpu_max_length'] >= length),
+    # Кулер без сокета – с универсальным креплением
+    ('cpu', 'cooler'): (lambda cpu: (cpu.get('socket'), cpu.get('tdp') or 0),
+                        lambda key, cooler: (not cooler.get('socket') or cooler['socket'] == key[0])
+                        and (cooler.get('tdp_capacity') or 0) >= key[1]),
+}
+
+
+def _bits(mask: int):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class CompatibilityMatrix:
+    """Совместимость пар категорий из RELATIONS в виде масок над строками.
+
+    Каждой строке категории (с ценой) выделен бит; для ключа выбранной
+    детали (сокет CPU, форм-фактор платы, длина GPU...) хранится маска
+    подходящих строк другой категории. Фильтр по нескольким выбранным
+    деталям – AND их масок. Маски по ключу считаются при первом запросе.
+
+    Матрица не изменяется после построения: updated() возвращает новую,
+    перенося маски и переставляя биты только изменившихся строк.
+    """
+
+    def __init__(self, candidates: dict):
+        self.slots = {}   # категория -> {id: бит}
+        self.rows = {}    # категория -> строки по номеру бита (None – свободен)
+        self.free = {}    # категория -> свободные биты
+        self.all = {}     # категория -> маска всех строк
+        # Пока биты идут в порядке цены, самая дешёвая строка маски – младший бит
+        self.ordered = {}
+        for kind in CATALOG_TABLES:
+            rows = sorted(candidates.get(kind, ()), key=lambda r: (r['price'], r['id']))
+            self.rows[kind] = rows
+            self.slots[kind] = {r['id']: i for i, r in enumerate(rows)}
+            self.free[kind] = []
+            self.all[kind] = (1 << len(rows)) - 1
+            self.ordered[kind] = True
+        self.masks = {relation: {} for relation in RELATIONS}
+
+    def mask(self, source: str, row: dict, target: str) -> int:
+        """Маска строк target, совместимых с выбранной строкой source."""
+        relation = (source, target)
+        key = RELATIONS[relation][0](row)
+        groups = self.masks[relation]
+        mask = groups.get(key)
+        if mask is None:
+            accepts = RELATIONS[relation][1]
+            mask = 0
+            for i, r in enumerate(self.rows[target]):
+                if r is not None and accepts(key, r):
+                    mask |= 1 << i
+            groups[key] = mask
+        return mask
+
+    def filter_key(self, target: str, chosen: dict) -> tuple:
+        """Ключи, от которых зависит выборка target при выбранных chosen (для кэша клавиатур)."""
+        return tuple(RELATIONS[(source, t)][0](chosen[source]) for source, t in RELATIONS
+                     if t == target and chosen.get(source))
+
+    def compatible(self, target: str, chosen: dict) -> int:
+        """Маска строк target, совместимых со всеми выбранными деталями chosen ({категория: строка})."""
+        mask = self.all[target]
+        for source, t in RELATIONS:
+            if t == target and chosen.get(source):
+                mask &= self.mask(source, chosen[source], target)
+        return mask
+
+    def select(self, target: str, chosen: dict, where=None) -> list:
+        """Совместимые строки target по возрастанию цены; where – дополнительный предикат."""
+        rows = self.rows[target]
+        found = [rows[i] for i in _bits(self.compatible(target, chosen))]
+        if where is not None:
+            found = [r for r in found if where(r)]
+        if not self.ordered[target]:
+            found.sort(key=lambda r: (r['price'], r['id']))
+        return found
+
+    def cheapest(self, target: str, mask: int):
+        """Самая дешёвая строка target из маски (None – маска пуста)."""
+        if not mask:
+            return None
+        rows = self.rows[target]
+        if self.ordered[target]:
+            return rows[(mask & -mask).bit_length() - 1]
+        return min((rows[i] for i in _bits(mask)), key=lambda r: (r['price'], r['id']))
+
+    def updated(self, delta: dict, snapshot) -> 'CompatibilityMatrix':
+        """Матрица для снимка snapshot по изменениям delta (см. snapshot_delta) относительно этой."""
+        new = object.__new__(CompatibilityMatrix)
+        new.slots = dict(self.slots)
+        new.rows = dict(self.rows)
+        new.free = dict(self.free)
+        new.all = dict(self.all)
+        new.ordered = dict(self.ordered)
+        new.masks = {relation: dict(groups) for relation, groups in self.masks.items()}
+        for kind, changed in delta.items():
+            slots = new.slots[kind] = dict(new.slots[kind])
+            rows = new.rows[kind] = list(new.rows[kind])
+            free = new.free[kind] = list(new.free[kind])
+            targets = [(relation, new.masks[relation], RELATIONS[relation][1])
+                       for relation in RELATIONS if relation[1] == kind]
+            for cid in changed:
+                # Старая версия строки снимается со всех масок, новая ставится заново
+                bit = slots.pop(cid, None)
+                if bit is not None:
+                    rows[bit] = None
+                    free.append(bit)
+                    clear = ~(1 << bit)
+                    new.all[kind] &= clear
+                    for _, groups, _ in targets:
+                        for key in groups:
+                            groups[key] &= clear
+                row = snapshot.by_id[kind].get(cid)
+                if row is None or row['price'] is None:
+                    continue
+                if free:
+                    bit = free.pop()
+                else:
+                    bit = len(rows)
+                    rows.append(None)
+                rows[bit] = row
+                slots[cid] = bit
+                new.ordered[kind] = False
+                new.all[kind] |= 1 << bit
+                for _, groups, accepts in targets:
+                    for key in groups:
+                        if accepts(key, row):
+                            groups[key] |= 1 << bit
+        return new
+
+    def stats(self) -> dict:
+        return {"rows": sum(len(s) for s in self.slots.values()),
+                "groups": sum(len(g) for g in self.masks.values())}
+
+
+def compatibility(snapshot) -> CompatibilityMatrix:
+    """Матрица совместимости снимка каталога (одна на версию).
+
+    Если матрица предыдущего снимка уже построена, новая получается из неё
+    по изменившимся строкам, а не перебором всего каталога.
+    """
+    def build():
+        previous, snapshot.previous = snapshot.previous, None
+        base = previous.memoized('compat') if previous is not None else None
+        if base is None:
+            return CompatibilityMatrix(snapshot.candidates())
+        return base.updated(snapshot_delta(previous, snapshot), snapshot)
+
+    return snapshot.memo('compat', build)
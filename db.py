@@ -1,183 +1,794 @@
 import aiosqlite
+import asyncio
+import hashlib
 import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 from pathlib import Path
 
-class Database:
-    def __init__(self, db_path: str = "bot.db"):
-        self.db_path = db_path
-        self.conn: aiosqlite.Connection | None = None
+from catalog import CATALOG_COLUMNS, CATALOG_KEYS, CATALOG_TABLES, Catalog
+from compat import compatibility
+from db_timing import TimedConnection
+from logsink import ActionLogSink, utcnow
+from lru import LRUCache
+from migrations import SCHEMA_VERSION_DDL, migrate
 
-    async def connect(self):
-        """Установить соединение с SQLite и создать таблицы, если нужно."""
-        # Ensure the database file is created in the project directory
-        base_dir = Path(__file__).parent
-        db_file = base_dir / self.db_path
-        db_file.parent.mkdir(parents=True, exist_ok=True)
+# Демонстрационный каталог: заливается в пустые таблицы, пока нет импорта
+# реальных прайсов.
+DEMO_CATALOG = {
+    'cpus': [
+        {'name': 'Intel Core i5-10400F', 'socket': 'LGA1200', 'cores': 6, 'tdp': 65, 'price': 12000},
+        {'name': 'Intel Core i3-10100',  'socket': 'LGA1200', 'cores': 4, 'tdp': 65, 'price': 8000},
+        {'name': 'AMD Ryzen 5 3600',     'socket': 'AM4',     'cores': 6, 'tdp': 65, 'price': 14000},
+        {'name': 'AMD Ryzen 7 3700X',    'socket': 'AM4',     'cores': 8, 'tdp': 95, 'price': 22000},
+    ],
+    'motherboards': [
+        {'name': 'MSI B460M PRO',       'socket': 'LGA1200', 'form_factor': 'mATX', 'ram_type': 'DDR4', 'max_ram': 64,  'price': 7000},
+        {'name': 'ASUS PRIME H410M',    'socket': 'LGA1200', 'form_factor': 'mATX', 'ram_type': 'DDR4', 'max_ram': 64,  'price': 5000},
+        {'name': 'Gigabyte B450M DS3H', 'socket': 'AM4',     'form_factor': 'mATX', 'ram_type': 'DDR4', 'max_ram': 64,  'price': 6000},
+        {'name': 'MSI B550-A PRO',      'socket': 'AM4',     'form_factor': 'ATX',  'ram_type': 'DDR4', 'max_ram': 128, 'price': 12000},
+    ],
+    'rams': [
+        {'name': '8GB DDR4-2400',  'type': 'DDR4', 'size': 8,  'speed': 2400, 'price': 2000},
+        {'name': '8GB DDR4-3200',  'type': 'DDR4', 'size': 8,  'speed': 3200, 'price': 2200},
+        {'name': '16GB DDR4-3200', 'type': 'DDR4', 'size': 16, 'speed': 3200, 'price': 4000},
+        {'name': '32GB DDR4-3600', 'type': 'DDR4', 'size': 32, 'speed': 3600, 'price': 8000},
+    ],
+    'gpus': [
+        {'name': 'NVIDIA GTX 1050 Ti',    'chipset': 'GP107', 'vram': 4, 'length': 229, 'tdp': 75,  'price': 9000},
+        {'name': 'NVIDIA GTX 1660 Super', 'chipset': 'TU116', 'vram': 6, 'length': 229, 'tdp': 125, 'price': 20000},
+        {'name': 'NVIDIA RTX 2060',       'chipset': 'TU106', 'vram': 6, 'length': 229, 'tdp': 160, 'price': 30000},
+    ],
+    'storages': [
+        {'name': '256GB SSD',    'type': 'SSD',  'capacity': 256,  'price': 3000},
+        {'name': '512GB SSD',    'type': 'SSD',  'capacity': 512,  'price': 6000},
+        {'name': '1TB NVMe SSD', 'type': 'NVMe', 'capacity': 1024, 'price': 10000},
+    ],
+    'psus': [
+        {'name': '450W PSU',        'power': 450, 'modular': False, 'price': 2000},
+        {'name': '550W Bronze PSU', 'power': 550, 'modular': False, 'price': 3500},
+        {'name': '650W Gold PSU',   'power': 650, 'modular': True,  'price': 5000},
+    ],
+    'cases': [
+        {'name': 'Budget Case',    'form_factor': 'mATX',     'gpu_max_length': 300, 'psu_form_factor': 'ATX', 'price': 1500},
+        {'name': 'Mid Tower Case', 'form_factor': 'ATX',      'gpu_max_length': 350, 'psu_form_factor': 'ATX', 'price': 2500},
+        {'name': 'Mini ITX Case',  'form_factor': 'Mini-ITX', 'gpu_max_length': 280, 'psu_form_factor': 'SFX', 'price': 2000},
+    ],
+    'coolers': [
+        {'name': 'Stock Cooler',           'socket': 'LGA1200', 'tdp_capacity': 65,  'price': 800},
+        {'name': 'Aftermarket Air Cooler', 'socket': 'LGA1200', 'tdp_capacity': 150, 'price': 3000},
+        {'name': 'Liquid Cooler 240mm',    'socket': 'LGA1200', 'tdp_capacity': 200, 'price': 6000},
+        {'name': 'Stock Cooler',           'socket': 'AM4',     'tdp_capacity': 65,  'price': 800},
+        {'name': 'Aftermarket Air Cooler', 'socket': 'AM4',     'tdp_capacity': 150, 'price': 3000},
+        {'name': 'Liquid Cooler 240mm',    'socket': 'AM4',     'tdp_capacity': 200, 'price': 6000},
+    ],
+}
 
-        self.conn = await aiosqlite.connect(db_file.as_posix())
-        await self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_id INTEGER UNIQUE,
-                username TEXT
-            );
-        """)
-        await self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                action TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        await self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS builds (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                cpu_id INTEGER,
-                motherboard_id INTEGER,
-                ram_id INTEGER,
-                gpu_id INTEGER,
-                storage_id INTEGER,
-                case_id INTEGER,
-                psu_id INTEGER,
-                cooler_id INTEGER,
-                total_price INTEGER,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        await self.conn.commit()
-        print("SQLite connected and tables ensured")
+# Прагмы production-режима: WAL позволяет читателям работать параллельно
+# с писателем, synchronous=NORMAL в WAL не теряет целостность при сбое
+# процесса и убирает fsync на каждый commit.
+WRITER_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+# Сколько скомпилированных запросов держит каждое соединение (sqlite3
+# переиспользует их по тексту SQL, поэтому горячие запросы – константы)
+STATEMENT_CACHE_SIZE = 256
 
-    async def add_user(self, telegram_id: int, username: str):
-        """Добавить пользователя в БД (если не существует)."""
-        await self.conn.execute(
-            "INSERT OR IGNORE INTO users (telegram_id, username) VALUES (?, ?)",
-            (telegram_id, username)
-        )
-        await self.conn.commit()
+SQL_GET_USER_ID = "SELECT id FROM users WHERE telegram_id = ?"
+# Одним запросом: вставка или обновление имени и id пользователя в ответ
+SQL_UPSERT_USER = """
+    INSERT INTO users (telegram_id, username) VALUES (?, ?)
+    ON CONFLICT (telegram_id) DO UPDATE SET username = excluded.username
+    RETURNING id
+"""
+SQL_FSM_LOAD = "SELECT state, data, updated_at FROM fsm_sessions WHERE key = ?"
+SQL_FSM_SAVE = """
+    INSERT INTO fsm_sessions (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT (key) DO UPDATE SET state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+"""
+SQL_CATALOG_VERSION = "SELECT value FROM catalog_meta WHERE key = 'version'"
+SQL_DATABASE_ID = "SELECT value FROM catalog_meta WHERE key = 'database_id'"
+# Строки версии нет, пока в каталог ничего не импортировали
+SQL_BUMP_CATALOG_VERSION = """
+    INSERT INTO catalog_meta (key, value) VALUES ('version', 1)
+    ON CONFLICT (key) DO UPDATE SET value = catalog_meta.value + 1
+    RETURNING value
+"""
 
-    async def log_action(self, user_id: int, action: str):
-        """Логирование действия пользователя."""
-        await self.conn.execute(
-            "INSERT INTO logs (user_id, action) VALUES (?, ?)",
-            (user_id, action)
+# Свёртки логов (см. rollups.py): время в SQLite – текст "YYYY-MM-DD HH:MM:SS"
+SQL_ROLLUP_HORIZON = "SELECT MAX(bucket) FROM log_rollups WHERE period = 'hour'"
+SQL_FIRST_LOG = "SELECT MIN(timestamp) FROM logs WHERE timestamp >= ?"
+SQL_LOG_COUNTS = """
+    SELECT strftime('%Y-%m-%d %H:00:00', timestamp) AS hour, action, COUNT(*) FROM logs
+    WHERE timestamp >= ? AND timestamp < ? GROUP BY hour, action
+"""
+SQL_ROLLUP_CLEAR = "DELETE FROM log_rollups WHERE period = 'hour' AND bucket >= ? AND bucket < ?"
+SQL_ROLLUP_HOUR = """
+    INSERT INTO log_rollups (period, bucket, action, usage, events) VALUES ('hour', ?, ?, ?, ?)
+    ON CONFLICT (period, bucket, action, usage) DO UPDATE SET events = excluded.events
+"""
+# Сутки – сумма своих часов
+SQL_ROLLUP_DAYS = """
+    INSERT INTO log_rollups (period, bucket, action, usage, events)
+    SELECT 'day', substr(bucket, 1, 10) || ' 00:00:00', action, usage, SUM(events) FROM log_rollups
+    WHERE period = 'hour' AND bucket >= ? AND bucket < ? GROUP BY 2, 3, 4
+    ON CONFLICT (period, bucket, action, usage) DO UPDATE SET events = excluded.events
+"""
+SQL_FETCH_ROLLUPS = """
+    SELECT bucket, action, usage, events FROM log_rollups
+    WHERE period = ? AND bucket >= ? AND bucket < ? ORDER BY bucket
+"""
+
+# Сохранённые сборки хранятся по содержимому: конфигурация (id компонентов) –
+# одна строка build_configs под хэшем id, сохранение пользователя – ссылка
+# (user_id, build_hash, total_price, created_at) в user_builds: сумма своя у
+# каждого сохранения, цены каталога между ними меняются
+BUILD_ID_COLUMNS = tuple(f"{kind}_id" for kind in CATALOG_TABLES)
+USER_BUILDS_FROM = " FROM user_builds b JOIN build_configs c ON c.build_hash = b.build_hash "
+# Ссылки пользователя вместе с конфигурацией – в виде строк прежней таблицы builds
+USER_BUILDS_SELECT = (
+    "SELECT b.id, b.user_id, b.build_hash, "
+    + ", ".join(f"c.{col}" for col in BUILD_ID_COLUMNS)
+    + ", b.total_price, b.created_at" + USER_BUILDS_FROM
+)
+SQL_GET_BUILDS = f"{USER_BUILDS_SELECT} WHERE b.user_id = ? ORDER BY b.created_at DESC, b.id DESC"
+SQL_SAVE_BUILD_CONFIG = (
+    f"INSERT INTO build_configs (build_hash, {', '.join(BUILD_ID_COLUMNS)}, total_price) "
+    f"VALUES ({', '.join('?' * (len(BUILD_ID_COLUMNS) + 2))}) ON CONFLICT (build_hash) DO NOTHING"
+)
+SQL_SAVE_USER_BUILD = "INSERT INTO user_builds (user_id, build_hash, total_price) VALUES (?, ?, ?)"
+SQL_BUILD_SAVERS = "SELECT COUNT(DISTINCT user_id) FROM user_builds WHERE build_hash = ?"
+
+# Сборка вместе с именами и ценами компонентов: один LEFT JOIN на категорию
+BUILD_JOIN_SELECT = (
+    "SELECT b.id, b.user_id, b.build_hash, b.total_price, b.created_at, "
+    + ", ".join(f"c.{kind}_id, j_{kind}.name AS {kind}_name, j_{kind}.price AS {kind}_price"
+                for kind in CATALOG_TABLES)
+    + USER_BUILDS_FROM
+    + " ".join(f"LEFT JOIN {table} j_{kind} ON j_{kind}.id = c.{kind}_id"
+               for kind, table in CATALOG_TABLES.items())
+)
+# Направления листания: older – к более старым сборкам, newer – к новым
+PAGE_DIRECTIONS = ("first", "older", "newer")
+# Сколько хэшей записанных конфигураций помнить (чтобы не писать их повторно)
+KNOWN_BUILDS_CACHE_SIZE = 100000
+
+
+def builds_page_sql(direction: str, mark) -> str:
+    """Страница сборок пользователя по ключу (created_at, id).
+
+    Курсор – id крайней сборки предыдущей страницы; его (created_at, id)
+    берутся подзапросом, поэтому страница – один запрос по индексу
+    независимо от длины истории. mark(n) – плейсхолдер n-го параметра,
+    параметры: user_id, [id курсора], limit.
+    """
+    sql = f"{BUILD_JOIN_SELECT} WHERE b.user_id = {mark(1)}"
+    n = 2
+    if direction != "first":
+        op = "<" if direction == "older" else ">"
+        sql += f" AND (b.created_at, b.id) {op} (SELECT created_at, id FROM user_builds WHERE id = {mark(2)})"
+        n = 3
+    order = "ASC" if direction == "newer" else "DESC"
+    return f"{sql} ORDER BY b.created_at {order}, b.id {order} LIMIT {mark(n)}"
+
+
+SQL_BUILDS_PAGE = {d: builds_page_sql(d, lambda n: "?") for d in PAGE_DIRECTIONS}
+SQL_GET_BUILD = f"{BUILD_JOIN_SELECT} WHERE b.id = ? AND b.user_id = ?"
+SQL_LOAD_BREAKPOINTS = """
+    SELECT budget_from, cpu_id, motherboard_id, ram_id, gpu_id,
+           storage_id, psu_id, case_id, cooler_id, total_price
+    FROM budget_breakpoints
+    WHERE usage = ? AND catalog_version = ?
+    ORDER BY budget_from
+"""
+
+# Горячие запросы с примерными параметрами: ни один не должен читать
+# таблицу целиком (см. check_query_plans и migrations.py --check-plans)
+HOT_QUERIES = {
+    "user_id": (SQL_GET_USER_ID, (1,)),
+    "builds": (SQL_GET_BUILDS, (1,)),
+    "builds_page_first": (SQL_BUILDS_PAGE["first"], (1, 6)),
+    "builds_page_older": (SQL_BUILDS_PAGE["older"], (1, 1, 6)),
+    "builds_page_newer": (SQL_BUILDS_PAGE["newer"], (1, 1, 6)),
+    "build": (SQL_GET_BUILD, (1, 1)),
+    "build_savers": (SQL_BUILD_SAVERS, ("",)),
+    "fsm_load": (SQL_FSM_LOAD, ("",)),
+    "catalog_version": (SQL_CATALOG_VERSION, ()),
+    "breakpoints": (SQL_LOAD_BREAKPOINTS, ("", 1)),
+    "first_log": (SQL_FIRST_LOG, ("",)),
+    "log_counts": (SQL_LOG_COUNTS, ("", "")),
+    "rollups": (SQL_FETCH_ROLLUPS, ("day", "", "")),
+}
+
+
+def catalog_import_sql(table: str, stage: str, mark, distinct: str = "IS NOT") -> tuple:
+    """Запросы переноса пачки прайса из промежуточной таблицы stage в table.
+
+    Первый пишет в price_history изменения цен уже известных позиций
+    (параметры: версия каталога, время), второй – upsert по естественному
+    ключу, который не трогает строки без изменений. distinct – оператор
+    «различаются с учётом NULL» в диалекте БД.
+    """
+    cols = [c for c, _, _ in CATALOG_COLUMNS[table]]
+    key = CATALOG_KEYS[table]
+    history = (
+        f"INSERT INTO price_history (item_table, item_id, old_price, new_price, catalog_version, changed_at) "
+        f"SELECT '{table}', t.id, t.price, s.price, {mark(1)}, {mark(2)} FROM {stage} s "
+        f"JOIN {table} t ON " + " AND ".join(f"t.{c} = s.{c}" for c in key)
+        + f" WHERE t.price {distinct} s.price"
+    )
+    updated = [c for c in cols if c not in key]
+    upsert = (
+        f"INSERT INTO {table} ({', '.join(cols)}) SELECT {', '.join(cols)} FROM {stage} WHERE true "
+        f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET "
+        + ", ".join(f"{c} = excluded.{c}" for c in updated)
+        + f" WHERE ({', '.join(f'{table}.{c}' for c in updated)}) {distinct} "
+        + f"({', '.join(f'excluded.{c}' for c in updated)})"
+    )
+    return history, upsert
+
+
+def sql_time(ts: datetime) -> str:
+    """Время в текстовом виде, в котором SQLite хранит DATETIME."""
+    return ts.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def build_hash(build: dict) -> str:
+    """Ключ конфигурации сборки: хэш id компонентов по категориям (нет компонента – 0)."""
+    key = ",".join(str(build.get(col) or 0) for col in BUILD_ID_COLUMNS)
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def legacy_builds(rows: list) -> tuple:
+    """Строки старой таблицы builds -> (строки build_configs, ссылки user_builds с прежними id).
+
+    Из одинаковых сборок в конфигурацию попадает сумма самой ранней.
+    """
+    configs, links = {}, []
+    for row in sorted(rows, key=lambda r: r['id']):
+        key = build_hash(row)
+        configs.setdefault(key, (key, *(row[col] for col in BUILD_ID_COLUMNS), row['total_price']))
+        links.append((row['id'], row['user_id'], key, row['created_at']))
+    return list(configs.values()), links
+
+
+def build_record(row: dict) -> dict:
+    """Строка JOIN-запроса -> сборка с components: {категория: {id, name, price} или None}."""
+    rec = {'id': row['id'], 'user_id': row['user_id'], 'hash': row['build_hash'],
+           'total_price': row['total_price'], 'created_at': row['created_at'], 'components': {}}
+    for kind in CATALOG_TABLES:
+        cid = row[f"{kind}_id"]
+        rec['components'][kind] = (
+            {'id': cid, 'name': row[f"{kind}_name"], 'price': row[f"{kind}_price"]} if cid else None
         )
-        await self.conn.commit()
+    return rec
+
+class BaseDatabase:
+    """Общая часть бэкендов БД: каталог в памяти и отложенный лог.
+
+    Бэкенд реализует connect/close, _upsert_user, _fetch_user_id,
+    insert_actions, get_catalog_version, get_database_id, fetch_catalog_rows,
+    import_catalog_chunk/bump_catalog_version (для importer.py), _insert_build,
+    count_build_savers, get_builds, _fetch_builds_page, _fetch_build, save_breakpoints/
+    load_breakpoints, fsm_* (для fsm_storage.py), свёртки логов для rollups.py
+    (get_rollup_horizon, get_first_log_time, fetch_log_counts, save_rollups,
+    purge_logs, fetch_rollups) и миграции для migrations.py (get_schema_version,
+    apply_migration, migrate_legacy_builds); dialect – ключ скриптов миграций,
+    hot_queries и _full_scans – для check_query_plans.
+    """
+
+    def __init__(self, user_cache_size: int = 10000, user_cache_ttl: float = 3600, catalog_path: str = None):
+        self.catalog = Catalog(catalog_path)
+        self.log_sink: ActionLogSink | None = None
+        # telegram_id -> users.id: личность пользователя читается из БД
+        # один раз, а не на каждое нажатие кнопки
+        self.user_cache = LRUCache(user_cache_size, user_cache_ttl)
+        # Хэши конфигураций, уже записанных в build_configs: повторное
+        # сохранение популярной сборки пишет только ссылку пользователя
+        self.known_builds = LRUCache(KNOWN_BUILDS_CACHE_SIZE)
+        # on_statement(имя запроса, секунды): если задан до connect(), каждый
+        # запрос к БД замеряется (metrics.py, db_timing.py)
+        self.on_statement = None
+
+    async def add_user(self, telegram_id: int, username: str) -> int:
+        """Зарегистрировать пользователя (или обновить имя) и вернуть его id."""
+        user_id = await self._upsert_user(telegram_id, username)
+        self.user_cache.put(telegram_id, user_id)
+        return user_id
 
     async def get_user_id(self, telegram_id: int):
         """Получить внутренний id пользователя по Telegram ID."""
-        cursor = await self.conn.execute(
-            "SELECT id FROM users WHERE telegram_id = ?",
-            (telegram_id,)
-        )
-        row = await cursor.fetchone()
-        return row[0] if row else None
+        user_id = self.user_cache.get(telegram_id)
+        if user_id is None:
+            user_id = await self._fetch_user_id(telegram_id)
+            # Незарегистрированных не кэшируем: /start должен их увидеть
+            if user_id is not None:
+                self.user_cache.put(telegram_id, user_id)
+        return user_id
+
+    async def log_action(self, user_id: int, action: str):
+        """Логирование действия пользователя."""
+        if self.log_sink:
+            # Запись уйдёт в БД пачкой из фоновой задачи
+            await self.log_sink.put(user_id, action)
+            return
+        await self.insert_actions([(user_id, action, utcnow())])
+
+    def start_log_sink(self, **options):
+        """Включить отложенную пакетную запись log_action (см. logsink.py)."""
+        self.log_sink = ActionLogSink(self.insert_actions, **options)
+        self.log_sink.start()
+
+    async def close(self):
+        """Дописать отложенные логи."""
+        if self.log_sink:
+            await self.log_sink.close()
+            self.log_sink = None
+
+    async def save_build(self, user_id: int, build: dict) -> str:
+        """Сохранить сборку ({категория}_id, total_price) для пользователя; возвращает её хэш."""
+        key = build_hash(build)
+        config = None if self.known_builds.get(key) else (key, *(build.get(col) for col in BUILD_ID_COLUMNS),
+                                                          build.get('total_price'))
+        await self._insert_build(user_id, key, build.get('total_price'), config)
+        self.known_builds.put(key, True)
+        return key
+
+    async def check_query_plans(self) -> dict:
+        """{горячий запрос: таблицы, которые он читает целиком}; пусто – все идут по индексам."""
+        found = {}
+        for name, (sql, params) in self.hot_queries.items():
+            scans = await self._full_scans(sql, params)
+            if scans:
+                found[name] = scans
+        return found
 
-    # --- Ниже добавлены методы-заглушки ---
+    async def get_builds_page(self, user_id: int, direction: str = "first",
+                              cursor: int = None, limit: int = 5) -> dict:
+        """Страница сохранённых сборок, от новых к старым.
+
+        direction – first, older (после сборки cursor) или newer (перед ней).
+        Возвращает {'builds': [...], 'has_older': bool, 'has_newer': bool}.
+        """
+        if direction not in PAGE_DIRECTIONS:
+            raise ValueError(f"Unknown page direction: {direction}")
+        if cursor is None:
+            direction = "first"
+        # Лишняя строка показывает, есть ли что-то дальше в этом направлении
+        rows = await self._fetch_builds_page(user_id, direction, cursor, limit + 1)
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if direction == "newer":
+            rows.reverse()
+        # Сборка-курсор сама лежит с другой стороны страницы
+        return {
+            'builds': [build_record(r) for r in rows],
+            'has_older': more if direction != "newer" else True,
+            'has_newer': more if direction == "newer" else direction == "older",
+        }
+
+    async def get_build(self, user_id: int, build_id: int):
+        """Сборка пользователя с компонентами (None – нет такой или чужая)."""
+        row = await self._fetch_build(user_id, build_id)
+        return build_record(row) if row else None
+
+    # --- Каталог комплектующих (из памяти, см. catalog.py) ---
+
+    async def get_component(self, kind: str, component_id: int):
+        """Компонент категории kind по первичному ключу (None – нет такого)."""
+        return self.catalog.snapshot.get(kind, component_id)
+
+    async def get_components(self, kind: str, ids) -> list:
+        """Компоненты категории по списку id, в том же порядке."""
+        return self.catalog.snapshot.get_many(kind, ids)
+
+    async def get_build_components(self, ids: dict) -> dict:
+        """Все компоненты сборки за одно обращение.
+
+        ids – {категория: id} или строка таблицы builds (cpu_id, ...).
+        """
+        return self.catalog.snapshot.resolve(ids)
 
     async def select_cpus(self, usage: str = None, max_price: int = None):
-        """Возвращает тестовый список CPU."""
-        return [
-            {'id': 1, 'name': 'Intel Core i5-10400F', 'price': 12000, 'socket': 'LGA1200', 'tdp': 65},
-            {'id': 2, 'name': 'Intel Core i3-10100',  'price': 8000,  'socket': 'LGA1200', 'tdp': 65},
-            {'id': 3, 'name': 'AMD Ryzen 5 3600',    'price': 14000, 'socket': 'AM4',      'tdp': 65},
-            {'id': 4, 'name': 'AMD Ryzen 7 3700X',   'price': 22000, 'socket': 'AM4',      'tdp': 95},
-        ]
+        """Список CPU по возрастанию цены."""
+        return self.catalog.snapshot.select('cpu', max_price=max_price)
 
     async def select_motherboards(self, socket: str = None, max_price: int = None):
-        """Возвращает тестовый список материнских плат."""
-        options = [
-            {'id': 1, 'name': 'MSI B460M PRO', 'price': 7000, 'socket': 'LGA1200', 'ram_type': 'DDR4', 'form_factor': 'mATX'},
-            {'id': 2, 'name': 'ASUS PRIME H410M', 'price': 5000, 'socket': 'LGA1200', 'ram_type': 'DDR4', 'form_factor': 'mATX'},
-        ]
-        if socket:
-            return [m for m in options if m['socket'] == socket]
-        return options
+        """Материнские платы под сокет."""
+        return self.catalog.snapshot.select('motherboard', 'socket', socket, max_price)
 
     async def select_rams(self, ram_type: str = None, needed_size: int = None, max_price: int = None):
-        """Возвращает тестовый список RAM."""
-        return [
-            {'id': 1, 'name': '8GB DDR4-2400',  'price': 2000, 'type': 'DDR4'},
-            {'id': 2, 'name': '8GB DDR4-3200',  'price': 2200, 'type': 'DDR4'},
-            {'id': 3, 'name': '16GB DDR4-3200', 'price': 4000, 'type': 'DDR4'},
-            {'id': 4, 'name': '32GB DDR4-3600', 'price': 8000, 'type': 'DDR4'},
-        ]
+        """Модули ОЗУ заданного типа и объёма не меньше needed_size."""
+        where = (lambda r: (r['size'] or 0) >= needed_size) if needed_size else None
+        return self.catalog.snapshot.select('ram', 'ram_type', ram_type, max_price, where)
 
     async def select_gpus(self, max_price: int = None):
-        """Возвращает тестовый список GPU."""
-        return [
-            {'id': 1, 'name': 'NVIDIA GTX 1050 Ti',    'price': 9000,  'tdp': 75},
-            {'id': 2, 'name': 'NVIDIA GTX 1660 Super', 'price': 20000, 'tdp': 125},
-            {'id': 3, 'name': 'NVIDIA RTX 2060',       'price': 30000, 'tdp': 160},
-        ]
+        """Список видеокарт по возрастанию цены."""
+        return self.catalog.snapshot.select('gpu', max_price=max_price)
 
     async def select_storages(self, min_capacity: int = None, max_price: int = None):
-        """Возвращает тестовый список накопителей."""
-        return [
-            {'id': 1, 'name': '256GB SSD',     'price': 3000,  'capacity': 256},
-            {'id': 2, 'name': '512GB SSD',     'price': 6000,  'capacity': 512},
-            {'id': 3, 'name': '1TB NVMe SSD',  'price': 10000, 'capacity': 1024},
-        ]
+        """Накопители объёмом не меньше min_capacity."""
+        where = (lambda s: (s['capacity'] or 0) >= min_capacity) if min_capacity else None
+        return self.catalog.snapshot.select('storage', max_price=max_price, where=where)
 
     async def select_cases(self, form_factor: str = None, gpu_length: int = None, max_price: int = None):
-        """Возвращает тестовый список корпусов."""
-        return [
-            {'id': 1, 'name': 'Budget Case',         'price': 1500, 'form_factor': 'mATX',    'gpu_max_length': 300},
-            {'id': 2, 'name': 'Mid Tower Case',      'price': 2500, 'form_factor': 'ATX',     'gpu_max_length': 350},
-            {'id': 3, 'name': 'Mini ITX Case',       'price': 2000, 'form_factor': 'Mini-ITX','gpu_max_length': 280},
-        ]
+        """Корпуса, вмещающие плату form_factor и видеокарту длиной gpu_length."""
+        where = (lambda c: not c['gpu_max_length'] or c['gpu_max_length'] >= gpu_length) if gpu_length else None
+        return self.catalog.snapshot.select('case', 'form_factor', form_factor, max_price, where)
 
     async def select_psus(self, required_power: int = None, max_price: int = None):
-        """Возвращает тестовый список блоков питания."""
-        return [
-            {'id': 1, 'name': '450W PSU',          'price': 2000, 'power': 450},
-            {'id': 2, 'name': '550W Bronze PSU',   'price': 3500, 'power': 550},
-            {'id': 3, 'name': '650W Gold PSU',     'price': 5000, 'power': 650},
-        ]
+        """Блоки питания мощностью не меньше required_power."""
+        where = (lambda p: p['power'] >= required_power) if required_power else None
+        return self.catalog.snapshot.select('psu', max_price=max_price, where=where)
+
+    async def select_compatible(self, kind: str, chosen: dict, where=None):
+        """Компоненты kind, совместимые со всеми выбранными chosen ({категория: строка}), по возрастанию цены."""
+        return compatibility(self.catalog.snapshot).select(kind, chosen, where)
 
     async def select_coolers(self, socket: str = None, required_tdp: int = None, max_price: int = None):
-        """Возвращает тестовый список кулеров."""
-        return [
-            {'id': 1, 'name': 'Stock Cooler',               'price': 800,  'socket': socket, 'tdp_capacity': 65},
-            {'id': 2, 'name': 'Aftermarket Air Cooler',     'price': 3000, 'socket': socket, 'tdp_capacity': 150},
-            {'id': 3, 'name': 'Liquid Cooler 240mm',        'price': 6000, 'socket': socket, 'tdp_capacity': 200},
-        ]
-
-    async def save_build(self, user_id: int, build: dict):
-        """Сохранить сборку в БД."""
-        await self.conn.execute(
-            """
-            INSERT INTO builds
-            (user_id, cpu_id, motherboard_id, ram_id, gpu_id,
-             storage_id, case_id, psu_id, cooler_id, total_price)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                user_id,
-                build.get('cpu_id'),
-                build.get('motherboard_id'),
-                build.get('ram_id'),
-                build.get('gpu_id'),
-                build.get('storage_id'),
-                build.get('case_id'),
-                build.get('psu_id'),
-                build.get('cooler_id'),
-                build.get('total_price'),
-            )
+        """Кулеры под сокет, рассчитанные на TDP не меньше required_tdp."""
+        where = (lambda c: (c['tdp_capacity'] or 0) >= required_tdp) if required_tdp else None
+        return self.catalog.snapshot.select('cooler', 'socket', socket, max_price, where)
+
+
+class Database(BaseDatabase):
+    """SQLite-бэкенд."""
+
+    dialect = "sqlite"
+    hot_queries = HOT_QUERIES
+
+    def __init__(self, db_path: str = "bot.db", readers: int = 4,
+                 cache_size_kb: int = 16384, mmap_size_mb: int = 256, **options):
+        super().__init__(**options)
+        self.db_path = db_path
+        self.conn: aiosqlite.Connection | None = None  # единственный писатель
+        self.readers = readers
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size_mb = mmap_size_mb
+        self._reader_pool: asyncio.Queue | None = None
+        self._reader_conns: list = []
+        self._write_lock = asyncio.Lock()
+
+    async def connect(self, load_catalog: bool = True, seed_demo: bool = False):
+        """Установить соединение с SQLite и создать таблицы, если нужно.
+
+        load_catalog=False – не читать каталог в память (для импорта прайсов),
+        seed_demo=True – залить DEMO_CATALOG в пустой каталог (только для разработки).
+        """
+        # Ensure the database file is created in the project directory
+        base_dir = Path(__file__).parent
+        db_file = base_dir / self.db_path
+        db_file.parent.mkdir(parents=True, exist_ok=True)
+
+        self.conn = self._timed(await aiosqlite.connect(db_file.as_posix(), cached_statements=STATEMENT_CACHE_SIZE))
+        for pragma in WRITER_PRAGMAS + self._cache_pragmas():
+            await self.conn.execute(pragma)
+        await migrate(self)
+        if seed_demo:
+            await self._seed_demo_catalog()
+        await self._open_readers(db_file)
+        if load_catalog:
+            await self.catalog.load(self)
+        print(f"SQLite connected (WAL, {self.readers} readers), schema up to date")
+
+    def _timed(self, conn):
+        return TimedConnection(conn, self.on_statement) if self.on_statement else conn
+
+    def _cache_pragmas(self) -> tuple:
+        return (
+            f"PRAGMA cache_size = -{self.cache_size_kb}",
+            f"PRAGMA mmap_size = {self.mmap_size_mb * 1024 * 1024}",
         )
+
+    async def _open_readers(self, db_file: Path):
+        """Открыть пул соединений только для чтения.
+
+        Каждое соединение aiosqlite работает в своём потоке, поэтому чтения
+        из пула выполняются параллельно и не ждут записей писателя.
+        """
+        self._reader_pool = asyncio.Queue()
+        uri = f"{db_file.resolve().as_uri()}?mode=ro"
+        for _ in range(self.readers):
+            conn = self._timed(await aiosqlite.connect(uri, uri=True, cached_statements=STATEMENT_CACHE_SIZE))
+            for pragma in ("PRAGMA query_only = ON", "PRAGMA busy_timeout = 5000") + self._cache_pragmas():
+                await conn.execute(pragma)
+            self._reader_conns.append(conn)
+            self._reader_pool.put_nowait(conn)
+
+    @asynccontextmanager
+    async def _writer(self):
+        """Транзакция на соединении-писателе.
+
+        Корутины делят одно соединение, поэтому записи идут по очереди:
+        иначе commit одной попадает посреди запроса другой.
+        """
+        async with self._write_lock:
+            try:
+                yield self.conn
+            except BaseException:
+                await self.conn.rollback()
+                raise
+            await self.conn.commit()
+
+    @asynccontextmanager
+    async def _reader(self):
+        """Взять соединение для чтения из пула (без пула – писатель)."""
+        if not self._reader_pool:
+            yield self.conn
+            return
+        conn = await self._reader_pool.get()
+        try:
+            yield conn
+        finally:
+            self._reader_pool.put_nowait(conn)
+
+    async def get_schema_version(self) -> int:
+        """Последняя применённая миграция (0 – ни одной)."""
+        await self.conn.execute(SCHEMA_VERSION_DDL)
         await self.conn.commit()
+        cursor = await self.conn.execute("SELECT MAX(version) FROM schema_version")
+        return (await cursor.fetchone())[0] or 0
+
+    async def apply_migration(self, version: int, description: str, script: str) -> bool:
+        """Выполнить скрипт миграции и записать её версию одной транзакцией."""
+        async with self._write_lock:
+            try:
+                # executescript сам завершает открытую транзакцию, поэтому BEGIN – в скрипте
+                await self.conn.executescript(f"BEGIN;\n{script}")
+                await self.conn.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                                        (version, description))
+            except BaseException:
+                await self.conn.rollback()
+                raise
+            await self.conn.commit()
+        return True
+
+    async def _full_scans(self, sql: str, params: tuple) -> list:
+        async with self._reader() as conn:
+            cursor = await conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            details = [row[3] for row in await cursor.fetchall()]
+        return [d[len("SCAN "):] for d in details if d.startswith("SCAN ") and "CONSTANT ROW" not in d]
+
+    async def migrate_legacy_builds(self):
+        """Перенести сборки из старой таблицы builds в build_configs/user_builds и удалить её."""
+        cursor = await self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'builds'")
+        if not await cursor.fetchone():
+            return
+        cursor = await self.conn.execute("SELECT * FROM builds")
+        cols = [desc[0] for desc in cursor.description]
+        configs, links = legacy_builds([dict(zip(cols, row)) for row in await cursor.fetchall()])
+        await self.conn.executemany(SQL_SAVE_BUILD_CONFIG, configs)
+        await self.conn.executemany(
+            "INSERT INTO user_builds (id, user_id, build_hash, created_at) VALUES (?, ?, ?, ?)", links
+        )
+        await self.conn.execute("DROP TABLE builds")
+        await self.conn.commit()
+        print(f"Migrated {len(links)} saved builds into {len(configs)} build configurations")
+
+    async def _seed_demo_catalog(self):
+        """Залить DEMO_CATALOG, если каталог ещё пуст."""
+        cursor = await self.conn.execute("SELECT COUNT(*) FROM cpus")
+        if (await cursor.fetchone())[0]:
+            return
+        for table, rows in DEMO_CATALOG.items():
+            cols = list(rows[0])
+            await self.conn.executemany(
+                f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                [tuple(r[c] for c in cols) for r in rows]
+            )
+        await self.conn.execute("INSERT OR REPLACE INTO catalog_meta (key, value) VALUES ('version', 1)")
+        await self.conn.commit()
+
+    async def _upsert_user(self, telegram_id: int, username: str) -> int:
+        async with self._writer() as conn:
+            # fetchall дочитывает RETURNING до конца, иначе запрос не завершён к commit
+            rows = await conn.execute_fetchall(SQL_UPSERT_USER, (telegram_id, username))
+        return rows[0][0]
+
+    async def insert_actions(self, events: list):
+        """Записать пачку событий (user_id, action, timestamp) одной транзакцией."""
+        async with self._writer() as conn:
+            await conn.executemany(
+                "INSERT INTO logs (user_id, action, timestamp) VALUES (?, ?, ?)",
+                [(user_id, action, ts.strftime("%Y-%m-%d %H:%M:%S")) for user_id, action, ts in events]
+            )
+
+    async def close(self):
+        """Дописать отложенные логи и закрыть соединения."""
+        await super().close()
+        for conn in self._reader_conns:
+            await conn.close()
+        self._reader_conns = []
+        self._reader_pool = None
+        if self.conn:
+            await self.conn.close()
+            self.conn = None
+
+    async def _fetch_user_id(self, telegram_id: int):
+        async with self._reader() as conn:
+            cursor = await conn.execute(SQL_GET_USER_ID, (telegram_id,))
+            row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def get_catalog_version(self) -> int:
+        """Текущая версия каталога (меняется при каждом обновлении данных)."""
+        async with self._reader() as conn:
+            cursor = await conn.execute(SQL_CATALOG_VERSION)
+            row = await cursor.fetchone()
+        return row[0] if row else 0
+
+    async def get_database_id(self) -> int:
+        """Случайный id этой базы (миграция 4): им помечается файл снимка каталога."""
+        async with self._reader() as conn:
+            cursor = await conn.execute(SQL_DATABASE_ID)
+            row = await cursor.fetchone()
+        return row[0] if row else 0
+
+    async def fetch_catalog_rows(self) -> dict:
+        """Прочитать все таблицы каталога: категория -> список строк-словарей."""
+        result = {}
+        async with self._reader() as conn:
+            for kind, table in CATALOG_TABLES.items():
+                cursor = await conn.execute(f"SELECT * FROM {table}")
+                cols = [desc[0] for desc in cursor.description]
+                result[kind] = [dict(zip(cols, row)) for row in await cursor.fetchall()]
+        return result
+
+    async def import_catalog_chunk(self, table: str, rows: list, catalog_version: int, changed_at) -> tuple:
+        """Upsert пачки строк прайса одной транзакцией; вернуть (изменено строк, изменено цен).
+
+        rows – кортежи значений в порядке CATALOG_COLUMNS[table], ключи в пачке уникальны.
+        """
+        cols = [c for c, _, _ in CATALOG_COLUMNS[table]]
+        stage = f"import_{table}"
+        history, upsert = catalog_import_sql(table, stage, lambda n: "?")
+        async with self._writer() as conn:
+            await conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS {stage} AS SELECT {', '.join(cols)} FROM {table} WHERE 0")
+            await conn.execute(f"DELETE FROM {stage}")
+            await conn.executemany(
+                f"INSERT INTO {stage} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})", rows
+            )
+            prices = await conn.execute(history, (catalog_version, changed_at.strftime("%Y-%m-%d %H:%M:%S")))
+            changed = await conn.execute(upsert)
+            await conn.execute(f"DELETE FROM {stage}")
+        return changed.rowcount, prices.rowcount
+
+    async def bump_catalog_version(self) -> int:
+        """Увеличить версию каталога (боты перечитают его) и вернуть новую."""
+        async with self._writer() as conn:
+            rows = await conn.execute_fetchall(SQL_BUMP_CATALOG_VERSION)
+        return rows[0][0]
+
+    async def fsm_load(self, key: str):
+        """Сессия FSM: (state, data, updated_at) или None."""
+        async with self._reader() as conn:
+            cursor = await conn.execute(SQL_FSM_LOAD, (key,))
+            return await cursor.fetchone()
+
+    async def fsm_save(self, key: str, state, data: str, updated_at: int):
+        async with self._writer() as conn:
+            await conn.execute(SQL_FSM_SAVE, (key, state, data, updated_at))
+
+    async def fsm_delete(self, key: str):
+        async with self._writer() as conn:
+            await conn.execute("DELETE FROM fsm_sessions WHERE key = ?", (key,))
+
+    async def fsm_purge(self, before: int) -> int:
+        """Удалить сессии, не менявшиеся с момента before; вернуть их число."""
+        async with self._writer() as conn:
+            cursor = await conn.execute("DELETE FROM fsm_sessions WHERE updated_at < ?", (before,))
+        return cursor.rowcount
+
+    async def save_breakpoints(self, usage: str, catalog_version: int, rows: list):
+        """Сохранить таблицу точек смены сборки (старые версии удаляются)."""
+        async with self._writer() as conn:
+            await conn.execute("DELETE FROM budget_breakpoints WHERE usage = ?", (usage,))
+            await conn.executemany(
+                """
+                INSERT INTO budget_breakpoints
+                (usage, catalog_version, budget_from, cpu_id, motherboard_id, ram_id, gpu_id,
+                 storage_id, psu_id, case_id, cooler_id, total_price)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [(usage, catalog_version, *row) for row in rows]
+            )
+
+    async def load_breakpoints(self, usage: str, catalog_version: int) -> list:
+        """Таблица точек смены сборки для версии каталога, по возрастанию бюджета."""
+        async with self._reader() as conn:
+            cursor = await conn.execute(SQL_LOAD_BREAKPOINTS, (usage, catalog_version))
+            return await cursor.fetchall()
+
+    async def get_rollup_horizon(self):
+        """Конец последнего свёрнутого часа (None – свёрток ещё нет)."""
+        async with self._reader() as conn:
+            row = await (await conn.execute(SQL_ROLLUP_HORIZON)).fetchone()
+        return datetime.fromisoformat(row[0]) + timedelta(hours=1) if row[0] else None
+
+    async def get_first_log_time(self, since: datetime):
+        """Время первого лога не раньше since (None – таких нет)."""
+        async with self._reader() as conn:
+            row = await (await conn.execute(SQL_FIRST_LOG, (sql_time(since),))).fetchone()
+        return datetime.fromisoformat(row[0]) if row[0] else None
+
+    async def fetch_log_counts(self, start: datetime, end: datetime) -> list:
+        """[(начало часа, действие, число)] по сырым логам за [start, end)."""
+        async with self._reader() as conn:
+            cursor = await conn.execute(SQL_LOG_COUNTS, (sql_time(start), sql_time(end)))
+            return [(datetime.fromisoformat(hour), action, n) for hour, action, n in await cursor.fetchall()]
+
+    async def save_rollups(self, hours: list, start: datetime, end: datetime):
+        """Записать часовые счётчики [(час, действие, цель, число)] за [start, end) и пересчитать их сутки."""
+        async with self._writer() as conn:
+            await conn.execute(SQL_ROLLUP_CLEAR, (sql_time(start), sql_time(end)))
+            await conn.executemany(SQL_ROLLUP_HOUR, [(sql_time(h), a, u, n) for h, a, u, n in hours])
+            day = start.replace(hour=0)
+            await conn.execute(SQL_ROLLUP_DAYS, (sql_time(day), sql_time(end.replace(hour=0) + timedelta(days=1))))
+
+    async def purge_logs(self, before: datetime) -> int:
+        """Удалить сырые логи старше before; вернуть их число."""
+        async with self._writer() as conn:
+            cursor = await conn.execute("DELETE FROM logs WHERE timestamp < ?", (sql_time(before),))
+        return cursor.rowcount
+
+    async def fetch_rollups(self, period: str, start: datetime, end: datetime) -> list:
+        """[(начало периода, действие, цель, число)] свёрток period за [start, end)."""
+        async with self._reader() as conn:
+            cursor = await conn.execute(SQL_FETCH_ROLLUPS, (period, sql_time(start), sql_time(end)))
+            return [(datetime.fromisoformat(b), a, u, n) for b, a, u, n in await cursor.fetchall()]
+
+    async def _insert_build(self, user_id: int, key: str, total_price: int, config):
+        """Ссылка user_id -> key с суммой; config – строка build_configs, если её может не быть в БД."""
+        async with self._writer() as conn:
+            if config is not None:
+                await conn.execute(SQL_SAVE_BUILD_CONFIG, config)
+            await conn.execute(SQL_SAVE_USER_BUILD, (user_id, key, total_price))
+
+    async def count_build_savers(self, key: str) -> int:
+        """Сколько пользователей сохранили сборку с хэшем key."""
+        async with self._reader() as conn:
+            cursor = await conn.execute(SQL_BUILD_SAVERS, (key,))
+            return (await cursor.fetchone())[0]
 
     async def get_builds(self, user_id: int):
         """Получить все сохранённые сборки пользователя."""
-        cursor = await self.conn.execute(
-            "SELECT * FROM builds WHERE user_id = ? ORDER BY created_at DESC",
-            (user_id,)
-        )
-        rows = await cursor.fetchall()
+        async with self._reader() as conn:
+            cursor = await conn.execute(SQL_GET_BUILDS, (user_id,))
+            rows = await cursor.fetchall()
         cols = [desc[0] for desc in cursor.description]
         result = []
         for row in rows:
             rec = dict(zip(cols, row))
             result.append(rec)
-        return result
\ No newline at end of file
+        return result
+
+    async def _fetch_builds_page(self, user_id: int, direction: str, cursor, limit: int) -> list:
+        params = (user_id, limit) if direction == "first" else (user_id, cursor, limit)
+        async with self._reader() as conn:
+            cursor = await conn.execute(SQL_BUILDS_PAGE[direction], params)
+            rows = await cursor.fetchall()
+        cols = [desc[0] for desc in cursor.description]
+        return [dict(zip(cols, row)) for row in rows]
+
+    async def _fetch_build(self, user_id: int, build_id: int):
+        async with self._reader() as conn:
+            cursor = await conn.execute(SQL_GET_BUILD, (build_id, user_id))
+            row = await cursor.fetchone()
+        return dict(zip([desc[0] for desc in cursor.description], row)) if row else None
+
+def open_database(dsn: str, **options) -> BaseDatabase:
+    """Бэкенд по строке подключения: postgres://… – PostgreSQL, иначе файл SQLite.
+
+    options – параметры бэкенда: pg_* уходят в PostgresDatabase (без
+    префикса), user_cache_* и catalog_path – в оба бэкенда, остальные – в Database.
+    """
+    common = {k: v for k, v in options.items() if k.startswith(("user_cache_", "catalog_path"))}
+    pg_options = {k[3:]: v for k, v in options.items() if k.startswith("pg_")} | common
+    sqlite_options = {k: v for k, v in options.items() if not k.startswith("pg_")}
+    if dsn.startswith(("postgres://", "postgresql://")):
+        from db_pg import PostgresDatabase  # asyncpg нужен только для этого бэкенда
+        return PostgresDatabase(dsn, **pg_options)
+    return Database(dsn.removeprefix("sqlite:///"), **sqlite_options)
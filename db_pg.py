@@ -0,0 +1,364 @@
+# db_pg.py – PostgreSQL-бэкенд на пуле соединений asyncpg
+import asyncpg
+import json
+from datetime import datetime, timedelta
+
+from catalog import CATALOG_COLUMNS, CATALOG_TABLES
+from db import (BUILD_ID_COLUMNS, BUILD_JOIN_SELECT, DEMO_CATALOG, PAGE_DIRECTIONS, SQL_BUMP_CATALOG_VERSION,
+                USER_BUILDS_SELECT, BaseDatabase, builds_page_sql, catalog_import_sql, legacy_builds)
+from db_timing import TimedPool
+from migrations import SCHEMA_VERSION_DDL, migrate
+
+# Горячие запросы: asyncpg готовит их один раз на соединение и дальше
+# выполняет по имени (кэш prepared statements пула)
+PG_GET_USER_ID = "SELECT id FROM users WHERE telegram_id = $1"
+PG_UPSERT_USER = """
+    INSERT INTO users (telegram_id, username) VALUES ($1, $2)
+    ON CONFLICT (telegram_id) DO UPDATE SET username = EXCLUDED.username
+    RETURNING id
+"""
+PG_GET_BUILDS = f"{USER_BUILDS_SELECT} WHERE b.user_id = $1 ORDER BY b.created_at DESC, b.id DESC"
+PG_BUILDS_PAGE = {d: builds_page_sql(d, lambda n: f"${n}") for d in PAGE_DIRECTIONS}
+PG_GET_BUILD = f"{BUILD_JOIN_SELECT} WHERE b.id = $1 AND b.user_id = $2"
+PG_FSM_LOAD = "SELECT state, data, updated_at FROM fsm_sessions WHERE key = $1"
+PG_FSM_SAVE = """
+    INSERT INTO fsm_sessions (key, state, data, updated_at) VALUES ($1, $2, $3, $4)
+    ON CONFLICT (key) DO UPDATE SET state = EXCLUDED.state, data = EXCLUDED.data, updated_at = EXCLUDED.updated_at
+"""
+PG_CATALOG_VERSION = "SELECT value FROM catalog_meta WHERE key = 'version'"
+PG_DATABASE_ID = "SELECT value FROM catalog_meta WHERE key = 'database_id'"
+PG_SAVE_BUILD_CONFIG = (
+    f"INSERT INTO build_configs (build_hash, {', '.join(BUILD_ID_COLUMNS)}, total_price) "
+    f"VALUES ({', '.join(f'${n}' for n in range(1, len(BUILD_ID_COLUMNS) + 3))}) ON CONFLICT (build_hash) DO NOTHING"
+)
+PG_SAVE_USER_BUILD = "INSERT INTO user_builds (user_id, build_hash, total_price) VALUES ($1, $2, $3)"
+PG_BUILD_SAVERS = "SELECT COUNT(DISTINCT user_id) FROM user_builds WHERE build_hash = $1"
+PG_ROLLUP_HORIZON = "SELECT MAX(bucket) FROM log_rollups WHERE period = 'hour'"
+PG_FIRST_LOG = "SELECT MIN(timestamp) FROM logs WHERE timestamp >= $1"
+PG_LOG_COUNTS = """
+    SELECT date_trunc('hour', timestamp) AS hour, action, COUNT(*) FROM logs
+    WHERE timestamp >= $1 AND timestamp < $2 GROUP BY 1, 2
+"""
+PG_ROLLUP_CLEAR = "DELETE FROM log_rollups WHERE period = 'hour' AND bucket >= $1 AND bucket < $2"
+PG_ROLLUP_HOUR = """
+    INSERT INTO log_rollups (period, bucket, action, usage, events) VALUES ('hour', $1, $2, $3, $4)
+    ON CONFLICT (period, bucket, action, usage) DO UPDATE SET events = EXCLUDED.events
+"""
+PG_ROLLUP_DAYS = """
+    INSERT INTO log_rollups (period, bucket, action, usage, events)
+    SELECT 'day', date_trunc('day', bucket), action, usage, SUM(events) FROM log_rollups
+    WHERE period = 'hour' AND bucket >= $1 AND bucket < $2 GROUP BY 2, 3, 4
+    ON CONFLICT (period, bucket, action, usage) DO UPDATE SET events = EXCLUDED.events
+"""
+PG_FETCH_ROLLUPS = """
+    SELECT bucket, action, usage, events FROM log_rollups
+    WHERE period = $1 AND bucket >= $2 AND bucket < $3 ORDER BY bucket
+"""
+PG_LOAD_BREAKPOINTS = """
+    SELECT budget_from, cpu_id, motherboard_id, ram_id, gpu_id,
+           storage_id, psu_id, case_id, cooler_id, total_price
+    FROM budget_breakpoints
+    WHERE usage = $1 AND catalog_version = $2
+    ORDER BY budget_from
+"""
+# Ключ advisory-блокировки, под которой процессы по очереди применяют миграции
+MIGRATION_LOCK = 2024051701
+# Горячие запросы с примерными параметрами (см. db.HOT_QUERIES)
+HOT_QUERIES = {
+    "user_id": (PG_GET_USER_ID, (1,)),
+    "builds": (PG_GET_BUILDS, (1,)),
+    "builds_page_first": (PG_BUILDS_PAGE["first"], (1, 6)),
+    "builds_page_older": (PG_BUILDS_PAGE["older"], (1, 1, 6)),
+    "builds_page_newer": (PG_BUILDS_PAGE["newer"], (1, 1, 6)),
+    "build": (PG_GET_BUILD, (1, 1)),
+    "build_savers": (PG_BUILD_SAVERS, ("",)),
+    "fsm_load": (PG_FSM_LOAD, ("",)),
+    "catalog_version": (PG_CATALOG_VERSION, ()),
+    "breakpoints": (PG_LOAD_BREAKPOINTS, ("", 1)),
+    "first_log": (PG_FIRST_LOG, (datetime.min,)),
+    "log_counts": (PG_LOG_COUNTS, (datetime.min, datetime.min)),
+    "rollups": (PG_FETCH_ROLLUPS, ("day", datetime.min, datetime.min)),
+}
+BREAKPOINT_COLUMNS = ('usage', 'catalog_version', 'budget_from', 'cpu_id', 'motherboard_id', 'ram_id',
+                      'gpu_id', 'storage_id', 'psu_id', 'case_id', 'cooler_id', 'total_price')
+
+
+class PostgresDatabase(BaseDatabase):
+    """PostgreSQL-бэкенд: общий для нескольких процессов бота.
+
+    Пачки записей (логи, таблицы точек смены, демо-каталог, прайсы) идут через
+    COPY (copy_records_to_table), а не построчными INSERT.
+    """
+
+    dialect = "postgres"
+    hot_queries = HOT_QUERIES
+
+    def __init__(self, dsn: str, min_size: int = 2, max_size: int = 10,
+                 statement_cache_size: int = 256, **options):
+        super().__init__(**options)
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_cache_size = statement_cache_size
+        self.pool: asyncpg.Pool | None = None
+
+    async def connect(self, load_catalog: bool = True, seed_demo: bool = False):
+        """Создать пул соединений и довести схему до последней версии (migrations.py).
+
+        load_catalog=False – не читать каталог в память (для импорта прайсов),
+        seed_demo=True – залить DEMO_CATALOG в пустой каталог (только для разработки).
+        """
+        self.pool = await asyncpg.create_pool(
+            self.dsn, min_size=self.min_size, max_size=self.max_size,
+            statement_cache_size=self.statement_cache_size,
+        )
+        if self.on_statement:
+            self.pool = TimedPool(self.pool, self.on_statement)
+        await migrate(self)
+        if seed_demo:
+            await self._seed_demo_catalog()
+        if load_catalog:
+            await self.catalog.load(self)
+        print(f"PostgreSQL connected (pool {self.min_size}..{self.max_size}), schema up to date")
+
+    async def get_schema_version(self) -> int:
+        """Последняя применённая миграция (0 – ни одной)."""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", MIGRATION_LOCK)
+                await conn.execute(SCHEMA_VERSION_DDL)
+            return await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+
+    async def apply_migration(self, version: int, description: str, script: str) -> bool:
+        """Выполнить скрипт миграции и записать её версию одной транзакцией.
+
+        False – миграцию уже применил другой процесс.
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", MIGRATION_LOCK)
+                if await conn.fetchval("SELECT 1 FROM schema_version WHERE version = $1", version):
+                    return False
+                if script:
+                    await conn.execute(script)
+                await conn.execute("INSERT INTO schema_version (version, description) VALUES ($1, $2)",
+                                   version, description)
+        return True
+
+    async def _full_scans(self, sql: str, params: tuple) -> list:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # На маленьких таблицах планировщик и так выбирает Seq Scan – спрашиваем, есть ли индекс
+                await conn.execute("SET LOCAL enable_seqscan = off")
+                plan = json.loads(await conn.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", *params))
+        scans, nodes = [], [plan[0]["Plan"]]
+        while nodes:
+            node = nodes.pop()
+            if node["Node Type"] == "Seq Scan":
+                scans.append(node["Relation Name"])
+            nodes.extend(node.get("Plans", ()))
+        return scans
+
+    async def migrate_legacy_builds(self):
+        """Перенести сборки из старой таблицы builds в build_configs/user_builds и удалить её."""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Блокировка, чтобы два процесса не перенесли сборки дважды
+                await conn.execute("LOCK TABLE user_builds IN EXCLUSIVE MODE")
+                if await conn.fetchval("SELECT to_regclass('builds')") is None:
+                    return
+                configs, links = legacy_builds([dict(r) for r in await conn.fetch("SELECT * FROM builds")])
+                await conn.executemany(PG_SAVE_BUILD_CONFIG, configs)
+                await conn.copy_records_to_table(
+                    'user_builds', columns=('id', 'user_id', 'build_hash', 'created_at'), records=links
+                )
+                # id перенесены как были – счётчик продолжается после них
+                await conn.execute(
+                    "SELECT setval(pg_get_serial_sequence('user_builds', 'id'), COALESCE(MAX(id), 0) + 1, false) "
+                    "FROM user_builds"
+                )
+                await conn.execute("DROP TABLE builds")
+        print(f"Migrated {len(links)} saved builds into {len(configs)} build configurations")
+
+    async def _seed_demo_catalog(self):
+        """Залить DEMO_CATALOG, если каталог ещё пуст."""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Блокировка, чтобы два процесса не залили каталог дважды
+                await conn.execute("LOCK TABLE cpus IN EXCLUSIVE MODE")
+                if await conn.fetchval("SELECT COUNT(*) FROM cpus"):
+                    return
+                for table, rows in DEMO_CATALOG.items():
+                    cols = list(rows[0])
+                    await conn.copy_records_to_table(
+                        table, columns=cols, records=[tuple(r[c] for c in cols) for r in rows]
+                    )
+                await conn.execute("""
+                    INSERT INTO catalog_meta (key, value) VALUES ('version', 1)
+                    ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+                """)
+
+    async def close(self):
+        """Дописать отложенные логи и закрыть пул."""
+        await super().close()
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+
+    async def _upsert_user(self, telegram_id: int, username: str) -> int:
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval(PG_UPSERT_USER, telegram_id, username)
+
+    async def insert_actions(self, events: list):
+        """Записать пачку событий (user_id, action, timestamp) через COPY."""
+        async with self.pool.acquire() as conn:
+            await conn.copy_records_to_table(
+                'logs', columns=('user_id', 'action', 'timestamp'), records=events
+            )
+
+    async def _fetch_user_id(self, telegram_id: int):
+        async with self.pool.acquire() as conn:
+            stmt = await conn.prepare(PG_GET_USER_ID)
+            return await stmt.fetchval(telegram_id)
+
+    async def get_catalog_version(self) -> int:
+        """Текущая версия каталога (меняется при каждом обновлении данных)."""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval(PG_CATALOG_VERSION) or 0
+
+    async def get_database_id(self) -> int:
+        """Случайный id этой базы (миграция 4): им помечается файл снимка каталога."""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval(PG_DATABASE_ID) or 0
+
+    async def import_catalog_chunk(self, table: str, rows: list, catalog_version: int, changed_at) -> tuple:
+        """Upsert пачки строк прайса одной транзакцией через COPY; вернуть (изменено строк, изменено цен)."""
+        cols = [c for c, _, _ in CATALOG_COLUMNS[table]]
+        stage = f"import_{table}"
+        history, upsert = catalog_import_sql(table, stage, lambda n: f"${n}", "IS DISTINCT FROM")
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {', '.join(cols)} FROM {table} WITH NO DATA"
+                )
+                await conn.copy_records_to_table(stage, columns=cols, records=rows)
+                prices = await conn.execute(history, catalog_version, changed_at)
+                changed = await conn.execute(upsert)
+        # Статус вида "INSERT 0 <строк>"
+        return int(changed.split()[-1]), int(prices.split()[-1])
+
+    async def bump_catalog_version(self) -> int:
+        """Увеличить версию каталога (боты перечитают его) и вернуть новую."""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval(SQL_BUMP_CATALOG_VERSION)
+
+    async def fetch_catalog_rows(self) -> dict:
+        """Прочитать все таблицы каталога: категория -> список строк-словарей."""
+        result = {}
+        async with self.pool.acquire() as conn:
+            # Один снимок данных на все таблицы
+            async with conn.transaction(isolation='repeatable_read', readonly=True):
+                for kind, table in CATALOG_TABLES.items():
+                    result[kind] = [dict(r) for r in await conn.fetch(f"SELECT * FROM {table}")]
+        return result
+
+    async def fsm_load(self, key: str):
+        """Сессия FSM: (state, data, updated_at) или None."""
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(PG_FSM_LOAD, key)
+        return tuple(row) if row else None
+
+    async def fsm_save(self, key: str, state, data: str, updated_at: int):
+        async with self.pool.acquire() as conn:
+            await conn.execute(PG_FSM_SAVE, key, state, data, updated_at)
+
+    async def fsm_delete(self, key: str):
+        async with self.pool.acquire() as conn:
+            await conn.execute("DELETE FROM fsm_sessions WHERE key = $1", key)
+
+    async def fsm_purge(self, before: int) -> int:
+        """Удалить сессии, не менявшиеся с момента before; вернуть их число."""
+        async with self.pool.acquire() as conn:
+            status = await conn.execute("DELETE FROM fsm_sessions WHERE updated_at < $1", before)
+        return int(status.split()[-1])
+
+    async def save_breakpoints(self, usage: str, catalog_version: int, rows: list):
+        """Сохранить таблицу точек смены сборки (старые версии удаляются)."""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("DELETE FROM budget_breakpoints WHERE usage = $1", usage)
+                await conn.copy_records_to_table(
+                    'budget_breakpoints', columns=BREAKPOINT_COLUMNS,
+                    records=[(usage, catalog_version, *row) for row in rows]
+                )
+
+    async def load_breakpoints(self, usage: str, catalog_version: int) -> list:
+        """Таблица точек смены сборки для версии каталога, по возрастанию бюджета."""
+        async with self.pool.acquire() as conn:
+            return [tuple(r) for r in await conn.fetch(PG_LOAD_BREAKPOINTS, usage, catalog_version)]
+
+    async def get_rollup_horizon(self):
+        """Конец последнего свёрнутого часа (None – свёрток ещё нет)."""
+        async with self.pool.acquire() as conn:
+            last = await conn.fetchval(PG_ROLLUP_HORIZON)
+        return last + timedelta(hours=1) if last else None
+
+    async def get_first_log_time(self, since: datetime):
+        """Время первого лога не раньше since (None – таких нет)."""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval(PG_FIRST_LOG, since)
+
+    async def fetch_log_counts(self, start: datetime, end: datetime) -> list:
+        """[(начало часа, действие, число)] по сырым логам за [start, end)."""
+        async with self.pool.acquire() as conn:
+            return [tuple(r) for r in await conn.fetch(PG_LOG_COUNTS, start, end)]
+
+    async def save_rollups(self, hours: list, start: datetime, end: datetime):
+        """Записать часовые счётчики [(час, действие, цель, число)] за [start, end) и пересчитать их сутки."""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(PG_ROLLUP_CLEAR, start, end)
+                await conn.executemany(PG_ROLLUP_HOUR, hours)
+                await conn.execute(PG_ROLLUP_DAYS, start.replace(hour=0), end.replace(hour=0) + timedelta(days=1))
+
+    async def purge_logs(self, before: datetime) -> int:
+        """Удалить сырые логи старше before; вернуть их число."""
+        async with self.pool.acquire() as conn:
+            status = await conn.execute("DELETE FROM logs WHERE timestamp < $1", before)
+        return int(status.split()[-1])
+
+    async def fetch_rollups(self, period: str, start: datetime, end: datetime) -> list:
+        """[(начало периода, действие, цель, число)] свёрток period за [start, end)."""
+        async with self.pool.acquire() as conn:
+            return [tuple(r) for r in await conn.fetch(PG_FETCH_ROLLUPS, period, start, end)]
+
+    async def _insert_build(self, user_id: int, key: str, total_price: int, config):
+        """Ссылка user_id -> key с суммой; config – строка build_configs, если её может не быть в БД."""
+        async with self.pool.acquire() as conn:
+            if config is None:
+                await conn.execute(PG_SAVE_USER_BUILD, user_id, key, total_price)
+                return
+            async with conn.transaction():
+                await conn.execute(PG_SAVE_BUILD_CONFIG, *config)
+                await conn.execute(PG_SAVE_USER_BUILD, user_id, key, total_price)
+
+    async def count_build_savers(self, key: str) -> int:
+        """Сколько пользователей сохранили сборку с хэшем key."""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval(PG_BUILD_SAVERS, key)
+
+    async def get_builds(self, user_id: int):
+        """Получить все сохранённые сборки пользователя."""
+        async with self.pool.acquire() as conn:
+            stmt = await conn.prepare(PG_GET_BUILDS)
+            return [dict(r) for r in await stmt.fetch(user_id)]
+
+    async def _fetch_builds_page(self, user_id: int, direction: str, cursor, limit: int) -> list:
+        params = (user_id, limit) if direction == "first" else (user_id, cursor, limit)
+        async with self.pool.acquire() as conn:
+            return [dict(r) for r in await conn.fetch(PG_BUILDS_PAGE[direction], *params)]
+
+    async def _fetch_build(self, user_id: int, build_id: int):
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(PG_GET_BUILD, build_id, user_id)
+        return dict(row) if row else None
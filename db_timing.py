@@ -0,0 +1,122 @@
+# db_timing.py – замер каждого запроса к БД с меткой вида оператора
+import re
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+_VERB = re.compile(r"[\s(]*(\w+)")
+_TABLE = {
+    "insert": re.compile(r"\bINSERT\s+(?:OR\s+\w+\s+)?INTO\s+(\w+)", re.I),
+    "update": re.compile(r"\bUPDATE\s+(\w+)\s+SET\b", re.I),
+    "delete": re.compile(r"\bDELETE\s+FROM\s+(\w+)", re.I),
+    "select": re.compile(r"\bFROM\s+(\w+)", re.I),
+    "copy": re.compile(r"^COPY\s+(\w+)", re.I),
+}
+
+
+@lru_cache(maxsize=1024)
+def statement_name(sql: str) -> str:
+    """Нормализованное имя запроса: оператор и главная таблица, например 'select users'.
+
+    Параметры и текст условий в имя не попадают, поэтому число меток
+    ограничено числом пар оператор/таблица. WITH ... относится к оператору,
+    который стоит после CTE; PRAGMA, DDL и BEGIN – только по первому слову.
+    """
+    first = _VERB.match(sql)
+    verb = first.group(1).lower() if first else ""
+    if verb == "with":
+        verb = next((v for v in ("insert", "update", "delete") if _TABLE[v].search(sql)), "select")
+    pattern = _TABLE.get(verb)
+    match = pattern.search(sql) if pattern else None
+    return f"{verb} {match.group(1).lower()}" if match else verb
+
+
+class _Timer:
+    def __init__(self, on_statement):
+        self.on_statement = on_statement
+
+    async def run(self, sql: str, call, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await call(*args, **kwargs)
+        finally:
+            self.on_statement(statement_name(sql), time.perf_counter() - start)
+
+
+class TimedConnection(_Timer):
+    """Прокси соединения aiosqlite или asyncpg: запросы замеряются, остальное – как есть.
+
+    У aiosqlite замер – до первой строки результата (execute шагает до неё
+    в потоке соединения); у asyncpg fetch* возвращают все строки сразу.
+    """
+
+    def __init__(self, conn, on_statement):
+        super().__init__(on_statement)
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def execute(self, sql, *args, **kwargs):
+        return await self.run(sql, self._conn.execute, sql, *args, **kwargs)
+
+    async def executemany(self, sql, *args, **kwargs):
+        return await self.run(sql, self._conn.executemany, sql, *args, **kwargs)
+
+    async def executescript(self, sql):
+        return await self.run(sql, self._conn.executescript, sql)
+
+    async def execute_fetchall(self, sql, *args, **kwargs):
+        return await self.run(sql, self._conn.execute_fetchall, sql, *args, **kwargs)
+
+    async def fetch(self, sql, *args, **kwargs):
+        return await self.run(sql, self._conn.fetch, sql, *args, **kwargs)
+
+    async def fetchrow(self, sql, *args, **kwargs):
+        return await self.run(sql, self._conn.fetchrow, sql, *args, **kwargs)
+
+    async def fetchval(self, sql, *args, **kwargs):
+        return await self.run(sql, self._conn.fetchval, sql, *args, **kwargs)
+
+    async def copy_records_to_table(self, table, **kwargs):
+        return await self.run(f"COPY {table}", self._conn.copy_records_to_table, table, **kwargs)
+
+    async def prepare(self, sql, **kwargs):
+        return TimedStatement(await self._conn.prepare(sql, **kwargs), sql, self.on_statement)
+
+
+class TimedStatement(_Timer):
+    """Подготовленный запрос asyncpg: замер под тем же именем, что и текст запроса."""
+
+    def __init__(self, stmt, sql: str, on_statement):
+        super().__init__(on_statement)
+        self._stmt = stmt
+        self._sql = sql
+
+    def __getattr__(self, name):
+        return getattr(self._stmt, name)
+
+    async def fetch(self, *args, **kwargs):
+        return await self.run(self._sql, self._stmt.fetch, *args, **kwargs)
+
+    async def fetchrow(self, *args, **kwargs):
+        return await self.run(self._sql, self._stmt.fetchrow, *args, **kwargs)
+
+    async def fetchval(self, *args, **kwargs):
+        return await self.run(self._sql, self._stmt.fetchval, *args, **kwargs)
+
+
+class TimedPool:
+    """Пул asyncpg, выдающий соединения-прокси TimedConnection."""
+
+    def __init__(self, pool, on_statement):
+        self._pool = pool
+        self.on_statement = on_statement
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    @asynccontextmanager
+    async def acquire(self):
+        async with self._pool.acquire() as conn:
+            yield TimedConnection(conn, self.on_statement)
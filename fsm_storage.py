@@ -0,0 +1,84 @@
+# fsm_storage.py – хранилище состояний FSM в БД бота
+import asyncio
+import json
+import time
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+
+from lru import LRUCache
+
+
+def encode_key(key: StorageKey) -> str:
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.business_connection_id or ''}:{key.destiny}"
+
+
+class DatabaseStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_sessions с горячим LRU-кэшем.
+
+    Пишет сквозь кэш: каждое изменение сразу уходит в БД, чтение – из
+    кэша. Данные хранятся компактным JSON и должны быть мелкими (id и
+    скаляры); сессия без изменений дольше ttl секунд считается пустой и
+    удаляется фоновой задачей purge_expired.
+    """
+
+    def __init__(self, db, ttl: float = 86400, cache_size: int = 5000, max_data_bytes: int = 1024):
+        self.db = db
+        self.ttl = ttl
+        self.max_data_bytes = max_data_bytes
+        self.cache = LRUCache(cache_size, ttl)  # ключ -> (state, data)
+
+    async def _load(self, key: str) -> tuple:
+        entry = self.cache.get(key)
+        if entry is None:
+            row = await self.db.fsm_load(key)
+            if row is None or row[2] < time.time() - self.ttl:
+                entry = (None, {})
+            else:
+                entry = (row[0], json.loads(row[1]) if row[1] else {})
+            self.cache.put(key, entry)
+        return entry
+
+    async def _save(self, key: str, state, data: dict):
+        if state is None and not data:
+            self.cache.put(key, (None, {}))
+            await self.db.fsm_delete(key)
+            return
+        blob = json.dumps(data, ensure_ascii=False, separators=(",", ":")) if data else ""
+        if len(blob.encode()) > self.max_data_bytes:
+            raise ValueError(f"FSM data for {key} is {len(blob)} bytes, limit {self.max_data_bytes}: "
+                             "store ids, not whole objects")
+        self.cache.put(key, (state, dict(data)))
+        await self.db.fsm_save(key, state, blob, int(time.time()))
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        name = state.state if isinstance(state, State) else state
+        skey = encode_key(key)
+        _, data = await self._load(skey)
+        await self._save(skey, name, data)
+
+    async def get_state(self, key: StorageKey):
+        return (await self._load(encode_key(key)))[0]
+
+    async def set_data(self, key: StorageKey, data) -> None:
+        skey = encode_key(key)
+        state, _ = await self._load(skey)
+        await self._save(skey, state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> dict:
+        # Копия: вызывающий код может менять словарь, не трогая кэш
+        return dict((await self._load(encode_key(key)))[1])
+
+    async def purge_expired(self, interval: float):
+        """Фоновая задача: удалять сессии, не менявшиеся дольше ttl."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await self.db.fsm_purge(int(time.time() - self.ttl))
+                if removed:
+                    print(f"FSM storage: {removed} idle sessions evicted")
+            except Exception as e:
+                print(f"FSM purge failed: {e}")
+
+    async def close(self) -> None:
+        self.cache.clear()
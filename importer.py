@@ -0,0 +1,194 @@
+# importer.py – потоковая загрузка прайсов в таблицы каталога
+#
+# Файл читается построчно и пишется пачками: каждая пачка – одна
+# транзакция с upsert по естественному ключу (CATALOG_KEYS), изменения цен
+# попадают в price_history. В конце версия каталога увеличивается, снимок
+# каталога перезаписывается в файл (CATALOG_SNAPSHOT_PATH, см.
+# catalog_file.py), и запущенные боты перечитывают его. Память не растёт с
+# размером прайса:
+#
+#   python importer.py cpus prices/cpus.csv
+#   python importer.py gpus prices/gpus.jsonl.gz --batch-size 20000
+import argparse
+import asyncio
+import csv
+import gzip
+import json
+import time
+from itertools import islice
+
+from catalog import CATALOG_COLUMNS, CATALOG_KEYS
+from config import CATALOG_SNAPSHOT_PATH, DB_DSN, IMPORT_BATCH_SIZE
+from db import open_database
+from logsink import utcnow
+
+FORMATS = ("csv", "jsonl")
+TRUE_VALUES = {"1", "true", "yes", "y", "да", "+"}
+FALSE_VALUES = {"0", "false", "no", "n", "нет", "-"}
+
+
+def _int(value):
+    if type(value) is str:
+        try:
+            value = int(value)  # обычный случай – без лишней обработки строки
+        except ValueError:
+            value = value.strip().replace(" ", "").replace(",", ".")
+            if not value:
+                return None
+            value = round(float(value))
+    elif isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError("expected a number")
+    else:
+        value = round(value)
+    if value < 0:
+        raise ValueError("negative value")
+    return value
+
+
+def _str(value):
+    return str(value).strip() or None
+
+
+def _bool(value):
+    if isinstance(value, (bool, int)):
+        return bool(value)
+    value = str(value).strip().lower()
+    if not value:
+        return None
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError("expected a boolean")
+
+
+CONVERTERS = {int: _int, str: _str, bool: _bool}
+# Таблица -> (столбец, функция приведения, NOT NULL)
+ROW_SCHEMAS = {table: [(c, CONVERTERS[kind], required) for c, kind, required in columns]
+               for table, columns in CATALOG_COLUMNS.items()}
+
+
+def parse_row(table: str, raw: dict) -> tuple:
+    """Строка прайса -> кортеж значений в порядке CATALOG_COLUMNS; ValueError, если не подходит схеме.
+
+    Лишние поля игнорируются, пустые значения – NULL.
+    """
+    values = []
+    for column, convert, required in ROW_SCHEMAS[table]:
+        value = raw.get(column)
+        if value is not None:
+            try:
+                value = convert(value)
+            except (ValueError, TypeError, OverflowError) as e:
+                raise ValueError(f"{column}: {e} ({raw.get(column)!r})") from None
+        if value is None and required:
+            raise ValueError(f"{column}: missing")
+        values.append(value)
+    return tuple(values)
+
+
+def _open(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def read_feed(path: str, fmt: str = None):
+    """Итератор (номер строки, словарь) по файлу CSV с заголовком или JSONL (можно .gz)."""
+    fmt = fmt or ("jsonl" if path.removesuffix(".gz").endswith((".jsonl", ".ndjson", ".json")) else "csv")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown feed format: {fmt}")
+    with _open(path) as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for raw in reader:
+                yield reader.line_num, raw
+            return
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                raw = json.loads(line)
+            except json.JSONDecodeError as e:
+                raw = e  # ошибка разбора – как и ошибка схемы, отбрасывает одну строку
+            yield line_no, raw
+
+
+async def import_feed(db, table: str, path: str, fmt: str = None, batch_size: int = IMPORT_BATCH_SIZE,
+                      max_errors: int = 20) -> dict:
+    """Загрузить прайс path в таблицу table; вернуть статистику импорта.
+
+    Отвергнутые строки пропускаются (первые max_errors печатаются). Версия
+    каталога увеличивается один раз в конце и только если что-то изменилось,
+    поэтому боты не видят каталог посреди импорта.
+    """
+    if table not in CATALOG_COLUMNS:
+        raise ValueError(f"Unknown catalog table: {table}")
+    key_positions = [i for i, (c, _, _) in enumerate(CATALOG_COLUMNS[table]) if c in CATALOG_KEYS[table]]
+    version = await db.get_catalog_version() + 1  # версия, под которой будут видны изменения
+    changed_at = utcnow()
+    stats = {"table": table, "rows": 0, "rejected": 0, "changed": 0, "price_changes": 0, "batches": 0}
+    start = time.perf_counter()
+    feed = read_feed(path, fmt)
+    while True:
+        # В пачке ключи уникальны: повтор позиции в прайсе перекрывает предыдущий
+        batch = {}
+        taken = 0
+        for line_no, raw in islice(feed, batch_size):
+            taken += 1
+            try:
+                if isinstance(raw, Exception):
+                    raise ValueError(f"invalid JSON: {raw}")
+                if not isinstance(raw, dict):
+                    raise ValueError("not an object")
+                row = parse_row(table, raw)
+            except ValueError as e:
+                stats["rejected"] += 1
+                if stats["rejected"] <= max_errors:
+                    print(f"{path}:{line_no}: {e}")
+                continue
+            batch[tuple(row[i] for i in key_positions)] = row
+        if not taken:
+            break
+        stats["rows"] += taken
+        if batch:
+            changed, prices = await db.import_catalog_chunk(table, list(batch.values()), version, changed_at)
+            stats["changed"] += changed
+            stats["price_changes"] += prices
+            stats["batches"] += 1
+    stats["version"] = await db.bump_catalog_version() if stats["changed"] else version - 1
+    stats["elapsed_s"] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+async def run(args) -> dict:
+    db = open_database(DB_DSN, pg_min_size=1, pg_max_size=2, catalog_path=CATALOG_SNAPSHOT_PATH)
+    await db.connect(load_catalog=False)
+    try:
+        stats = await import_feed(db, args.table, args.path, args.format, args.batch_size, args.max_errors)
+        # Боты стартуют с файла новой версии, не читая таблицы каталога
+        stats["catalog_file"] = await db.catalog.export(db) if stats["changed"] else False
+        return stats
+    finally:
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a CSV/JSONL price feed into a catalog table.")
+    parser.add_argument("table", choices=sorted(CATALOG_COLUMNS))
+    parser.add_argument("path", help="feed file: CSV with a header row or JSONL, optionally .gz")
+    parser.add_argument("--format", choices=FORMATS, help="feed format (default: by file extension)")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="rows per transaction")
+    parser.add_argument("--max-errors", type=int, default=20, help="rejected rows to print")
+    args = parser.parse_args()
+
+    stats = asyncio.run(run(args))
+    print(f"{stats['table']}: {stats['rows']} rows in {stats['elapsed_s']}s, {stats['rejected']} rejected, "
+          f"{stats['changed']} inserted or updated, {stats['price_changes']} price changes, "
+          f"catalog version {stats['version']}")
+    if stats["catalog_file"]:
+        print(f"Catalog file written: {CATALOG_SNAPSHOT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# keyboards.py – inline-клавиатуры бота, собранные заранее или один раз на фильтр
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from lru import LRUCache
+
+
+def _menu(*rows) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=text, callback_data=data)] for text, data in rows
+    ])
+
+
+# Неизменяемые клавиатуры собираются один раз при импорте
+MAIN_MENU = _menu(
+    ("🔍 Подобрать сборку", "auto"),
+    ("🛠 Ручной режим сборки", "manual"),
+    ("💾 Мои сохранённые сборки", "view_builds"),
+    ("ℹ️ Помощь", "help"),
+)
+USAGE_MENU = _menu(
+    ("🎮 Игры", "usage_Игры"),
+    ("💼 Работа/Офис", "usage_Работа"),
+    ("🖥️ Рендеринг/3D", "usage_Рендеринг"),
+    ("Другое", "usage_Другое"),
+)
+AUTO_BUILD_ACTIONS = _menu(
+    ("💾 Сохранить сборку", "save_build"),
+    ("🔄 В меню", "back_to_menu"),
+)
+MANUAL_CONFIRM = _menu(
+    ("💾 Сохранить", "manual_save"),
+    ("❌ Отмена", "manual_cancel"),
+)
+BACK_TO_MENU = _menu(("🔄 В главное меню", "back_to_menu"))
+
+# Сколько компонентов показывать на одной странице выбора
+PAGE_SIZE = 5
+# Категория -> префикс callback_data кнопки компонента
+COMPONENT_PREFIXES = {
+    'cpu': "cpu_", 'motherboard': "mobo_", 'ram': "ram_", 'gpu': "gpu_",
+    'storage': "sto_", 'case': "case_", 'psu': "psu_", 'cooler': "col_",
+}
+# Кнопка-заглушка, если подходящих компонентов нет (callback_data "ignore" – только убрать часики)
+EMPTY_BUTTONS = {
+    'cpu': "Нет данных по CPU",
+    'motherboard': "Нет плат под этот процессор",
+    'ram': "Нет модулей ОЗУ совместимого типа",
+    'gpu': "Нет видеокарт, к которым найдутся БП и корпус",
+    'storage': "Нет подходящих накопителей",
+    'case': "Нет корпусов под эту плату и видеокарту",
+    'psu': "Нет блоков питания нужной мощности",
+    'cooler': "Нет кулеров под этот процессор",
+}
+# Выход из тупика ручного режима: выбрать детали заново или вернуться в меню
+DEAD_END = (
+    [InlineKeyboardButton(text="🔁 Собрать заново", callback_data="manual")],
+    [InlineKeyboardButton(text="🔄 В главное меню", callback_data="back_to_menu")],
+)
+
+
+def alternatives_menu(labels: list, current: int) -> InlineKeyboardMarkup:
+    """Переключатель вариантов автосборки (текущий отмечен) над AUTO_BUILD_ACTIONS."""
+    row = [InlineKeyboardButton(text=("• " if i == current else "") + label, callback_data=f"alt_{i}")
+           for i, label in enumerate(labels)]
+    return InlineKeyboardMarkup(inline_keyboard=[row, *AUTO_BUILD_ACTIONS.inline_keyboard])
+
+
+def component_label(kind: str, item: dict) -> str:
+    if kind == 'psu':
+        return f"{item['name']} ({item['power']}W, {item['price']} ₽)"
+    return f"{item['name']} ({item['price']} ₽)"
+
+
+class KeyboardFactory:
+    """Клавиатуры выбора компонентов, мемоизированные по (категория, фильтр, страница).
+
+    Кэш с LRU-вытеснением сбрасывается целиком при смене версии каталога:
+    старые кнопки могли бы ссылаться на удалённые или подорожавшие позиции.
+    """
+
+    def __init__(self, catalog, cache_size: int = 1024, page_size: int = PAGE_SIZE):
+        self.catalog = catalog
+        self.page_size = page_size
+        self.cache = LRUCache(cache_size)
+        self.version = None
+
+    async def components(self, kind: str, filter_key, page: int, fetch) -> InlineKeyboardMarkup:
+        """Клавиатура страницы page; fetch – корутина-функция, возвращающая строки по фильтру."""
+        version = self.catalog.snapshot.version
+        if version != self.version:
+            self.cache.clear()
+            self.version = version
+        key = (kind, filter_key, page)
+        markup = self.cache.get(key)
+        if markup is None:
+            markup = self._build(kind, await fetch(), page)
+            self.cache.put(key, markup)
+        return markup
+
+    def _build(self, kind: str, rows: list, page: int) -> InlineKeyboardMarkup:
+        prefix = COMPONENT_PREFIXES[kind]
+        start = page * self.page_size
+        buttons = [[InlineKeyboardButton(text=component_label(kind, item), callback_data=f"{prefix}{item['id']}")]
+                   for item in rows[start:start + self.page_size]]
+        if not buttons and page == 0:
+            buttons.append([InlineKeyboardButton(text=EMPTY_BUTTONS[kind], callback_data="ignore")])
+            # Без кулера сборку можно продолжить, без остальных деталей – нет
+            if kind != 'cooler':
+                return InlineKeyboardMarkup(inline_keyboard=[*buttons, *DEAD_END])
+        nav = []
+        if page > 0:
+            nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"page_{kind}_{page - 1}"))
+        if len(rows) > start + self.page_size:
+            nav.append(InlineKeyboardButton(text="Ещё ➡️", callback_data=f"page_{kind}_{page + 1}"))
+        if nav:
+            buttons.append(nav)
+        if kind == 'cooler':
+            buttons.append([InlineKeyboardButton(text="Без отдельного кулера", callback_data="col_none")])
+        return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+    def stats(self) -> dict:
+        return {"version": self.version, **self.cache.stats()}
@@ -0,0 +1,109 @@
+# logsink.py – отложенная пакетная запись действий пользователей
+import asyncio
+from datetime import datetime, timezone
+
+
+def utcnow() -> datetime:
+    """Текущее время UTC без tzinfo – как CURRENT_TIMESTAMP / NOW() в БД."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# Что делать, когда очередь заполнена
+OVERFLOW_POLICIES = ("drop_new", "drop_old", "block")
+
+
+class ActionLogSink:
+    """Очередь событий логирования со сбросом в БД пачками.
+
+    Хендлеры только кладут событие в ограниченную очередь; фоновая задача
+    записывает накопленное одной транзакцией, как только набралось
+    batch_size событий или прошло flush_interval_ms с первого события пачки.
+    write – корутина, принимающая список кортежей (user_id, action, datetime).
+    """
+
+    def __init__(self, write, batch_size: int = 200, flush_interval_ms: int = 500,
+                 max_queue: int = 10000, overflow: str = "drop_old"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.write = write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.overflow = overflow
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.flushed = 0   # записано событий
+        self.dropped = 0   # потеряно из-за переполнения или ошибок записи
+        self.batches = 0   # выполнено транзакций
+        self._task: asyncio.Task | None = None
+        self._inflight: asyncio.Future | None = None
+        self._batch = []
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def put(self, user_id: int, action: str):
+        """Поставить событие в очередь (время фиксируется сейчас, а не при записи)."""
+        event = (user_id, action, utcnow())
+        if self.overflow == "block":
+            await self.queue.put(event)
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.overflow == "drop_old":
+                self.queue.get_nowait()
+                self.queue.put_nowait(event)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Собираемая пачка хранится в self._batch: при остановке close()
+            # допишет её, даже если задачу отменили посреди ожидания
+            self._batch.append(await self.queue.get())
+            deadline = loop.time() + self.flush_interval
+            while len(self._batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            batch, self._batch = self._batch, []
+            # Запись не прерывается отменой задачи – close() её дождётся
+            self._inflight = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._inflight)
+
+    async def _flush(self, batch: list):
+        try:
+            await self.write(batch)
+        except Exception as e:
+            self.dropped += len(batch)
+            print(f"Action log flush failed, {len(batch)} events lost: {e}")
+            return
+        self.flushed += len(batch)
+        self.batches += 1
+
+    async def close(self):
+        """Остановить фоновую задачу и записать всё, что осталось в очереди."""
+        if self._task:
+            while not self._task.done():
+                # До Python 3.12 wait_for «проглатывает» отмену, если событие
+                # пришло в тот же момент, – тогда отменяем повторно
+                self._task.cancel()
+                await asyncio.wait({self._task}, timeout=0.1)
+            self._task = None
+        if self._inflight:
+            await self._inflight
+        batch, self._batch = self._batch, []
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+            if len(batch) >= self.batch_size:
+                await self._flush(batch)
+                batch = []
+        if batch:
+            await self._flush(batch)
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "flushed": self.flushed,
+                "dropped": self.dropped, "batches": self.batches}
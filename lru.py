@@ -0,0 +1,51 @@
+# lru.py – ограниченный LRU-кэш со сроком жизни записей
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Словарь не больше maxsize записей; вытесняется давно не читанная.
+
+    Запись старше ttl секунд считается отсутствующей (ttl=None – без срока).
+    Счётчики hits/misses показывают, сколько обращений обошлись без БД.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()  # ключ -> (значение, момент записи)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING or (self.ttl is not None and self.clock() - item[1] > self.ttl):
+            if item is not _MISSING:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def put(self, key, value):
+        self._data[key] = (value, self.clock())
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[0]
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,238 @@
+# metrics.py – гистограммы задержек и выдача в формате Prometheus
+import asyncio
+import os
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+# Границы корзин, секунды: от долей миллисекунды до ответа Telegram
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Методы БД, которые не являются запросами
+SKIP_DB_METHODS = {"connect", "close"}
+# Задача, в которой идёт замеряемый метод БД: вложенные вызовы методов не замеряются
+_db_method_task = ContextVar("db_method_task", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, le: str = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Гистограмма с метками; наблюдение – один bisect и два сложения."""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._children = {}  # значения меток -> [счётчики корзин, сумма]
+
+    def observe(self, value: float, *labels):
+        child = self._children.get(labels)
+        if child is None:
+            child = self._children[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        child[0][bisect_left(self.buckets, value)] += 1
+        child[1] += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, bound)} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, '+Inf')} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+
+    def inc(self, *labels, amount: int = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Время каждого хендлера с метками имени хендлера и состояния FSM."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    async def __call__(self, handler, event, data):
+        target = data.get("handler")
+        name = getattr(target.callback, "__name__", "unknown") if target else "unknown"
+        state = data.get("raw_state") or "-"
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.metrics.handler_errors.inc(name)
+            raise
+        finally:
+            self.metrics.handler_seconds.observe(time.perf_counter() - start, name, state)
+
+
+class ApiTimingMiddleware(BaseRequestMiddleware):
+    """Время запросов к Telegram Bot API по имени метода."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    async def __call__(self, make_request, bot, method):
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            self.metrics.api_seconds.observe(time.perf_counter() - start, type(method).__name__)
+
+
+class Metrics:
+    """Метрики бота. Пока install() не вызван, ничего не замеряется."""
+
+    def __init__(self):
+        self.handler_seconds = Histogram("bot_handler_seconds", "Handler latency", ("handler", "state"))
+        self.handler_errors = Counter("bot_handler_errors_total", "Handler exceptions", ("handler",))
+        self.update_errors = Counter("bot_update_errors_total", "Webhook updates whose processing raised",
+                                     ("error",))
+        # Один замер – весь внешний вызов метода БД, сколько бы запросов он ни выполнил
+        self.db_method_seconds = Histogram("bot_db_method_seconds", "Database method call latency, all statements",
+                                           ("method",))
+        self.db_statement_seconds = Histogram("bot_db_statement_seconds", "Database statement latency",
+                                              ("statement",))
+        self.api_seconds = Histogram("bot_telegram_api_seconds", "Telegram Bot API request latency", ("method",))
+        self.section_seconds = Histogram("bot_section_seconds", "Latency of marked code sections", ("section",))
+        self.throttled = Counter("bot_throttled_total", "Updates rejected by rate limiting", ("reason", "handler"))
+        self._gauges = []  # (имя, описание, функция значения, тип)
+
+    def install(self, dp, bot, db):
+        """Подключить замеры к диспетчеру, сессии бота и БД."""
+        middleware = HandlerTimingMiddleware(self)
+        dp.message.middleware(middleware)
+        dp.callback_query.middleware(middleware)
+        bot.session.middleware(ApiTimingMiddleware(self))
+        self.instrument_database(db)
+        self.gauge("bot_user_cache_hits_total", "User id cache hits", lambda: db.user_cache.hits, "counter")
+        self.gauge("bot_user_cache_misses_total", "User id cache misses", lambda: db.user_cache.misses, "counter")
+        self.gauge("bot_catalog_version", "Loaded catalog version", lambda: db.catalog.snapshot.version)
+        self.gauge("bot_log_queue", "Action log events waiting for flush",
+                   lambda: db.log_sink.queue.qsize() if db.log_sink else 0)
+
+    def instrument_database(self, db):
+        """Замерять каждый запрос (по имени оператора) и внешние вызовы методов БД.
+
+        Запросы замеряются на соединениях, поэтому вызывать до db.connect().
+        """
+        db.on_statement = lambda statement, seconds: self.db_statement_seconds.observe(seconds, statement)
+        for name in dir(type(db)):
+            if name.startswith("__") or name in SKIP_DB_METHODS:
+                continue
+            method = getattr(db, name)
+            if asyncio.iscoroutinefunction(method):
+                setattr(db, name, self._timed(method, name))
+
+    def _timed(self, method, name: str):
+        observe = self.db_method_seconds.observe
+
+        async def timed(*args, **kwargs):
+            task = asyncio.current_task()
+            if _db_method_task.get() is task:
+                return await method(*args, **kwargs)
+            token = _db_method_task.set(task)
+            start = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                observe(time.perf_counter() - start, name)
+                _db_method_task.reset(token)
+        return timed
+
+    def gauge(self, name: str, help: str, value, kind: str = "gauge"):
+        """Значение, читаемое функцией value в момент выдачи метрик."""
+        self._gauges.append((name, help, value, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in (self.handler_seconds, self.handler_errors, self.update_errors, self.db_method_seconds,
+                       self.db_statement_seconds, self.api_seconds, self.section_seconds, self.throttled):
+            lines += metric.render()
+        for name, help, value, kind in self._gauges:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value()}"]
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """Записать текущие метрики в файл (атомарно, через временный файл)."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    async def dump_periodically(self, path: str, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.dump(path)
+            except OSError as e:
+                print(f"Metrics dump failed: {e}")
+
+    async def serve(self, host: str, port: int):
+        """Отдавать метрики по http://host:port/metrics; возвращает runner для остановки."""
+        from aiohttp import web  # ставится вместе с aiogram
+
+        async def handle(request):
+            return web.Response(text=self.render(), content_type="text/plain", charset="utf-8",
+                                headers={"X-Prometheus-Format": "0.0.4"})
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        print(f"Metrics served on http://{host}:{port}/metrics")
+        return runner
+
+
+def timer(metrics, section: str):
+    """Замер участка кода: with timer(metrics, "build_pc"): ... (без метрик – пустой)."""
+    return metrics.section_seconds.time(section) if metrics else nullcontext()
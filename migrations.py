@@ -0,0 +1,275 @@
+# migrations.py – версии схемы БД: упорядоченные миграции для SQLite и PostgreSQL
+#
+# Применённые миграции записываются в schema_version, connect() бэкенда
+# доводит БД до последней версии. Схема меняется только новой миграцией в
+# конце MIGRATIONS – выпущенные не редактируются. Миграция 1 – схема на
+# момент появления версий (для PostgreSQL – schema.sql); её операторы
+# идемпотентны, поэтому она принимает и БД, созданные до версий. Применить
+# миграции и проверить планы горячих запросов:
+#
+#   python migrations.py --check-plans
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+from catalog import CATALOG_KEYS
+
+SCHEMA_FILE = Path(__file__).parent / "schema.sql"
+
+SCHEMA_VERSION_DDL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+# Таблицы каталога из schema.sql в диалекте SQLite + версия каталога
+CATALOG_DDL = """
+CREATE TABLE IF NOT EXISTS cpus (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    socket TEXT NOT NULL,
+    cores INTEGER,
+    tdp INTEGER,
+    price INTEGER
+);
+CREATE TABLE IF NOT EXISTS motherboards (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    socket TEXT NOT NULL,
+    form_factor TEXT NOT NULL,
+    ram_type TEXT NOT NULL,
+    max_ram INTEGER,
+    price INTEGER
+);
+CREATE TABLE IF NOT EXISTS gpus (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    chipset TEXT,
+    vram INTEGER,
+    length INTEGER,
+    tdp INTEGER,
+    price INTEGER
+);
+CREATE TABLE IF NOT EXISTS rams (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    size INTEGER,
+    speed INTEGER,
+    price INTEGER
+);
+CREATE TABLE IF NOT EXISTS storages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    capacity INTEGER,
+    price INTEGER
+);
+CREATE TABLE IF NOT EXISTS psus (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    power INTEGER NOT NULL,
+    modular BOOLEAN,
+    price INTEGER
+);
+CREATE TABLE IF NOT EXISTS cases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    form_factor TEXT NOT NULL,
+    gpu_max_length INTEGER,
+    psu_form_factor TEXT,
+    price INTEGER
+);
+CREATE TABLE IF NOT EXISTS coolers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    socket TEXT NOT NULL,
+    tdp_capacity INTEGER,
+    price INTEGER
+);
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS price_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    item_table TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    old_price INTEGER,
+    new_price INTEGER,
+    catalog_version INTEGER NOT NULL,
+    changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_price_history_item ON price_history (item_table, item_id, changed_at);
+""" + "".join(
+    # Уникальный естественный ключ – цель ON CONFLICT при импорте прайсов
+    f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{table}_key ON {table} ({', '.join(key)});\n"
+    for table, key in CATALOG_KEYS.items()
+)
+
+SQLITE_BASELINE = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    telegram_id INTEGER UNIQUE,
+    username TEXT
+);
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    action TEXT,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+-- Свёртка и удаление старых логов идут по диапазонам времени
+CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp);
+CREATE TABLE IF NOT EXISTS log_rollups (
+    period TEXT NOT NULL,
+    bucket DATETIME NOT NULL,
+    action TEXT NOT NULL,
+    usage TEXT NOT NULL DEFAULT '',
+    events INTEGER NOT NULL,
+    PRIMARY KEY (period, bucket, action, usage)
+);
+CREATE TABLE IF NOT EXISTS build_configs (
+    build_hash TEXT PRIMARY KEY,
+    cpu_id INTEGER,
+    motherboard_id INTEGER,
+    ram_id INTEGER,
+    gpu_id INTEGER,
+    storage_id INTEGER,
+    case_id INTEGER,
+    psu_id INTEGER,
+    cooler_id INTEGER,
+    total_price INTEGER,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS user_builds (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    build_hash TEXT NOT NULL REFERENCES build_configs (build_hash),
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+-- Ключ листания сборок пользователя (см. builds_page_sql)
+CREATE INDEX IF NOT EXISTS idx_user_builds_user_created ON user_builds (user_id, created_at, id);
+-- «Кто ещё сохранил эту сборку» – по индексу, без чтения таблицы
+CREATE INDEX IF NOT EXISTS idx_user_builds_hash ON user_builds (build_hash, user_id);
+CREATE TABLE IF NOT EXISTS budget_breakpoints (
+    usage TEXT,
+    catalog_version INTEGER,
+    budget_from INTEGER,
+    cpu_id INTEGER,
+    motherboard_id INTEGER,
+    ram_id INTEGER,
+    gpu_id INTEGER,
+    storage_id INTEGER,
+    psu_id INTEGER,
+    case_id INTEGER,
+    cooler_id INTEGER,
+    total_price INTEGER,
+    PRIMARY KEY (usage, catalog_version, budget_from)
+);
+CREATE TABLE IF NOT EXISTS fsm_sessions (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT,
+    updated_at INTEGER NOT NULL
+);
+""" + CATALOG_DDL
+
+PG_BASELINE = SCHEMA_FILE.read_text(encoding="utf-8").replace("CREATE TABLE ", "CREATE TABLE IF NOT EXISTS ")
+
+# Выборки каталога по ключу совместимости (сокет, тип памяти, форм-фактор) от дешёвых к дорогим
+CATALOG_FILTER_INDEXES = "".join(
+    f"CREATE INDEX IF NOT EXISTS idx_{table}_{'_'.join(columns)} ON {table} ({', '.join(columns)});\n"
+    for table, columns in (
+        ('cpus', ('socket', 'price')),
+        ('motherboards', ('socket', 'price')),
+        ('rams', ('type', 'price')),
+        ('coolers', ('socket', 'price')),
+        ('cases', ('form_factor', 'price')),
+        ('psus', ('power', 'price')),
+        ('gpus', ('price',)),
+        ('storages', ('price',)),
+    )
+)
+
+# Случайный id базы: файл снимка каталога (catalog_file.py) другой базы с тем
+# же номером версии каталога по нему отличается от своего
+CATALOG_DATABASE_ID = {
+    "sqlite": "INSERT INTO catalog_meta (key, value) VALUES ('database_id', (random() & 4503599627370495) + 1) "
+              "ON CONFLICT (key) DO NOTHING;\n",
+    "postgres": "INSERT INTO catalog_meta (key, value) "
+                "VALUES ('database_id', floor(random() * 4503599627370496)::bigint + 1) "
+                "ON CONFLICT (key) DO NOTHING;\n",
+}
+
+# Сумма сборки – в ссылке пользователя: одну конфигурацию сохраняют по разным
+# ценам каталога. Уже сохранённым ссылкам – сумма из их конфигурации
+USER_BUILD_PRICES = """
+ALTER TABLE user_builds ADD COLUMN total_price INTEGER;
+UPDATE user_builds SET total_price = (
+    SELECT c.total_price FROM build_configs c WHERE c.build_hash = user_builds.build_hash
+);
+"""
+
+# (версия, описание, шаг): шаг – SQL-скрипт по диалектам бэкенда или имя
+# метода бэкенда, если миграцию нельзя выразить одним SQL
+MIGRATIONS = [
+    (1, "baseline schema", {"sqlite": SQLITE_BASELINE, "postgres": PG_BASELINE}),
+    (2, "saved builds stored by configuration hash", "migrate_legacy_builds"),
+    (3, "catalog filter indexes", {"sqlite": CATALOG_FILTER_INDEXES, "postgres": CATALOG_FILTER_INDEXES}),
+    (4, "database id for catalog snapshot files", CATALOG_DATABASE_ID),
+    (5, "saved build price per user", {"sqlite": USER_BUILD_PRICES, "postgres": USER_BUILD_PRICES}),
+]
+
+
+async def migrate(db) -> list:
+    """Применить к БД недостающие миграции по порядку; вернуть их версии."""
+    current = await db.get_schema_version()
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        if isinstance(step, str):
+            await getattr(db, step)()
+            step = ""
+        else:
+            step = step[db.dialect]
+        if await db.apply_migration(version, description, step):
+            applied.append(version)
+    if applied:
+        print(f"Schema migrated to version {MIGRATIONS[-1][0]} (applied {', '.join(map(str, applied))})")
+    return applied
+
+
+async def run(args) -> dict:
+    # db импортирует этот модуль, поэтому бэкенды – только здесь
+    from config import DB_DSN
+    from db import open_database
+
+    db = open_database(DB_DSN, pg_min_size=1, pg_max_size=2)
+    await db.connect(load_catalog=False)  # connect() применяет миграции
+    try:
+        return {"version": await db.get_schema_version(),
+                "full_scans": await db.check_query_plans() if args.check_plans else {}}
+    finally:
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply schema migrations to the bot database.")
+    parser.add_argument("--check-plans", action="store_true",
+                        help="fail if a hot query reads a whole table instead of an index")
+    args = parser.parse_args()
+    stats = asyncio.run(run(args))
+    print(f"Schema version {stats['version']}")
+    for name, tables in stats["full_scans"].items():
+        print(f"Full scan in {name}: {', '.join(tables)}")
+    if stats["full_scans"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# power.py – векторные таблицы мощности БП и минимальной цены сборки по парам CPU×GPU
+import math
+
+import numpy as np
+
+from catalog import FORM_FACTOR_ORDER
+
+# Мощность БП: суммарный TDP с запасом POWER_MARGIN плюс POWER_RESERVE Вт
+POWER_MARGIN = 1.2
+POWER_RESERVE = 50
+
+
+def required_power_array(tdp) -> np.ndarray:
+    """Векторный вариант builder.required_power для массива суммарных TDP."""
+    return np.floor(np.asarray(tdp, dtype=np.float64) * POWER_MARGIN).astype(np.int64) + POWER_RESERVE
+
+
+def _prices(rows) -> np.ndarray:
+    return np.array([r['price'] for r in rows], dtype=np.float64)
+
+
+def _cheapest_by(keys: np.ndarray, prices: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """Для каждого q из queries – минимальная цена среди строк с ключом ≥ q (inf – таких нет)."""
+    order = np.argsort(keys, kind='stable')
+    suffix = np.minimum.accumulate(np.append(prices[order], np.inf)[::-1])[::-1]
+    return suffix[np.searchsorted(keys[order], queries, side='left')]
+
+
+class PowerTable:
+    """Таблицы по всем парам CPU×GPU для каталога одной версии.
+
+    Строки – cpus в переданном порядке, столбцы – gpus и последний столбец
+    «без видеокарты». Мощность БП зависит только от TDP, поэтому
+    required и psu считаются на сетке различных TDP (cpu_tdp_ix/gpu_tdp_ix
+    переводят номера строк и столбцов в неё). floor – цена самой дешёвой
+    полной совместимой сборки с этой парой (CPU с кулером, плата, ОЗУ,
+    накопитель, корпус под плату и длину GPU, БП), inf – такой нет.
+    """
+
+    def __init__(self, cpus: list, cpu_costs: list, gpus: list, candidates: dict):
+        self.cpu_row = {c['id']: i for i, c in enumerate(cpus)}
+        self.gpu_col = {g['id']: j for j, g in enumerate(gpus)}
+        self.no_gpu = len(gpus)
+        cpu_tdp = np.array([c.get('tdp') or 0 for c in cpus], dtype=np.int64)
+        gpu_tdp = np.array([g.get('tdp') or 0 for g in gpus] + [0], dtype=np.int64)
+        tdp_c, self.cpu_tdp_ix = np.unique(cpu_tdp, return_inverse=True)
+        tdp_g, self.gpu_tdp_ix = np.unique(gpu_tdp, return_inverse=True)
+        self.gpu_tdp = gpu_tdp
+        self.required = required_power_array(tdp_c[:, None] + tdp_g[None, :])
+
+        # Самый дешёвый БП мощностью ≥ required: суффиксный минимум цены по мощности
+        psus = sorted(candidates.get('psu', ()), key=lambda p: (p['power'], p['price']))
+        self.psus = psus
+        powers = np.array([p['power'] for p in psus], dtype=np.int64)
+        prices = _prices(psus)
+        best = np.arange(len(psus))
+        for i in range(len(psus) - 2, -1, -1):
+            if prices[best[i + 1]] < prices[i]:
+                best[i] = best[i + 1]
+        pos = np.searchsorted(powers, self.required, side='left')
+        self.psu = np.append(best, -1)[pos]  # -1 – мощности не хватает ни одного БП
+        self.max_power = int(powers[-1]) if len(psus) else -1
+        psu_price = np.append(prices[best], np.inf)[pos]
+
+        # Корпус: для каждого уровня форм-фактора платы и каждого столбца – цена самого дешёвого подходящего
+        cases = candidates.get('case', ())
+        case_ff = np.array([FORM_FACTOR_ORDER.get(c.get('form_factor'), 0) for c in cases], dtype=np.int64)
+        case_len = np.array([c.get('gpu_max_length') or math.inf for c in cases], dtype=np.float64)
+        case_price = _prices(cases)
+        gpu_len = np.array([g.get('length') or 0 for g in gpus] + [0], dtype=np.float64)
+        levels = sorted(set(FORM_FACTOR_ORDER.values()))
+        case_min = np.array([_cheapest_by(case_len[case_ff >= level], case_price[case_ff >= level], gpu_len)
+                             for level in levels]).reshape(len(levels), len(gpu_len))
+
+        # Плата с самой дешёвой ОЗУ своего типа и корпусом: минимум по платам сокета
+        ram_min = {}
+        for r in candidates.get('ram', ()):
+            ram_min[r.get('type')] = min(ram_min.get(r.get('type'), math.inf), r['price'])
+        sockets = sorted({c.get('socket') or '' for c in cpus})
+        board_min = np.full((len(sockets), len(gpu_len)), np.inf)
+        socket_ix = {s: i for i, s in enumerate(sockets)}
+        for m in candidates.get('motherboard', ()):
+            i = socket_ix.get(m.get('socket') or '')
+            if i is None:
+                continue
+            level = levels.index(FORM_FACTOR_ORDER.get(m.get('form_factor'), 0))
+            cost = m['price'] + ram_min.get(m.get('ram_type'), math.inf) + case_min[level]
+            np.minimum(board_min[i], cost, out=board_min[i])
+        storage_min = min((s['price'] for s in candidates.get('storage', ())), default=math.inf)
+
+        cpu_socket = np.array([socket_ix[c.get('socket') or ''] for c in cpus], dtype=np.int64)
+        gpu_price = np.append(_prices(gpus), 0.0)
+        # float32 точно хранит целые цены до 16 млн ₽ и вдвое экономит память
+        self.floor = (np.asarray(cpu_costs, dtype=np.float64)[:, None] + board_min[cpu_socket]
+                      + gpu_price[None, :] + psu_price[np.ix_(self.cpu_tdp_ix, self.gpu_tdp_ix)]
+                      + storage_min).astype(np.float32)
+        self.cpu_floor = self.floor.min(axis=1) if len(cpus) else np.empty(0)
+        self.case_ok = np.isfinite(case_min)
+        self.levels = levels
+
+    def required_power(self, ci: int, gj: int) -> int:
+        """Мощность БП для пары (строка CPU, столбец GPU)."""
+        return int(self.required[self.cpu_tdp_ix[ci], self.gpu_tdp_ix[gj]])
+
+    def cheapest_psu(self, ci: int, gj: int):
+        """Самый дешёвый БП нужной мощности для пары (None – нет такого)."""
+        i = self.psu[self.cpu_tdp_ix[ci], self.gpu_tdp_ix[gj]]
+        return self.psus[i] if i >= 0 else None
+
+    def feasible_gpus(self, cpu: dict, mobo: dict) -> np.ndarray:
+        """Маска столбцов-видеокарт, с которыми для выбранных CPU и платы найдутся БП и корпус."""
+        ci = self.cpu_row.get(cpu['id'])
+        level = self.levels.index(FORM_FACTOR_ORDER.get(mobo.get('form_factor'), 0))
+        if ci is None:
+            # CPU нет в таблице (выбран до того, как пропала его цена): мощность – по его TDP
+            psu_ok = required_power_array((cpu.get('tdp') or 0) + self.gpu_tdp) <= self.max_power
+        else:
+            psu_ok = self.psu[self.cpu_tdp_ix[ci]][self.gpu_tdp_ix] >= 0
+        return (psu_ok & self.case_ok[level])[:self.no_gpu]
@@ -0,0 +1,144 @@
+# rollups.py – почасовые и посуточные счётчики действий из таблицы logs
+#
+# Сырые логи сворачиваются в log_rollups (период, начало часа/суток, действие,
+# цель сборки) по завершившимся часам; запросы статистики читают только
+# свёртки, поэтому их цена зависит от длины периода, а не от истории. Сырые
+# строки старше срока хранения удаляются после свёртки. Отчёт за неделю:
+#
+#   python rollups.py --days 7
+import argparse
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta
+
+from config import DB_DSN
+from db import open_database
+from logsink import utcnow
+
+PERIODS = ("hour", "day")
+# Действия, у которых после префикса записана цель сборки (auto_build_done_Игры)
+USAGE_ACTIONS = ("auto_build_done_",)
+# Шаги воронки ручной сборки
+MANUAL_FUNNEL = ("start_manual_build", "manual_build_saved")
+# Час сворачивается, когда с его конца прошло ROLLUP_LAG: логи пишутся пачками с задержкой
+ROLLUP_LAG = timedelta(minutes=1)
+# Сколько часов истории сворачивать за один проход (первая свёртка большой таблицы)
+MAX_HOURS_PER_RUN = 24 * 31
+
+
+def split_action(action: str) -> tuple:
+    """Имя действия -> (действие, цель сборки или '')."""
+    for prefix in USAGE_ACTIONS:
+        if action.startswith(prefix):
+            return prefix[:-1], action[len(prefix):]
+    return action, ""
+
+
+def floor_hour(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(ts: datetime) -> datetime:
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+async def roll_up(db, now: datetime = None) -> int:
+    """Свернуть завершившиеся часы после последней свёртки; вернуть их число.
+
+    Свёртка часа перезаписывает его счётчики, а суточные пересчитываются
+    из часовых, поэтому повторный или параллельный проход ничего не удваивает.
+    """
+    end = floor_hour((now or utcnow()) - ROLLUP_LAG)
+    horizon = await db.get_rollup_horizon()
+    # Часы без логов пропускаются сразу: начинаем с первого лога после свёрнутого
+    first = await db.get_first_log_time(horizon or datetime.min)
+    if first is None:
+        return 0
+    start = floor_hour(first)
+    end = min(end, start + timedelta(hours=MAX_HOURS_PER_RUN))
+    if start >= end:
+        return 0
+    counts = Counter()
+    for hour, action, n in await db.fetch_log_counts(start, end):
+        counts[(hour, *split_action(action or ""))] += n
+    await db.save_rollups([(*key, n) for key, n in counts.items()], start, end)
+    return int((end - start) / timedelta(hours=1))
+
+
+async def compact(db, retention_days: float, now: datetime = None) -> int:
+    """Удалить сырые логи старше retention_days, которые уже свёрнуты; вернуть их число."""
+    horizon = await db.get_rollup_horizon()
+    if horizon is None:
+        return 0
+    return await db.purge_logs(min(horizon, (now or utcnow()) - timedelta(days=retention_days)))
+
+
+async def roll_up_periodically(db, interval: float, retention_days: float = 0):
+    """Фоновая задача: сворачивать логи и (retention_days > 0) удалять старые сырые строки."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # Догоняем отставание несколькими проходами, если логов много
+            while await roll_up(db) >= MAX_HOURS_PER_RUN:
+                pass
+            if retention_days > 0:
+                removed = await compact(db, retention_days)
+                if removed:
+                    print(f"Log rollups: {removed} raw log rows compacted")
+        except Exception as e:
+            print(f"Log rollup failed: {e}")
+
+
+async def action_counts(db, start: datetime, end: datetime, period: str = "day") -> Counter:
+    """{(действие, цель): число} за [start, end) по свёрткам периода period."""
+    if period not in PERIODS:
+        raise ValueError(f"Unknown rollup period: {period}")
+    totals = Counter()
+    for _, action, usage, n in await db.fetch_rollups(period, start, end):
+        totals[action, usage] += n
+    return totals
+
+
+async def usage_counts(db, start: datetime, end: datetime) -> Counter:
+    """Сколько автосборок подобрано по каждой цели за [start, end)."""
+    totals = await action_counts(db, start, end)
+    return Counter({usage: n for (action, usage), n in totals.items() if action == USAGE_ACTIONS[0][:-1]})
+
+
+async def funnel(db, start: datetime, end: datetime, steps: tuple = MANUAL_FUNNEL) -> list:
+    """[(шаг, число, доля от первого шага)] за [start, end)."""
+    totals = await action_counts(db, start, end)
+    counts = [sum(n for (action, _), n in totals.items() if action == step) for step in steps]
+    return [(step, n, n / counts[0] if counts[0] else 0.0) for step, n in zip(steps, counts)]
+
+
+async def report(args) -> dict:
+    db = open_database(DB_DSN, pg_min_size=1, pg_max_size=2)
+    await db.connect(load_catalog=False)
+    try:
+        hours = await roll_up(db)
+        end = floor_day(utcnow()) + timedelta(days=1)
+        start = end - timedelta(days=args.days)
+        return {"rolled_up_hours": hours,
+                "actions": {f"{a}:{u}" if u else a: n for (a, u), n in (await action_counts(db, start, end)).most_common()},
+                "manual_funnel": [(step, n, round(share, 3)) for step, n, share in await funnel(db, start, end)],
+                "compacted": await compact(db, args.retention_days) if args.retention_days else 0}
+    finally:
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roll up the action log and print usage statistics.")
+    parser.add_argument("--days", type=int, default=7, help="report period, days up to today")
+    parser.add_argument("--retention-days", type=float, default=0,
+                        help="also delete rolled-up raw logs older than this (0 = keep)")
+    args = parser.parse_args()
+    stats = asyncio.run(report(args))
+    print(f"Rolled up {stats['rolled_up_hours']} hours, compacted {stats['compacted']} raw rows")
+    for name, n in stats["actions"].items():
+        print(f"{n:>10}  {name}")
+    print("Manual build funnel: " + " -> ".join(f"{step} {n} ({share:.0%})" for step, n, share in stats["manual_funnel"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+-- Базовая схема PostgreSQL – миграция 1 (см. migrations.py); дальнейшие
+-- изменения схемы – только новыми миграциями
 CREATE TABLE users (
     id SERIAL PRIMARY KEY,
     telegram_id BIGINT UNIQUE NOT NULL,
@@ -69,9 +71,10 @@ CREATE TABLE coolers (
     price INT
 );
 
-CREATE TABLE builds (
-    id SERIAL PRIMARY KEY,
-    user_id INT REFERENCES users(id),
+-- Сохранённые сборки: конфигурация – одна строка на набор id компонентов
+-- (build_hash – хэш id), сохранение пользователя – ссылка на неё
+CREATE TABLE build_configs (
+    build_hash TEXT PRIMARY KEY,
     cpu_id INT REFERENCES cpus(id),
     motherboard_id INT REFERENCES motherboards(id),
     gpu_id INT REFERENCES gpus(id),
@@ -83,6 +86,16 @@ CREATE TABLE builds (
     total_price INT,
     created_at TIMESTAMP DEFAULT NOW()
 );
+CREATE TABLE user_builds (
+    id SERIAL PRIMARY KEY,
+    user_id INT REFERENCES users(id),
+    build_hash TEXT NOT NULL REFERENCES build_configs(build_hash),
+    created_at TIMESTAMP DEFAULT NOW()
+);
+-- Ключ листания сборок пользователя
+CREATE INDEX IF NOT EXISTS idx_user_builds_user_created ON user_builds (user_id, created_at, id);
+-- «Кто ещё сохранил эту сборку»
+CREATE INDEX IF NOT EXISTS idx_user_builds_hash ON user_builds (build_hash, user_id);
 
 CREATE TABLE logs (
     id SERIAL PRIMARY KEY,
@@ -90,3 +103,63 @@ CREATE TABLE logs (
     action TEXT,
     timestamp TIMESTAMP DEFAULT NOW()
 );
+-- Свёртка и удаление старых логов идут по диапазонам времени
+CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp);
+-- Счётчики действий по часам и суткам (см. rollups.py)
+CREATE TABLE log_rollups (
+    period TEXT NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    action TEXT NOT NULL,
+    usage TEXT NOT NULL DEFAULT '',
+    events BIGINT NOT NULL,
+    PRIMARY KEY (period, bucket, action, usage)
+);
+
+CREATE TABLE catalog_meta (
+    key TEXT PRIMARY KEY,
+    value BIGINT NOT NULL
+);
+
+-- Естественные ключи позиций каталога (цель upsert при импорте прайсов)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_cpus_key ON cpus (name);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_motherboards_key ON motherboards (name);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_gpus_key ON gpus (name);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_rams_key ON rams (name);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_storages_key ON storages (name);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_psus_key ON psus (name);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_cases_key ON cases (name);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_coolers_key ON coolers (name, socket);
+
+CREATE TABLE price_history (
+    id SERIAL PRIMARY KEY,
+    item_table TEXT NOT NULL,
+    item_id INT NOT NULL,
+    old_price INT,
+    new_price INT,
+    catalog_version BIGINT NOT NULL,
+    changed_at TIMESTAMP DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_price_history_item ON price_history (item_table, item_id, changed_at);
+
+CREATE TABLE budget_breakpoints (
+    usage TEXT,
+    catalog_version BIGINT,
+    budget_from INT,
+    cpu_id INT,
+    motherboard_id INT,
+    ram_id INT,
+    gpu_id INT,
+    storage_id INT,
+    psu_id INT,
+    case_id INT,
+    cooler_id INT,
+    total_price INT,
+    PRIMARY KEY (usage, catalog_version, budget_from)
+);
+
+CREATE TABLE fsm_sessions (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT,
+    updated_at BIGINT NOT NULL
+);
@@ -0,0 +1,149 @@
+# search_pool.py – подбор сборок в пуле процессов, вне цикла событий
+#
+# Каждый процесс пула один раз читает каталог – из файла снимка той же
+# версии (catalog_file.py, через mmap), иначе получает компактную копию
+# (кортежи значений вместо словарей) – и строит по нему индекс поиска; дальше
+# в пул уходят только (цель, бюджет, k), а обратно – id деталей. При смене
+# версии каталога поднимается новый пул, старый дорабатывает начатые запросы.
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from builder import COMPONENT_KINDS, SearchIndex, search_index, search_partial
+from catalog_file import open_catalog_file
+
+# Сколько ждать запуска процессов пула, с (упавший при старте процесс иначе не заметен)
+STARTUP_TIMEOUT = 120
+# Состояние процесса пула: версия каталога и индекс поиска по ней
+_worker = {}
+
+
+def pack_snapshot(snapshot) -> tuple:
+    """Строки кандидатов снимка в виде (версия, {категория: (столбцы, кортежи значений)}).
+
+    Если у снимка есть файл, передаётся только (версия, путь к файлу, id базы).
+    """
+    if snapshot.path is not None:
+        return snapshot.version, snapshot.path, snapshot.database_id
+    packed = {}
+    for kind, rows in snapshot.candidates().items():
+        columns = tuple(rows[0]) if rows else ()
+        packed[kind] = (columns, [tuple(r[c] for c in columns) for r in rows])
+    return snapshot.version, packed
+
+
+def _init_worker(version: int, packed, database_id: int = None):
+    if isinstance(packed, str):
+        catalog_file = open_catalog_file(packed, version, database_id)
+        if catalog_file is None:
+            raise RuntimeError(f"catalog file {packed} has no catalog version {version} of this database")
+        # Строки с ценой собираются из отображённого файла по мере обхода
+        candidates = {kind: catalog_file.table(kind).priced for kind in catalog_file.tables}
+    else:
+        candidates = {kind: [dict(zip(columns, values)) for values in rows]
+                      for kind, (columns, rows) in packed.items()}
+    _worker['version'] = version
+    _worker['index'] = SearchIndex(candidates)
+
+
+def _ready() -> int:
+    time.sleep(0.05)  # чтобы прогревочные задачи разошлись по разным процессам
+    return _worker['version']
+
+
+def _ids(builds: list) -> list:
+    return [tuple((b[kind] or {}).get('id', 0) for kind in COMPONENT_KINDS) for b in builds]
+
+
+def _solve(version: int, usage: str, budget: int, k: int, deadline: float) -> tuple:
+    """Поиск в процессе пула; deadline – time.time(), к которому нужен ответ."""
+    if _worker.get('version') != version:
+        raise RuntimeError(f"worker has catalog {_worker.get('version')}, request for {version}")
+    builds, partial = search_partial(_worker['index'], usage, budget, k, timeout=max(0.0, deadline - time.time()))
+    return _ids(builds), partial
+
+
+class SearchPool:
+    """Пул процессов для search_top с таймаутом на запрос.
+
+    Поиск в процессе останавливается к сроку timeout и отдаёт лучшее
+    найденное. Если ответа нет и через grace секунд после срока (пул
+    перегружен или упал), либо пул ещё не поднят на версии запроса, сборки
+    считаются в текущем процессе с коротким лимитом fallback. Частичные
+    результаты помечаются, чтобы их не кэшировать.
+    """
+
+    def __init__(self, workers: int, timeout: float = 2.0, fallback: float = 0.1, grace: float = 1.0):
+        self.workers = workers
+        self.timeout = timeout
+        self.fallback = fallback
+        self.grace = grace
+        self.executor = None
+        self.version = None
+        self.requests = 0
+        self.partial = 0
+        self.fallbacks = 0
+        self._lock = asyncio.Lock()
+
+    async def update(self, snapshot):
+        """Поднять пул на снимке snapshot (если он ещё не на этой версии)."""
+        async with self._lock:
+            if self.version == snapshot.version:
+                return
+            start = time.perf_counter()
+            executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                           initializer=_init_worker, initargs=pack_snapshot(snapshot))
+            loop = asyncio.get_running_loop()
+            try:
+                # Процессы запускаются и строят индекс до того, как на них пойдут запросы
+                await asyncio.wait_for(asyncio.gather(*(loop.run_in_executor(executor, _ready)
+                                                        for _ in range(self.workers))), STARTUP_TIMEOUT)
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+            old, self.executor, self.version = self.executor, executor, snapshot.version
+            if old is not None:
+                old.shutdown(wait=False)
+            print(f"Search pool: {self.workers} workers on catalog {snapshot.version} "
+                  f"in {time.perf_counter() - start:.2f}s")
+
+    async def search(self, snapshot, usage: str, budget: int, k: int) -> tuple:
+        """(сборки id по COMPONENT_KINDS, частичный ли результат) для снимка snapshot."""
+        self.requests += 1
+        if self.executor is not None and self.version == snapshot.version:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, _solve, snapshot.version, usage, budget, k,
+                                          time.time() + self.timeout)
+            try:
+                ids, partial = await asyncio.wait_for(future, self.timeout + self.grace)
+                self.partial += partial
+                return ids, partial
+            except asyncio.TimeoutError:
+                pass  # запрос ещё в очереди пула – wait_for его отменил
+            except BrokenProcessPool:
+                print("Search pool is broken, restarting on the next catalog check")
+                self.executor, self.version = None, None
+        self.fallbacks += 1
+        builds, partial = search_partial(search_index(snapshot), usage, budget, k, timeout=self.fallback)
+        self.partial += partial
+        return _ids(builds), partial
+
+    async def watch(self, catalog, interval: float):
+        """Фоновая задача: поднимать пул на новой версии каталога."""
+        while True:
+            try:
+                await self.update(catalog.snapshot)
+            except Exception as e:
+                print(f"Search pool update failed: {e}")
+            await asyncio.sleep(interval)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "version": self.version, "requests": self.requests,
+                "partial": self.partial, "fallbacks": self.fallbacks}
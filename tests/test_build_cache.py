@@ -0,0 +1,50 @@
+# test_build_cache.py – кэш автосборок при смене версии каталога
+import asyncio
+import copy
+import random
+
+from build_cache import BuildCache, _search
+from builder import search_index, search_top
+from catalog import CatalogSnapshot
+from test_builder import random_candidates
+
+
+class GatedPool:
+    """Пул поиска в этом же процессе: поиск по новой версии ждёт release."""
+
+    def __init__(self, version: int):
+        self.version = version
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def search(self, snapshot, usage: str, budget: int, k: int) -> tuple:
+        if snapshot.version == self.version:
+            self.started.set()
+            await self.release.wait()
+        return _search(snapshot, usage, budget, k, None)
+
+
+def test_result_of_old_snapshot_is_not_kept_after_refresh():
+    rows = random_candidates(random.Random(3), 30)
+    changed = copy.deepcopy(rows)
+    for row in changed['cpu']:
+        row['price'] += 1000
+    old, new = CatalogSnapshot(1, rows), CatalogSnapshot(2, changed)
+
+    async def scenario():
+        cache = BuildCache()
+        pool = GatedPool(new.version)
+        cache.get(old, "игры", 150000)
+        refresh = asyncio.create_task(cache.refresh(new, pool))
+        await pool.started.wait()
+        # refresh() ждёт пересчёта, а поиск по старому снимку уже закончился
+        await cache.fetch(old, "игры", 200000, 1, pool)
+        assert ("игры", 200000, 1) not in cache.entries
+        pool.release.set()
+        await refresh
+        assert ("игры", 200000, 1) not in cache.entries
+        expected = search_top(search_index(new), "игры", 200000, 1)
+        assert cache.get(new, "игры", 200000) == expected
+        assert cache.get(old, "игры", 200000) == search_top(search_index(old), "игры", 200000, 1)
+
+    asyncio.run(scenario())
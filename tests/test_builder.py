@@ -0,0 +1,62 @@
+# test_builder.py – свойства поиска сборок на случайных каталогах
+import random
+
+import pytest
+
+from builder import SearchIndex, USAGE_WEIGHTS, diversity_key, search, search_top
+
+SOCKETS = {'AM4': 'DDR4', 'AM5': 'DDR5', 'LGA1700': 'DDR5'}
+FORM_FACTORS = ('Mini-ITX', 'mATX', 'ATX')
+
+
+def random_candidates(rnd: random.Random, size: int) -> dict:
+    ids = iter(range(1, 10 ** 6))
+
+    def rows(make):
+        return [dict(make(), id=next(ids)) for _ in range(size)]
+
+    return {
+        'cpu': rows(lambda: {'name': "CPU", 'socket': rnd.choice(list(SOCKETS)), 'cores': 8,
+                             'tdp': rnd.choice((35, 65, 125, 170)), 'price': rnd.randint(4000, 80000)}),
+        'motherboard': rows(lambda: (lambda s: {'name': "Board", 'socket': s, 'form_factor': rnd.choice(FORM_FACTORS),
+                                                'ram_type': SOCKETS[s], 'max_ram': 128,
+                                                'price': rnd.randint(4000, 40000)})(rnd.choice(list(SOCKETS)))),
+        'ram': rows(lambda: {'name': "RAM", 'type': rnd.choice(('DDR4', 'DDR5')), 'size': 16, 'speed': 3200,
+                             'price': rnd.randint(1500, 30000)}),
+        'gpu': rows(lambda: {'name': "GPU", 'chipset': "test", 'vram': 8, 'length': rnd.randint(150, 340),
+                             'tdp': rnd.randint(50, 450), 'price': rnd.randint(6000, 200000)}),
+        'storage': rows(lambda: {'name': "SSD", 'type': "SSD", 'capacity': 512, 'price': rnd.randint(2000, 30000)}),
+        'psu': rows(lambda: {'name': "PSU", 'power': rnd.randrange(300, 1300, 50), 'modular': False,
+                             'price': rnd.randint(2000, 25000)}),
+        'case': rows(lambda: {'name': "Case", 'form_factor': rnd.choice(FORM_FACTORS),
+                              'gpu_max_length': rnd.randint(200, 400), 'psu_form_factor': "ATX",
+                              'price': rnd.randint(1500, 20000)}),
+        'cooler': rows(lambda: {'name': "Cooler", 'socket': rnd.choice(list(SOCKETS)),
+                                'tdp_capacity': rnd.choice((95, 130, 180, 250)), 'price': rnd.randint(800, 15000)}),
+    }
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_search_top_starts_with_search(seed):
+    rnd = random.Random(seed)
+    index = SearchIndex(random_candidates(rnd, rnd.choice((5, 20, 60))))
+    for usage in USAGE_WEIGHTS:
+        for _ in range(5):
+            budget = rnd.randint(20000, 400000)
+            best = search(index, usage, budget)
+            for k in (1, 2, 3, 5):
+                top = search_top(index, usage, budget, k)
+                assert (top[0] if top else {}) == best
+                assert len(top) <= k
+                assert len({diversity_key(b) for b in top}) == len(top)
+                assert all(b['total_price'] <= budget for b in top)
+
+
+def test_feasible_gpus_for_cpu_missing_from_power_table():
+    candidates = random_candidates(random.Random(3), 30)
+    index = SearchIndex(candidates)
+    for cpu in index.cpus:
+        for mobo in candidates['motherboard']:
+            # CPU без цены в таблицу не попадает: маска считается по его TDP
+            unpriced = dict(cpu, id=-1, price=None)
+            assert (index.power.feasible_gpus(unpriced, mobo) == index.power.feasible_gpus(cpu, mobo)).all()
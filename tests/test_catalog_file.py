@@ -0,0 +1,95 @@
+# test_catalog_file.py – снимок каталога из файла против снимка из строк БД
+import asyncio
+import os
+import random
+import stat
+
+from builder import USAGE_WEIGHTS, search_index, search_top
+from catalog import CATALOG_COLUMNS, CATALOG_TABLES, SECONDARY_INDEXES, CatalogSnapshot
+from catalog_file import open_catalog_file, write_catalog_file
+from db import open_database
+from test_builder import random_candidates
+from test_db import import_cpus
+
+
+def catalog_rows(seed: int) -> dict:
+    """Случайный каталог с позициями без цены и пустыми необязательными столбцами."""
+    rnd = random.Random(seed)
+    rows = random_candidates(rnd, 40)
+    for kind, kind_rows in rows.items():
+        optional = [name for name, _, required in CATALOG_COLUMNS[CATALOG_TABLES[kind]]
+                    if not required and name != 'price']
+        for row in rnd.sample(kind_rows, 5):
+            row['price'] = None
+        for row in rnd.sample(kind_rows, 5):
+            row[rnd.choice(optional)] = None
+    return rows
+
+
+def test_file_snapshot_matches_rows_snapshot(tmp_path):
+    rows = catalog_rows(1)
+    path = tmp_path / "catalog.snapshot"
+    write_catalog_file(path, 7, rows, database_id=11)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+    expected = CatalogSnapshot(7, rows)
+    catalog_file = open_catalog_file(path, version=7, database_id=11)
+    snapshot = CatalogSnapshot(7, catalog_file, path=path.as_posix())
+
+    # Индексы построены по столбцам: ни одна строка ещё не собрана
+    assert all(row is None for kind in rows for row in catalog_file.table(kind)._rows)
+    for kind, (kind_rows, prices) in expected.kinds.items():
+        assert list(snapshot.kinds[kind][0]) == kind_rows
+        assert snapshot.kinds[kind][1] == prices
+        assert dict(snapshot.by_id[kind]) == expected.by_id[kind]
+        for name in SECONDARY_INDEXES.get(kind, {}):
+            assert {key: (list(rs), ps) for key, (rs, ps) in snapshot.indexes[kind][name].items()} == \
+                expected.indexes[kind][name]
+        unpriced = next(r['id'] for r in rows[kind] if r['price'] is None)
+        assert snapshot.get(kind, unpriced) == expected.get(kind, unpriced)
+        assert snapshot.get(kind, -1) is None
+    assert snapshot.select('cpu', 'socket', 'AM5', max_price=40000, limit=3) == \
+        expected.select('cpu', 'socket', 'AM5', max_price=40000, limit=3)
+    # Строка собирается один раз: индексы и by_id отдают один и тот же словарь
+    first = snapshot.kinds['cpu'][0][0]
+    assert snapshot.get('cpu', first['id']) is first
+    for usage in USAGE_WEIGHTS:
+        assert search_top(search_index(snapshot), usage, 150000, 3) == \
+            search_top(search_index(expected), usage, 150000, 3)
+
+
+def test_other_version_or_damaged_file_is_ignored(tmp_path):
+    path = tmp_path / "catalog.snapshot"
+    assert open_catalog_file(path) is None
+    write_catalog_file(path, 3, catalog_rows(2), database_id=5)
+    assert open_catalog_file(path, version=4, database_id=5) is None
+    assert open_catalog_file(path, version=3, database_id=6) is None
+    path.write_bytes(path.read_bytes()[:20])
+    assert open_catalog_file(path, version=3, database_id=5) is None
+
+
+def test_shared_file_is_not_taken_from_another_database(dsn, tmp_path):
+    """Две базы с одной версией каталога и общим путём файла снимка."""
+    shared = (tmp_path / "catalog.snapshot").as_posix()
+
+    async def names(db) -> list:
+        await db.catalog.load(db)
+        return sorted(r['name'] for r in db.catalog.snapshot.kinds['cpu'][0])
+
+    async def scenario():
+        demo = open_database((tmp_path / "demo.db").as_posix(), catalog_path=shared)
+        await demo.connect(load_catalog=False, seed_demo=True)
+        imported = open_database(dsn, pg_min_size=1, pg_max_size=2, catalog_path=shared)
+        await imported.connect(load_catalog=False)
+        try:
+            await import_cpus(imported, tmp_path)
+            assert await demo.get_catalog_version() == await imported.get_catalog_version() == 1
+            assert await demo.get_database_id() != await imported.get_database_id()
+            demo_cpus = await names(demo)
+            # Файл демо-базы лежит по тому же пути с той же версией, но не подходит
+            assert await names(imported) == ["Core i5-12400F", "Ryzen 5 7600", "Ryzen 7 7700"]
+            assert await names(demo) == demo_cpus != await names(imported)
+        finally:
+            await demo.close()
+            await imported.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,268 @@
+# test_db.py – одни и те же сценарии для бэкендов SQLite и PostgreSQL
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+
+from db import build_hash, open_database
+from importer import import_feed
+from metrics import Metrics
+from migrations import MIGRATIONS, migrate
+from rollups import action_counts, roll_up
+
+CPUS_CSV = """name,socket,cores,tdp,price
+Ryzen 5 7600,AM5,6,65,20000
+Ryzen 7 7700,AM5,8,65,30000
+Core i5-12400F,LGA1700,6,65,15000
+"""
+
+LEGACY_BUILDS_DDL = {
+    "sqlite": "CREATE TABLE builds (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, {ids}, "
+              "total_price INTEGER, created_at DATETIME DEFAULT CURRENT_TIMESTAMP)",
+    "postgres": "CREATE TABLE builds (id SERIAL PRIMARY KEY, user_id INTEGER, {ids}, "
+                "total_price INTEGER, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)",
+}
+
+
+async def connect(dsn: str, **options):
+    db = open_database(dsn, pg_min_size=1, pg_max_size=4)
+    await db.connect(**options)
+    return db
+
+
+async def execute(db, script: str):
+    """Выполнить SQL в обход методов бэкенда (подготовка данных теста)."""
+    if db.dialect == "sqlite":
+        await db.conn.executescript(script)
+    else:
+        async with db.pool.acquire() as conn:
+            await conn.execute(script)
+
+
+async def import_cpus(db, tmp_path, text: str = CPUS_CSV) -> dict:
+    path = tmp_path / "cpus.csv"
+    path.write_text(text, encoding="utf-8")
+    return await import_feed(db, "cpus", path.as_posix())
+
+
+def test_migrations_bring_schema_to_latest(dsn):
+    async def scenario():
+        db = await connect(dsn)
+        try:
+            assert await db.get_schema_version() == MIGRATIONS[-1][0]
+            assert await migrate(db) == []
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_connects_apply_each_migration_once(dsn):
+    if not dsn.startswith(("postgres://", "postgresql://")):
+        pytest.skip("only PostgreSQL serializes migrations between processes (advisory lock)")
+
+    async def scenario():
+        dbs = [open_database(dsn, pg_min_size=1, pg_max_size=2) for _ in range(3)]
+        await asyncio.gather(*(db.connect(load_catalog=False) for db in dbs))
+        try:
+            async with dbs[0].pool.acquire() as conn:
+                versions = [r[0] for r in await conn.fetch("SELECT version FROM schema_version ORDER BY version")]
+            assert versions == [version for version, _, _ in MIGRATIONS]
+        finally:
+            for db in dbs:
+                await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_users(dsn):
+    async def scenario():
+        db = await connect(dsn)
+        try:
+            user_id = await db.add_user(1001, "alice")
+            assert await db.add_user(1001, "alice_renamed") == user_id
+            assert await db.add_user(1002, "bob") != user_id
+            db.user_cache.clear()
+            assert await db.get_user_id(1001) == user_id
+            assert await db.get_user_id(9999) is None
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_statements_and_outer_methods_are_timed(dsn, tmp_path):
+    async def scenario():
+        metrics = Metrics()
+        db = open_database(dsn, pg_min_size=1, pg_max_size=4)
+        metrics.instrument_database(db)
+        await db.connect(load_catalog=False)
+        try:
+            await import_cpus(db, tmp_path)
+            user_id = await db.add_user(1001, "alice")
+            db.user_cache.clear()
+            assert await db.get_user_id(1001) == user_id
+            await db.save_build(user_id, {'cpu_id': 1, 'total_price': 20000})
+            assert len(await db.get_builds(user_id)) == 1
+        finally:
+            await db.close()
+        methods = metrics.db_method_seconds._children
+        assert sum(methods[("get_user_id",)][0]) == 1
+        # Вложенный _fetch_user_id уже вошёл в замер get_user_id
+        assert ("_fetch_user_id",) not in methods and ("_upsert_user",) not in methods
+        statements = {labels[0] for labels in metrics.db_statement_seconds._children}
+        assert {"select users", "insert users", "insert build_configs", "select user_builds"} <= statements
+        assert 'bot_db_statement_seconds_count{statement="select users"}' in metrics.render()
+
+    asyncio.run(scenario())
+
+
+def test_log_actions_direct_and_batched(dsn):
+    async def scenario():
+        db = await connect(dsn)
+        start = datetime.utcnow() - timedelta(hours=1)
+        try:
+            user_id = await db.add_user(1001, "alice")
+            await db.log_action(user_id, "start")
+            db.start_log_sink(batch_size=10, flush_interval_ms=50)
+            for _ in range(25):
+                await db.log_action(user_id, "auto_build_done_Игры")
+            await db.log_sink.close()  # дописывает очередь
+            db.log_sink = None
+            counts = Counter()
+            for _, action, n in await db.fetch_log_counts(start, start + timedelta(hours=3)):
+                counts[action] += n
+            assert counts == {"start": 1, "auto_build_done_Игры": 25}
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_saved_builds(dsn, tmp_path):
+    async def scenario():
+        db = await connect(dsn, load_catalog=False)
+        try:
+            await import_cpus(db, tmp_path)
+            alice = await db.add_user(1, "alice")
+            bob = await db.add_user(2, "bob")
+            shared = {'cpu_id': 1, 'total_price': 20000}
+            key = await db.save_build(alice, shared)
+            db.known_builds.clear()
+            assert await db.save_build(bob, shared) == key == build_hash(shared)
+            await db.save_build(alice, {'cpu_id': 2, 'total_price': 30000})
+            assert await db.count_build_savers(key) == 2
+            assert len(await db.get_builds(alice)) == 2
+
+            page = await db.get_builds_page(alice, limit=1)
+            assert [b['total_price'] for b in page['builds']] == [30000]
+            assert (page['has_older'], page['has_newer']) == (True, False)
+            older = await db.get_builds_page(alice, "older", page['builds'][0]['id'], limit=1)
+            first = older['builds'][0]
+            assert (first['hash'], first['components']['cpu']['name']) == (key, "Ryzen 5 7600")
+            assert (older['has_older'], older['has_newer']) == (False, True)
+
+            assert (await db.get_build(alice, first['id']))['total_price'] == 20000
+            assert await db.get_build(bob, first['id']) is None
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_same_build_saved_at_two_prices(dsn, tmp_path):
+    async def scenario():
+        db = await connect(dsn, load_catalog=False)
+        try:
+            await import_cpus(db, tmp_path)
+            alice = await db.add_user(1, "alice")
+            bob = await db.add_user(2, "bob")
+            key = await db.save_build(alice, {'cpu_id': 1, 'total_price': 20000})
+            # Цена CPU выросла: та же конфигурация, но своя сумма у нового сохранения
+            assert await db.save_build(bob, {'cpu_id': 1, 'total_price': 23000}) == key
+            db.known_builds.clear()
+            await db.save_build(alice, {'cpu_id': 1, 'total_price': 25000})
+            assert await db.count_build_savers(key) == 2
+            assert [b['total_price'] for b in await db.get_builds(alice)] == [25000, 20000]
+            assert [b['total_price'] for b in await db.get_builds(bob)] == [23000]
+            page = await db.get_builds_page(bob, limit=5)
+            assert [b['total_price'] for b in page['builds']] == [23000]
+            assert (await db.get_build(bob, page['builds'][0]['id']))['total_price'] == 23000
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_legacy_builds_migration(dsn, tmp_path):
+    async def scenario():
+        db = await connect(dsn, load_catalog=False)
+        await import_cpus(db, tmp_path)
+        alice, bob = await db.add_user(1, "alice"), await db.add_user(2, "bob")
+        ids = ", ".join(f"{kind}_id INTEGER" for kind in
+                        ('cpu', 'motherboard', 'ram', 'gpu', 'storage', 'case', 'psu', 'cooler'))
+        await execute(db, ";\n".join((
+            LEGACY_BUILDS_DDL[db.dialect].format(ids=ids),
+            f"INSERT INTO builds (user_id, cpu_id, total_price) VALUES ({alice}, 1, 100)",
+            f"INSERT INTO builds (user_id, cpu_id, total_price) VALUES ({bob}, 1, 100)",
+            f"INSERT INTO builds (user_id, cpu_id, total_price) VALUES ({alice}, 3, 50)",
+            # Схема до миграции 5: сумма была только в build_configs
+            "ALTER TABLE user_builds DROP COLUMN total_price",
+            "DELETE FROM schema_version WHERE version >= 2",
+        )))
+        await db.close()
+
+        db = await connect(dsn, load_catalog=False)
+        try:
+            assert await db.get_schema_version() == MIGRATIONS[-1][0]
+            assert [(b['id'], b['total_price']) for b in await db.get_builds(alice)] == [(3, 50), (1, 100)]
+            assert await db.count_build_savers(build_hash({'cpu_id': 1})) == 2
+            # Следующая сохранённая сборка получает id после перенесённых
+            await db.save_build(bob, {'cpu_id': 2, 'total_price': 10})
+            assert max(b['id'] for b in await db.get_builds(bob)) == 4
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_fsm_sessions_and_breakpoints(dsn):
+    async def scenario():
+        db = await connect(dsn, load_catalog=False)
+        try:
+            await db.fsm_save("1:1", "BuildAutoState:budget", '{"usage": "Игры"}', 100)
+            await db.fsm_save("1:2", None, "{}", 200)
+            assert tuple(await db.fsm_load("1:1")) == ("BuildAutoState:budget", '{"usage": "Игры"}', 100)
+            assert await db.fsm_purge(150) == 1
+            await db.fsm_delete("1:2")
+            assert await db.fsm_load("1:2") is None
+
+            rows = [(0, 1, 2, 3, 4, 5, 6, 7, 8, 900), (1000, 1, 2, 3, 4, 5, 6, 7, 0, 1000)]
+            await db.save_breakpoints("Игры", 5, rows)
+            assert [tuple(r) for r in await db.load_breakpoints("Игры", 5)] == rows
+            assert list(await db.load_breakpoints("Игры", 6)) == []
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_log_rollups(dsn):
+    async def scenario():
+        db = await connect(dsn, load_catalog=False)
+        now = datetime(2026, 5, 1, 12, 30)
+        try:
+            alice, bob = await db.add_user(1, "alice"), await db.add_user(2, "bob")
+            await db.insert_actions([(alice, "auto_build_done_Игры", now - timedelta(hours=2)),
+                                     (bob, "auto_build_done_Офис", now - timedelta(hours=2)),
+                                     (alice, "start_manual_build", now - timedelta(hours=1))])
+            assert await roll_up(db, now) == 2
+            assert await roll_up(db, now) == 0
+            totals = await action_counts(db, now - timedelta(days=1), now, "hour")
+            assert totals == {("auto_build_done", "Игры"): 1, ("auto_build_done", "Офис"): 1,
+                              ("start_manual_build", ""): 1}
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
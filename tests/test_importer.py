@@ -0,0 +1,54 @@
+# test_importer.py – импорт прайса в пустую БД без демо-каталога
+import argparse
+import asyncio
+
+import importer
+from catalog import CATALOG_TABLES
+from catalog_file import open_catalog_file
+from db import open_database
+
+CPUS_CSV = """name,socket,cores,tdp,price
+Ryzen 5 7600,AM5,6,65,20000
+Ryzen 7 7700,AM5,8,65,30000
+Core i5-12400F,LGA1700,6,65,15000
+Core i5-12400F,LGA1700,6,65,14500
+Broken CPU,AM5,six,65,10000
+"""
+
+
+def test_import_into_empty_database(dsn, tmp_path, monkeypatch):
+    feed = tmp_path / "cpus.csv"
+    feed.write_text(CPUS_CSV, encoding="utf-8")
+    snapshot_path = tmp_path / "catalog.snapshot"
+    monkeypatch.setattr(importer, "DB_DSN", dsn)
+    monkeypatch.setattr(importer, "CATALOG_SNAPSHOT_PATH", snapshot_path.as_posix())
+    args = argparse.Namespace(table="cpus", path=feed.as_posix(), format=None, batch_size=2, max_errors=0)
+
+    async def scenario():
+        stats = await importer.run(args)
+        assert (stats["rows"], stats["rejected"], stats["changed"], stats["version"]) == (5, 1, 3, 1)
+        assert stats["catalog_file"]
+
+        db = open_database(dsn, pg_min_size=1, pg_max_size=2)
+        await db.connect(load_catalog=False)
+        try:
+            rows = await db.fetch_catalog_rows()
+            assert await db.get_catalog_version() == 1
+            database_id = await db.get_database_id()
+        finally:
+            await db.close()
+        # Только строки прайса: демо-каталог в БД не попал
+        assert {kind: len(rows[kind]) for kind in CATALOG_TABLES} == {kind: 3 if kind == 'cpu' else 0
+                                                                      for kind in CATALOG_TABLES}
+        prices = {r['name']: r['price'] for r in rows['cpu']}
+        assert prices == {"Ryzen 5 7600": 20000, "Ryzen 7 7700": 30000, "Core i5-12400F": 14500}
+
+        with open_catalog_file(snapshot_path, version=1, database_id=database_id) as saved:
+            assert {r['name']: r['price'] for r in saved.table('cpu').priced} == prices
+            assert not any(saved.table(kind).by_id for kind in CATALOG_TABLES if kind != 'cpu')
+
+        # Повторный импорт того же прайса ничего не меняет
+        stats = await importer.run(args)
+        assert (stats["changed"], stats["version"], stats["catalog_file"]) == (0, 1, False)
+
+    asyncio.run(scenario())
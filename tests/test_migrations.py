@@ -0,0 +1,30 @@
+# test_migrations.py – миграции на пустой БД и планы горячих запросов
+import argparse
+import asyncio
+
+import config
+from db import open_database
+from migrations import MIGRATIONS, run
+
+# Параметр запроса в SQL бэкенда
+MARKS = {"sqlite": "?", "postgres": "$1"}
+
+
+def test_hot_queries_use_indexes_after_migrations(dsn, monkeypatch):
+    monkeypatch.setattr(config, "DB_DSN", dsn)
+    result = asyncio.run(run(argparse.Namespace(check_plans=True)))
+    assert result == {"version": MIGRATIONS[-1][0], "full_scans": {}}
+
+
+def test_check_query_plans_reports_full_scans(dsn):
+    async def scenario():
+        db = open_database(dsn, pg_min_size=1, pg_max_size=2)
+        await db.connect(load_catalog=False)
+        try:
+            # Запрос без подходящего индекса: проверка должна его заметить
+            db.hot_queries = {"by_username": ("SELECT id FROM users WHERE username = " + MARKS[db.dialect], ("alice",))}
+            assert await db.check_query_plans() == {"by_username": ["users"]}
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
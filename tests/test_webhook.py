@@ -0,0 +1,99 @@
+# test_webhook.py – порядок, параллелизм и переполнение UpdateScheduler
+import asyncio
+import random
+
+from aiogram import Bot
+from aiogram.types import Update
+from aiohttp import ClientSession
+
+from metrics import Metrics
+from webhook import UpdateScheduler, serve
+
+
+def make_update(update_id: int, user_id: int) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+    return {"update_id": update_id, "message": {"message_id": update_id, "date": 0, "text": "hi",
+                                                "chat": {"id": user_id, "type": "private"}, "from": user}}
+
+
+class StubDispatcher:
+    """Вместо aiogram Dispatcher: запоминает порядок и число одновременных апдейтов."""
+
+    def __init__(self, fail=(), delay: float = 0.002, seed: int = 0):
+        self.fail = set(fail)
+        self.delay = delay
+        self.random = random.Random(seed)
+        self.seen = {}       # пользователь -> update_id по порядку обработки
+        self.active = 0
+        self.max_active = 0
+        self.release = None  # asyncio.Event: пока не установлено, обработка стоит
+
+    async def feed_update(self, bot, update: Update):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            if self.release is not None:
+                await self.release.wait()
+            await asyncio.sleep(self.random.random() * self.delay)
+            self.seen.setdefault(update.message.from_user.id, []).append(update.update_id)
+            if update.update_id in self.fail:
+                raise RuntimeError("handler failed")
+        finally:
+            self.active -= 1
+
+
+def test_scheduler_keeps_user_order_and_bounds_parallelism():
+    async def scenario():
+        dp = StubDispatcher(fail={7})
+        metrics = Metrics()
+        scheduler = UpdateScheduler(dp, None, concurrency=4, max_pending=1000, metrics=metrics)
+        sent = {}
+        # Апдейты 12 пользователей вперемешку, по 10 на каждого
+        owners = [user for user in range(1, 13) for _ in range(10)]
+        random.Random(1).shuffle(owners)
+        for update_id, user in enumerate(owners, 1):
+            assert scheduler.submit(Update.model_validate(make_update(update_id, user)))
+            sent.setdefault(user, []).append(update_id)
+        await scheduler.drain(timeout=10)
+
+        assert dp.seen == sent  # у каждого пользователя – в порядке поступления, ошибка не рвёт очередь
+        assert 1 < dp.max_active <= 4
+        assert scheduler.stats() == {"pending": 0, "running": 0, "processed": 119, "failed": 1, "rejected": 0}
+        assert scheduler.tails == {}
+        assert "bot_update_errors_total{error=\"RuntimeError\"} 1" in metrics.render()
+
+    asyncio.run(scenario())
+
+
+def test_webhook_answers_503_when_pending_limit_is_reached():
+    async def scenario():
+        dp = StubDispatcher()
+        dp.release = asyncio.Event()
+        bot = Bot("42:TEST")
+        scheduler = UpdateScheduler(dp, bot, concurrency=2, max_pending=3)
+        runner = await serve(dp, bot, scheduler, "127.0.0.1", 0, "/webhook", secret="s3cret")
+        port = runner.addresses[0][1]
+        url = f"http://127.0.0.1:{port}/webhook"
+        headers = {"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+        try:
+            async with ClientSession() as session:
+                statuses = []
+                for update_id in range(1, 6):
+                    async with session.post(url, json=make_update(update_id, update_id), headers=headers) as r:
+                        statuses.append(r.status)
+                async with session.post(url, json=make_update(9, 9)) as r:
+                    statuses.append(r.status)
+                async with session.post(url, data=b"not json", headers=headers) as r:
+                    statuses.append(r.status)
+            assert statuses == [200, 200, 200, 503, 503, 401, 400]
+            assert (scheduler.stats()["pending"], scheduler.rejected) == (3, 2)
+            assert dp.max_active == 2
+
+            dp.release.set()
+            await scheduler.drain(timeout=5)
+            assert sorted(dp.seen) == [1, 2, 3]
+        finally:
+            await runner.cleanup()
+            await bot.session.close()
+
+    asyncio.run(scenario())
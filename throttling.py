@@ -0,0 +1,108 @@
+# throttling.py – ограничение частоты запросов пользователя и параллелизма тяжёлых хендлеров
+import asyncio
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message
+
+THROTTLED_TEXT = "⏳ Слишком часто! Подождите пару секунд и попробуйте снова."
+BUSY_TEXT = "⏳ Сейчас слишком много запросов, попробуйте через минуту."
+
+
+def is_expensive(name: str) -> bool:
+    """Хендлеры, которые подбирают сборку или пишут в БД на каждом шаге."""
+    return name == "on_enter_budget" or name.startswith("manual_")
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Корзина жетонов на пользователя и общий лимит тяжёлых хендлеров.
+
+    Каждый апдейт тратит жетон (тяжёлый – expensive_cost), жетоны
+    копятся со скоростью rate в секунду до burst. Без жетонов – сразу
+    ответ «слишком часто» (в сообщении – один раз до следующего успеха).
+    Тяжёлые хендлеры выполняются не больше concurrency одновременно; кто
+    не дождался слота за wait секунд, получает ответ «занято».
+
+    Состояние пользователя – [жетоны, время, предупреждён]; корзина,
+    простоявшая burst / rate секунд, снова полна и удаляется при
+    периодической чистке, так что память растёт только с числом активных.
+    """
+
+    def __init__(self, rate: float = 2.0, burst: int = 20, expensive_cost: int = 2, concurrency: int = 16,
+                 wait: float = 5.0, metrics=None, expensive=is_expensive, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.expensive_cost = expensive_cost
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.wait = wait
+        self.metrics = metrics
+        self.expensive = expensive
+        self.clock = clock
+        self.buckets = {}  # user_id -> [жетоны, время последнего пересчёта, предупреждён]
+        self.idle = burst / rate
+        self._next_sweep = clock() + self.idle
+        self.throttled = 0
+        self.busy = 0
+
+    async def __call__(self, handler, event, data):
+        target = data.get("handler")
+        name = getattr(target.callback, "__name__", "unknown") if target else "unknown"
+        expensive = self.expensive(name)
+        user = data.get("event_from_user")
+        if user is not None:
+            state = self._take(user.id, self.expensive_cost if expensive else 1)
+            if state is not None:
+                self.throttled += 1
+                warn = not state[2]
+                state[2] = True
+                return await self._reject(event, name, "user", THROTTLED_TEXT, warn)
+        if not expensive:
+            return await handler(event, data)
+        if self.semaphore.locked():
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), self.wait)
+            except asyncio.TimeoutError:
+                self.busy += 1
+                return await self._reject(event, name, "global", BUSY_TEXT, True)
+        else:
+            await self.semaphore.acquire()
+        try:
+            return await handler(event, data)
+        finally:
+            self.semaphore.release()
+
+    def _take(self, user_id: int, cost: int):
+        """Списать cost жетонов; None – списано, иначе состояние отказавшей корзины."""
+        now = self.clock()
+        if now >= self._next_sweep:
+            self._sweep(now)
+        state = self.buckets.get(user_id)
+        if state is None:
+            state = self.buckets[user_id] = [float(self.burst), now, False]
+        else:
+            state[0] = min(self.burst, state[0] + (now - state[1]) * self.rate)
+            state[1] = now
+        if state[0] < cost:
+            return state
+        state[0] -= cost
+        state[2] = False
+        return None
+
+    def _sweep(self, now: float):
+        """Удалить корзины, которые успели наполниться: они не отличаются от новых."""
+        horizon = now - self.idle
+        for user_id in [u for u, state in self.buckets.items() if state[1] <= horizon]:
+            del self.buckets[user_id]
+        self._next_sweep = now + self.idle
+
+    async def _reject(self, event, name: str, reason: str, text: str, notify: bool):
+        if self.metrics:
+            self.metrics.throttled.inc(reason, name)
+        if isinstance(event, CallbackQuery):
+            # На нажатие кнопки нужно ответить всегда, иначе у клиента крутятся часики
+            await event.answer(text)
+        elif isinstance(event, Message) and notify:
+            await event.answer(text)
+
+    def stats(self) -> dict:
+        return {"buckets": len(self.buckets), "throttled": self.throttled, "busy": self.busy}
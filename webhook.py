@@ -0,0 +1,216 @@
+# webhook.py – приём апдейтов через webhook (aiohttp) с ограничением параллелизма
+#
+# Апдейт подтверждается ответом 200 сразу после разбора, обработка идёт в
+# фоне: апдейты одного пользователя – строго по очереди, разных – параллельно,
+# не больше concurrency одновременно на процесс. Проверить локально можно,
+# отправив записанные апдейты (по одному JSON на строку) на свой сервер:
+#
+#   WEBHOOK_PORT=8080 python bot.py
+#   python webhook.py updates.jsonl --url http://127.0.0.1:8080/webhook
+import argparse
+import asyncio
+import json
+import time
+
+from aiogram.types import Update
+
+# Заголовок, в котором Telegram присылает secret_token из setWebhook
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def update_owner(update: Update):
+    """Чьи апдейты нужно обрабатывать по порядку: id пользователя, иначе чата."""
+    try:
+        event = update.event
+    except Exception:  # тип апдейта, неизвестный этой версии aiogram
+        return None
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(event, "chat", None)
+    return ("chat", chat.id) if chat is not None else None
+
+
+class UpdateScheduler:
+    """Фоновая обработка апдейтов с порядком внутри пользователя.
+
+    Для каждого пользователя хранится последняя поставленная задача;
+    новая сначала дожидается её, затем занимает слот семафора, так что
+    очередь одного пользователя не держит слоты. Всего в работе и в
+    ожидании – не больше max_pending апдейтов: сверх этого submit()
+    возвращает False, и Telegram повторит доставку позже. Ошибки обработки
+    считаются в metrics (Metrics.update_errors), без метрик – печатаются.
+    """
+
+    def __init__(self, dp, bot, concurrency: int = 100, max_pending: int = 10000, metrics=None):
+        self.dp = dp
+        self.bot = bot
+        self.metrics = metrics
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_pending = max_pending
+        self.tails = {}        # владелец -> последняя задача его очереди
+        self.tasks = set()
+        self.running = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, update: Update) -> bool:
+        if len(self.tasks) >= self.max_pending:
+            self.rejected += 1
+            return False
+        owner = update_owner(update)
+        previous = self.tails.get(owner) if owner is not None else None
+        task = asyncio.create_task(self._process(update, previous))
+        self.tasks.add(task)
+        if owner is not None:
+            self.tails[owner] = task
+        task.add_done_callback(lambda t: self._done(owner, t))
+        return True
+
+    async def _process(self, update: Update, previous):
+        if previous is not None:
+            # Ошибка предыдущего апдейта не должна останавливать очередь
+            await asyncio.wait({previous})
+        async with self.semaphore:
+            self.running += 1
+            try:
+                await self.dp.feed_update(self.bot, update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                if self.metrics:
+                    self.metrics.update_errors.inc(type(e).__name__)
+                else:
+                    print(f"Update {update.update_id} failed: {e!r}")
+            finally:
+                self.running -= 1
+
+    def _done(self, owner, task):
+        self.tasks.discard(task)
+        if owner is not None and self.tails.get(owner) is task:
+            del self.tails[owner]
+
+    async def drain(self, timeout: float = 30):
+        """Дождаться обработки принятых апдейтов (при остановке)."""
+        if self.tasks:
+            await asyncio.wait(set(self.tasks), timeout=timeout)
+
+    def stats(self) -> dict:
+        return {"pending": len(self.tasks), "running": self.running, "processed": self.processed,
+                "failed": self.failed, "rejected": self.rejected}
+
+
+async def serve(dp, bot, scheduler: UpdateScheduler, host: str, port: int, path: str, secret: str = ""):
+    """Поднять сервер webhook; возвращает runner для остановки."""
+    from aiohttp import web  # ставится вместе с aiogram
+
+    async def handle(request):
+        if secret and request.headers.get(SECRET_HEADER) != secret:
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": bot})
+        except ValueError:
+            return web.Response(status=400)
+        # Переполнение – не 200: Telegram доставит апдейт повторно
+        return web.Response(status=200 if scheduler.submit(update) else 503)
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Webhook listening on http://{host}:{port}{path}")
+    return runner
+
+
+async def run_webhook(dp, bot, host: str, port: int, path: str, url: str = "", secret: str = "",
+                      concurrency: int = 100, max_pending: int = 10000, on_scheduler=None, metrics=None):
+    """Режим webhook вместо polling: работает до отмены задачи.
+
+    url – публичный адрес для setWebhook (пусто – не регистрировать,
+    например для локальной проверки); on_scheduler(scheduler) вызывается
+    после создания планировщика (для метрик), metrics – куда считать
+    ошибки обработки апдейтов.
+    """
+    scheduler = UpdateScheduler(dp, bot, concurrency, max_pending, metrics)
+    if on_scheduler:
+        on_scheduler(scheduler)
+    await dp.emit_startup(bot=bot, dispatcher=dp, bots=[bot])
+    runner = await serve(dp, bot, scheduler, host, port, path, secret)
+    if url:
+        await bot.set_webhook(url.rstrip("/") + path, secret_token=secret or None,
+                              allowed_updates=dp.resolve_used_update_types(), max_connections=100)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await scheduler.drain()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, bots=[bot])
+        print(f"Webhook stopped: {scheduler.stats()}")
+
+
+def _raw_owner(line: str):
+    """Отправитель записанного апдейта без разбора в модели aiogram."""
+    try:
+        raw = json.loads(line)
+    except ValueError:
+        return None  # битая строка уходит как есть – сервер ответит 400
+    if not isinstance(raw, dict):
+        return None
+    for value in raw.values():
+        if isinstance(value, dict) and isinstance(value.get("from"), dict):
+            return value["from"].get("id")
+    return None
+
+
+async def replay(path: str, url: str, secret: str = "", concurrency: int = 50) -> dict:
+    """Отправить записанные апдейты (JSON на строку) на webhook и замерить подтверждения.
+
+    Апдейты одного пользователя уходят по очереди, как их шлёт Telegram,
+    разных пользователей – параллельно, не больше concurrency запросов сразу.
+    """
+    from aiohttp import ClientSession
+
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers[SECRET_HEADER] = secret
+    queues = {}
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f):
+            if line.strip():
+                queues.setdefault(_raw_owner(line) or ("line", n), []).append(line.strip())
+    statuses = {}
+    latencies = []
+    limit = asyncio.Semaphore(concurrency)
+
+    async def send(session, bodies):
+        for body in bodies:
+            async with limit:
+                start = time.perf_counter()
+                async with session.post(url, data=body, headers=headers) as r:
+                    statuses[r.status] = statuses.get(r.status, 0) + 1
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(*(send(session, bodies) for bodies in queues.values()))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {"updates": len(latencies), "statuses": statuses, "elapsed_s": round(elapsed, 3),
+            "ack_p50_ms": round(latencies[len(latencies) // 2] * 1000, 3) if latencies else None,
+            "ack_max_ms": round(latencies[-1] * 1000, 3) if latencies else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="POST recorded updates (one JSON per line) to a bot webhook.")
+    parser.add_argument("path", help="file with recorded updates")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default="", help="secret token, if the bot checks it")
+    parser.add_argument("--concurrency", type=int, default=50, help="requests in flight")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(replay(args.path, args.url, args.secret, args.concurrency)), indent=2))
+
+
+if __name__ == "__main__":
+    main()